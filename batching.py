@@ -0,0 +1,110 @@
+"""
+Coalescing of single requests into batches
+------------------------------------------
+Callers hand an item to a batcher and block until its result is ready.
+A single background thread collects the items that arrive within a short
+window (or until a maximum batch size is reached) and handles them all
+with one request, so many threads each asking for one thing cost one
+round trip instead of one each. Every caller gets back its own result.
+
+This module stands on its own so both sides can use it: the service's
+write-behind queue stores documents with one bulk request, and the
+client's LookupBatcher looks Suppliers up with one multi-get. It must
+not import either of them.
+"""
+
+import time
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+class Batcher(object):
+    """
+    Groups the items submitted within a window into batches
+
+    :param handle: a callable that takes a list of items and returns the
+        result of each, in the same order
+    :param window: how long, in seconds, to wait for more items after the
+        first one arrives
+    :param max_items: the largest number of items handled at once
+    :param name: the name of the background thread
+    :param key: a callable that returns the key of an item; items with the
+        same key share one result, by default none do
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, handle, window, max_items, name='batcher', key=None):
+        self.handle = handle
+        self.window = window
+        self.max_items = max_items
+        self._keys = itertools.count()
+        self._key = key or (lambda item: next(self._keys))
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+
+    def submit(self, item):
+        """ Queues an item and returns a Future for its result """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('{} is closed'.format(self._thread.name))
+            key = self._key(item)
+            queued = self._pending.get(key)
+            if queued is None:
+                queued = self._pending[key] = (item, Future())
+                self._condition.notify()
+        return queued[1]
+
+
+    def close(self):
+        """ Handles any queued items and stops the background thread """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+
+    def _next_batch(self):
+        """ Waits for the next group of items to handle """
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_items and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            keys = list(itertools.islice(self._pending, self.max_items))
+            return [self._pending.pop(key) for key in keys]
+
+
+    def _run(self):
+        """ Background loop that handles one batch at a time """
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._handle(batch)
+
+
+    def _handle(self, batch):
+        """ Handles a batch and hands every caller its own result """
+        try:
+            results = self.handle([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError('batch of {} items returned {} results'
+                                   .format(len(batch), len(results)))
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.info('Batch of %d items failed: %s', len(batch), error)
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
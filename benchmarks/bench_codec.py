@@ -0,0 +1,58 @@
+"""
+Benchmark of the JSON codecs used by the Supplier service
+
+Encodes and decodes a list response of suppliers with large product
+arrays, the payload of GET /suppliers, with every codec available.
+Run it from the project root with:
+    python -m benchmarks.bench_codec [--suppliers N] [--products N]
+"""
+
+import sys
+import random
+import timeit
+import argparse
+from service.codec import StdlibCodec, OrjsonCodec, orjson
+
+
+def make_suppliers(count, products):
+    """ Builds a list response like the one GET /suppliers returns """
+    return [{
+        '_id': '{:032x}'.format(random.getrandbits(128)),
+        '_rev': '1-{:032x}'.format(random.getrandbits(128)),
+        'name': 'supplier{}'.format(number),
+        'like_count': random.randint(0, 1000),
+        'is_active': random.random() < 0.8,
+        'products': random.sample(range(1000000), products),
+        'rating': round(random.uniform(0, 10), 1)
+    } for number in range(count)]
+
+
+def bench(codec, payload, repeat):
+    """ Returns the best encode and decode times in milliseconds """
+    encoded = codec.dumps(payload)
+    encode = min(timeit.repeat(lambda: codec.dumps(payload), number=1, repeat=repeat))
+    decode = min(timeit.repeat(lambda: codec.loads(encoded), number=1, repeat=repeat))
+    return encode * 1000, decode * 1000, len(encoded)
+
+
+def main(argv=None):
+    """ Runs the benchmark and prints one line per codec """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--suppliers', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    payload = make_suppliers(args.suppliers, args.products)
+    codecs = [StdlibCodec] + ([OrjsonCodec] if orjson else [])
+    print('{} suppliers x {} products'.format(args.suppliers, args.products))
+    print('{:8} {:>12} {:>12} {:>12}'.format('codec', 'encode ms', 'decode ms', 'bytes'))
+    for codec in codecs:
+        encode, decode, size = bench(codec, payload, args.repeat)
+        print('{:8} {:12.1f} {:12.1f} {:12d}'.format(codec.name, encode, decode, size))
+    if not orjson:
+        print('orjson is not installed, only the stdlib codec was measured')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Benchmark of product membership tests on large catalogs
+
+Compares ``product_id in products`` on the list a Supplier is stored with
+against the ProductSet the model keeps for it, for suppliers with 10k
+products each. Run it from the project root with:
+    python -m benchmarks.bench_products [--products N] [--lookups N]
+"""
+
+import sys
+import random
+import timeit
+import argparse
+from service.products import ProductSet
+
+
+def main(argv=None):
+    """ Runs the benchmark and prints the time per lookup and the memory used """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=10000)
+    parser.add_argument('--wanted', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    products = random.sample(range(10 * args.products), args.products)
+    product_set = ProductSet(products)
+    lookups = [random.randrange(10 * args.products) for _ in range(args.lookups)]
+    wanted = lookups[:args.wanted]
+
+    def per_lookup(function, count):
+        return min(timeit.repeat(function, number=1, repeat=5)) / count * 1e6
+
+    list_in = per_lookup(lambda: [p in products for p in lookups], len(lookups))
+    set_in = per_lookup(lambda: [p in product_set for p in lookups], len(lookups))
+    list_and = per_lookup(lambda: set(wanted).intersection(products), 1)
+    set_and = per_lookup(lambda: product_set.intersection(wanted), 1)
+    list_bytes = sys.getsizeof(products) + sum(sys.getsizeof(p) for p in products)
+    set_bytes = sys.getsizeof(product_set._ids)  # pylint: disable=protected-access
+
+    print('{} products per supplier'.format(args.products))
+    print('{:28} {:>12} {:>12}'.format('', 'list', 'ProductSet'))
+    print('{:28} {:12.2f} {:12.2f}'.format('membership (us per lookup)', list_in, set_in))
+    print('{:28} {:12.2f} {:12.2f}'.format('intersect {} ids (us)'.format(args.wanted),
+                                           list_and, set_and))
+    print('{:28} {:12d} {:12d}'.format('memory (bytes)', list_bytes, set_bytes))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
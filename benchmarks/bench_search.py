@@ -0,0 +1,61 @@
+"""
+Benchmark of the in-process name search index
+
+Builds a NameIndex over generated supplier names and times prefix,
+substring and fuzzy lookups. Run it from the project root with:
+    python -m benchmarks.bench_search [--names N] [--lookups N]
+"""
+
+import sys
+import time
+import random
+import string
+import argparse
+from service.search import NameIndex
+
+WORDS = ['acme', 'global', 'supply', 'trading', 'foods', 'parts', 'north', 'south', 'metro',
+         'united', 'pacific', 'atlantic', 'green', 'valley', 'industrial', 'wholesale', 'best',
+         'direct', 'prime', 'central', 'import', 'export', 'fresh', 'farm', 'tech', 'works']
+
+
+def make_name():
+    """ Returns a plausible supplier name """
+    words = random.sample(WORDS, random.randint(1, 3))
+    suffix = ''.join(random.choice(string.ascii_lowercase) for _ in range(4))
+    return ' '.join(words + [suffix]).title()
+
+
+def typo(name):
+    """ Swaps two neighbouring letters of a name """
+    position = random.randrange(len(name) - 1)
+    return name[:position] + name[position + 1] + name[position] + name[position + 2:]
+
+
+def main(argv=None):
+    """ Runs the benchmark and prints the mean time per lookup """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--names', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    names = [make_name() for _ in range(args.names)]
+    start = time.perf_counter()
+    index = NameIndex(enumerate(names))
+    print('built index of {} names in {:.2f} s'.format(args.names, time.perf_counter() - start))
+
+    samples = random.sample(names, args.lookups)
+    queries = [
+        ('prefix', index.prefix, [name[:random.randint(2, 6)] for name in samples]),
+        ('contains', index.contains, [name[-6:] for name in samples]),
+        ('similar', index.similar, [typo(name) for name in samples]),
+    ]
+    for label, lookup, texts in queries:
+        start = time.perf_counter()
+        for text in texts:
+            lookup(text, 20)
+        elapsed = (time.perf_counter() - start) / len(texts) * 1000
+        print('{:10} {:8.3f} ms per lookup'.format(label, elapsed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Benchmark of the warm-start snapshot
+
+Writes generated supplier documents as a snapshot and as JSON, then
+times reading each back. Run it from the project root with:
+    python -m benchmarks.bench_snapshot [--suppliers N] [--products N]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from service import snapshot
+
+
+def make_documents(count, products):
+    """ Returns supplier documents shaped like the ones in the database """
+    return [{
+        '_id': '{:032x}'.format(random.getrandbits(128)),
+        '_rev': '1-{:032x}'.format(random.getrandbits(128)),
+        'name': 'Supplier {}'.format(index),
+        'like_count': random.randint(0, 1000),
+        'is_active': random.random() < 0.8,
+        'products': random.sample(range(100000), products),
+        'rating': round(random.uniform(0, 10), 1)
+    } for index in range(count)]
+
+
+def main(argv=None):
+    """ Runs the benchmark and prints the time to read each format """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--suppliers', type=int, default=100000)
+    parser.add_argument('--products', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    documents = make_documents(args.suppliers, args.products)
+    directory = tempfile.mkdtemp()
+    snapshot_path = os.path.join(directory, 'suppliers.snapshot')
+    json_path = os.path.join(directory, 'suppliers.json')
+    try:
+        snapshot.write(snapshot_path, '1-seq', 'db', documents)
+        with open(json_path, 'w') as output:
+            json.dump(documents, output)
+
+        start = time.perf_counter()
+        snapshot.read(snapshot_path)
+        snapshot_time = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(json_path) as source:
+            json.load(source)
+        json_time = time.perf_counter() - start
+
+        print('{} suppliers of {} products'.format(args.suppliers, args.products))
+        print('snapshot {:8.3f} s {:8d} kB'.format(snapshot_time,
+                                                   os.path.getsize(snapshot_path) // 1024))
+        print('json     {:8.3f} s {:8d} kB'.format(json_time, os.path.getsize(json_path) // 1024))
+    finally:
+        for path in (snapshot_path, json_path):
+            os.remove(path)
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Replay of captured Supplier traffic
+
+Sends the requests of a capture (see service/capture.py) to a running
+service, at the pace they were captured or faster or slower, and reports
+the latency of each route against the capture, or against the report of
+an earlier replay. Run a candidate build against a local CouchDB (the one
+the Vagrantfile starts will do), then from the project root:
+    python -m benchmarks.replay capture.log [--target URL] [--speed N]
+        [--threads N] [--output report.json] [--baseline report.json]
+
+Suppliers are first created for every pseudonymous id in the capture, so
+point reads, updates and likes of a captured id find a Supplier. A speed
+of 2 replays twice as fast as captured, 0 sends every request as soon as
+a thread is free.
+
+The processes of a deployment capture alike, each with wall clock times,
+so their captures can be concatenated; the replay starts at the earliest.
+The latency of a paced replay is measured from when a request was due,
+not when it was sent, so the time it waited for a free thread counts, as
+it would for the client that sent it. At speed 0 nothing is due, and the
+latency is measured from when a thread sends the request.
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+ID_MARK = '~'
+SEED_BATCH = 1000
+
+
+def read_capture(path):
+    """ Returns the entries of a capture in the order they were captured """
+    with open(path, encoding='utf8') as capture:
+        entries = [json.loads(line) for line in capture if line.strip()]
+    return sorted(entries, key=lambda entry: entry['t'])
+
+
+def _ids_of(value, found):
+    if isinstance(value, str):
+        if value.startswith(ID_MARK):
+            found.add(value)
+    elif isinstance(value, list):
+        for item in value:
+            _ids_of(item, found)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _ids_of(item, found)
+
+
+def pseudonymous_ids(entries):
+    """ Returns every pseudonymous supplier id in the entries """
+    found = set()
+    for entry in entries:
+        _ids_of(entry['p'].split('/'), found)
+        for name, value in entry['q']:
+            if name == 'ids':
+                _ids_of(value.split(','), found)
+        _ids_of(entry.get('b'), found)
+    return found
+
+
+def seed(session, target, ids):
+    """ Creates a Supplier for each pseudonymous id
+
+    :return: a dictionary of pseudonymous id -> the id of the Supplier created for it
+    """
+    ids = sorted(ids)
+    mapping = {}
+    for start in range(0, len(ids), SEED_BATCH):
+        batch = ids[start:start + SEED_BATCH]
+        resp = session.post(target + '/suppliers/_bulk', json=[
+            {'name': pseudonym[1:], 'like_count': 0, 'is_active': True,
+             'products': [1, 2, 3], 'rating': 3.0} for pseudonym in batch])
+        resp.raise_for_status()
+        for pseudonym, supplier in zip(batch, resp.json()):
+            mapping[pseudonym] = supplier['_id']
+    return mapping
+
+
+def _map_ids(value, mapping):
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, list):
+        return [_map_ids(item, mapping) for item in value]
+    if isinstance(value, dict):
+        return {key: _map_ids(item, mapping) for key, item in value.items()
+                if key not in ('_id', '_rev')}
+    return value
+
+
+def build_request(entry, mapping):
+    """ Returns the method, path, query and body to send for an entry """
+    path = '/'.join(mapping.get(part, part) for part in entry['p'].split('/'))
+    query = [(name, ','.join(mapping.get(item, item) for item in value.split(','))
+              if name == 'ids' else value) for name, value in entry['q']]
+    return entry['m'], path, query, _map_ids(entry.get('b'), mapping)
+
+
+def schedule(entries, speed):
+    """ Returns the seconds after the start of the replay each entry is due at """
+    if not entries or not speed:
+        return [0.0] * len(entries)
+    first = entries[0]['t']
+    return [(entry['t'] - first) / speed for entry in entries]
+
+
+def replay(entries, target, speed=1.0, threads=16):
+    """ Sends the entries to the target at speed times their captured pace
+
+    :return: a list of (route, captured ms, replayed ms, captured status, replayed status)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=threads, pool_maxsize=threads)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    mapping = seed(session, target, pseudonymous_ids(entries))
+    results = []
+    lock = threading.Lock()
+
+    def send(entry, due):
+        method, path, query, body = build_request(entry, mapping)
+        if due is None:
+            due = time.monotonic()
+        try:
+            status = session.request(method, target + path, params=query, json=body).status_code
+        except requests.RequestException:
+            status = 0
+        elapsed = (time.monotonic() - due) * 1000
+        with lock:
+            results.append(('{} {}'.format(entry['m'], entry['r']), entry['d'], elapsed,
+                            entry['s'], status))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(threads) as pool:
+        for entry, offset in zip(entries, schedule(entries, speed)):
+            due = started + offset if speed else None
+            wait = due - time.monotonic() if speed else 0
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(send, entry, due)
+    return results
+
+
+def percentile(values, share):
+    """ Returns the value below which a share of the sorted values fall """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def summarize(results):
+    """ Returns a dictionary of route -> latency percentiles and status mismatches """
+    routes = defaultdict(list)
+    for result in results:
+        routes[result[0]].append(result)
+    report = {}
+    for route, rows in sorted(routes.items()):
+        captured = sorted(row[1] for row in rows)
+        replayed = sorted(row[2] for row in rows)
+        report[route] = {
+            'count': len(rows),
+            'captured_p50': round(percentile(captured, 0.5), 3),
+            'captured_p95': round(percentile(captured, 0.95), 3),
+            'p50': round(percentile(replayed, 0.5), 3),
+            'p95': round(percentile(replayed, 0.95), 3),
+            'status_mismatches': sum(1 for row in rows if row[3] != row[4])
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    """ Prints the latency of each route and its delta from the baseline or the capture """
+    print('{:<48} {:>7} {:>10} {:>10} {:>10} {:>10} {:>9}'.format(
+        'route', 'count', 'p50 ms', 'delta', 'p95 ms', 'delta', 'status!='))
+    for route, row in report.items():
+        before = (baseline or {}).get(route)
+        if baseline is None:
+            before = {'p50': row['captured_p50'], 'p95': row['captured_p95']}
+        deltas = ['{:+10.3f}'.format(row[name] - before[name]) if before else '{:>10}'.format('-')
+                  for name in ('p50', 'p95')]
+        print('{:<48} {:>7} {:>10.3f} {} {:>10.3f} {} {:>9}'.format(
+            route, row['count'], row['p50'], deltas[0], row['p95'], deltas[1],
+            row['status_mismatches']))
+
+
+def main(argv=None):
+    """ Replays a capture and reports the latency of each route """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('capture', help='capture file written with CAPTURE_PATH')
+    parser.add_argument('--target', default='http://localhost:5000', help='service to replay to')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='pace against the capture, 0 for as fast as possible')
+    parser.add_argument('--threads', type=int, default=16, help='requests sent at once at most')
+    parser.add_argument('--output', help='file to write the report to, as JSON')
+    parser.add_argument('--baseline', help='report of an earlier replay to compare with')
+    args = parser.parse_args(argv)
+
+    entries = read_capture(args.capture)
+    print('Replaying {} requests to {} at speed {}'.format(len(entries), args.target, args.speed))
+    report = summarize(replay(entries, args.target.rstrip('/'), args.speed, args.threads))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as previous:
+            baseline = json.load(previous)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
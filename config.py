@@ -1,3 +1,123 @@
+import os
 import logging
 SECRET_KEY = 'secret-for-dev'
 LOGGING_LEVEL = logging.INFO
+
+# Largest number of ids accepted by a single multi-get request
+MGET_MAX_IDS = 1000
+
+# Largest number of products accepted by a single batch recommendation
+RECOMMEND_MAX_PRODUCTS = 100
+
+# Response compression: only bodies of these types and at least this size are compressed
+COMPRESS_MIMETYPES = ['application/json', 'text/html', 'text/css', 'text/plain',
+                      'application/javascript']
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+COMPRESS_BR_LEVEL = 4
+
+# Largest request body accepted once a compressed body is inflated
+DECOMPRESS_MAX_SIZE = 64 * 1024 * 1024
+
+# Largest number of suppliers accepted by a single bulk create
+BULK_MAX_DOCS = 1000
+
+# The in-process name index behind name_contains and name_like is rebuilt
+# from the database when it is older than this many seconds
+NAME_INDEX_TTL = 60
+
+# Number of suppliers returned by a name search when no limit is given
+NAME_SEARCH_LIMIT = 20
+
+# Change stream: changes kept in memory for subscribers that resume with a
+# since token, seconds between keep-alive comments and seconds a stream is
+# kept open before the client is asked to reconnect
+CHANGES_BUFFER_SIZE = 1000
+CHANGES_HEARTBEAT = 15
+CHANGES_STREAM_SECONDS = 300
+CHANGES_POLL_TIMEOUT = 30
+
+# Snapshot of every supplier the service starts from and saves to every
+# SNAPSHOT_INTERVAL seconds, none when SNAPSHOT_PATH is empty
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', '')
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 60))
+
+# Every supplier held in memory by each process, kept current with the
+# _changes feed, to list them without reading the database. Off unless
+# SUPPLIER_CACHE is true or a SNAPSHOT_PATH is set, as it has no size limit.
+SUPPLIER_CACHE = os.environ.get('SUPPLIER_CACHE', 'False').lower() == 'true' \
+    or bool(SNAPSHOT_PATH)
+
+# Seconds a request may take, unless it asks for less or more (up to
+# REQUEST_TIMEOUT_MAX) with an X-Request-Timeout header. Database calls
+# get what is left as their socket timeout and retries stop before it.
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 10))
+REQUEST_TIMEOUT_MAX = float(os.environ.get('REQUEST_TIMEOUT_MAX', 60))
+
+# Admission control: requests in flight per process (0 admits everything)
+# and the share of it each route class may use, so expensive routes are
+# refused with a 503 first as load grows. Routes are "METHOD rule" or just
+# the rule; the ones not listed are "normal", "exempt" ones are never counted.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 64))
+ADMISSION_SHARES = {'cheap': 1.0, 'normal': 0.75, 'expensive': 0.5}
+ADMISSION_RETRY_AFTER = 1
+ADMISSION_ROUTES = {
+    '/': 'exempt',
+    '/healthcheck': 'exempt',
+    '/metrics': 'exempt',
+    '/apidocs': 'exempt',
+    '/swagger.json': 'exempt',
+    '/static/<path:filename>': 'exempt',
+    '/swaggerui/<path:filename>': 'exempt',
+    '/suppliers/changes': 'exempt',
+    'GET /suppliers': 'expensive',
+    '/suppliers/<product_id>/recommend': 'expensive',
+    '/suppliers/recommend': 'expensive',
+    '/suppliers/_bulk': 'expensive',
+    'GET /suppliers/<supplier_id>': 'cheap',
+    'PATCH /suppliers/<supplier_id>': 'cheap',
+    '/suppliers/<supplier_id>/like': 'cheap',
+}
+# Routes whose class depends on the query: the first argument given, in
+# the order the view looks at them, picks the class, and a request with
+# none of them gets the class of its route. Only the full list, ranges and
+# product lookups of GET /suppliers scan, ids and name prefixes are cheap.
+ADMISSION_QUERIES = {
+    'GET /suppliers': [
+        ('ids', 'cheap'),
+        ('name', 'normal'),
+        ('name_prefix', 'cheap'),
+        ('name_contains', 'normal'),
+        ('name_like', 'normal'),
+        ('like_count', 'expensive'),
+        ('rating_min', 'expensive'),
+        ('rating_max', 'expensive'),
+        ('like_min', 'expensive'),
+        ('like_max', 'expensive'),
+        ('is_active', 'normal'),
+        ('rating', 'expensive'),
+        ('product_id', 'expensive'),
+        ('partition', 'normal'),
+    ],
+}
+
+# Traffic capture for replay (benchmarks/replay.py): requests to supplier
+# routes are appended, anonymized, to CAPTURE_PATH when it is set. The
+# pseudonyms are keyed with CAPTURE_KEY, random per process if it is empty.
+CAPTURE_PATH = os.environ.get('CAPTURE_PATH', '')
+CAPTURE_KEY = os.environ.get('CAPTURE_KEY', '')
+CAPTURE_MAX_BODY = 64 * 1024
+CAPTURE_EXCLUDE = ['/suppliers/changes']
+
+# Requests sent with X-Profile: 1 and the API key in X-Api-Key are run
+# under cProfile; the latest PROFILE_KEEP pstats files are kept here
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/supplier-profiles')
+PROFILE_KEEP = 50
+
+# Index of every supplier shared by the workers through a memory mapped
+# file, none when SHARED_INDEX_PATH is empty. One worker rewrites it every
+# SHARED_INDEX_INTERVAL seconds the database changed; the list, the product
+# query and recommend answered from it may lag the database by that. Reads
+# of one supplier by id always go to the database.
+SHARED_INDEX_PATH = os.environ.get('SHARED_INDEX_PATH', '')
+SHARED_INDEX_INTERVAL = float(os.environ.get('SHARED_INDEX_INTERVAL', 1))
@@ -1,9 +1,15 @@
 """
 Environment for Behave Testing
 """
+import os
+import sys
 from os import getenv
 from selenium import webdriver
 
+# the client package is at the root of the project, which behave does not put on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from suppliers import SupplierClient  # pylint: disable=wrong-import-position
+
 WAIT_SECONDS = int(getenv('WAIT_SECONDS', '60'))
 BASE_URL = getenv('BASE_URL', 'http://localhost:5000')
 
@@ -22,6 +28,7 @@ def before_all(context):
     # context.driver.set_window_size(1200, 600)
 
     context.base_url = BASE_URL
+    context.client = SupplierClient(BASE_URL)
     # -- SET LOG LEVEL: behave --logging-level=ERROR ...
     # on behave command-line or in "behave.ini"
     context.config.setup_logging()
@@ -29,4 +36,5 @@ def before_all(context):
 
 def after_all(context):
     """ Executed after all tests """
+    context.client.close()
     context.driver.quit()
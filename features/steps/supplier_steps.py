@@ -7,8 +7,6 @@ Steps file for suppliers.feature
 
 from os import getenv
 import logging
-import json
-import requests
 from behave import *
 from compare import expect, ensure
 from selenium.webdriver.common.by import By
@@ -23,28 +21,23 @@ ID_PREFIX = 'supplier_'
 @given('the following suppliers')
 def step_impl(context):
     """ Delete all Suppliers and load new ones """
-    headers = {'Content-Type': 'application/json'}
     # list all of the suppliers and delete them one by one
-    context.resp = requests.get(context.base_url + '/suppliers', headers=headers)
-    expect(context.resp.status_code).to_equal(200)
-    for supplier in context.resp.json():
-        context.resp = requests.delete(context.base_url + '/suppliers/' + str(supplier["_id"]), headers=headers)
-        expect(context.resp.status_code).to_equal(204)
-
-    # load the database with new suppliers
-    create_url = context.base_url + '/suppliers'
+    for supplier in context.client.list():
+        context.client.delete(supplier["_id"])
+
+    # load the database with new suppliers in one bulk call
+    suppliers = []
     for row in context.table:
         products = [int(product) for product in row['products'].split(",")]
-        data = {
+        suppliers.append({
             "name": row['name'],
             "like_count": int(row['like_count']),
             "is_active": row['is_active'] in ['True', 'true', '1'],
             "products": products,
             "rating": float(row['rating'])
-        }
-        payload = json.dumps(data)
-        context.resp = requests.post(create_url, data=payload, headers=headers)
-        expect(context.resp.status_code).to_equal(201)
+        })
+    for supplier in context.client.create_many(suppliers):
+        expect(supplier.get('error')).to_be(None)
 
 
 @when('I visit the "Home Page"')
@@ -61,8 +54,8 @@ def step_impl(context, message):
 
 @then('I should not see "{message}"')
 def step_impl(context, message):
-    error_msg = "I should not see '%s' in '%s'" % (message, context.resp.text)
-    ensure(message in context.resp.text, False, error_msg)
+    error_msg = "I should not see '%s' in '%s'" % (message, context.driver.page_source)
+    ensure(message in context.driver.page_source, False, error_msg)
 
 @when('I set the "{element_name}" to "{text_string}"')
 def step_impl(context, element_name, text_string):
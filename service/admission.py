@@ -0,0 +1,129 @@
+"""
+Admission control for the Supplier service
+------------------------------------------
+Every request is put in a route class (by its method and URL rule) and
+admitted only while the requests in flight in this process leave room
+for it, or by its query where the route serves cheap and expensive ones.
+Each class may use a share of the capacity: expensive routes like the
+full list and recommend only the first half, cheap point reads all of it. As load grows the expensive routes are refused first, with a
+503 and a Retry-After header, and the cheap ones keep being served.
+
+A request is counted out when its response is closed, after a streamed
+body has been sent, not when the view returns.
+
+Exempt routes, like /healthcheck and the long lived change stream, are
+neither counted nor refused. In-flight requests are per process, so this
+matters with threaded workers (gunicorn --threads, or gthread/gevent).
+"""
+
+import threading
+from flask import g, request, jsonify
+from flask_api import status
+
+EXEMPT = 'exempt'
+DEFAULT_CLASS = 'normal'
+
+
+class AdmissionController(object):
+    """ Admits requests while their route class has room
+
+    :param capacity: the most requests in flight, 0 to admit everything
+    :param shares: route class -> the share of the capacity it may use
+    """
+
+    def __init__(self, capacity, shares):
+        self.capacity = capacity
+        self.shares = shares
+        self._in_flight = 0
+        self._by_class = {name: 0 for name in shares}
+        self._shed = {name: 0 for name in shares}
+        self._lock = threading.Lock()
+
+
+    def admit(self, route_class):
+        """ Counts a request in if there is room for its class
+
+        :return: True if it was admitted and must be released
+        """
+        with self._lock:
+            if self.capacity and self._in_flight >= self.capacity * self.shares[route_class]:
+                self._shed[route_class] += 1
+                return False
+            self._in_flight += 1
+            self._by_class[route_class] += 1
+            return True
+
+
+    def release(self, route_class):
+        """ Counts an admitted request out """
+        with self._lock:
+            self._in_flight -= 1
+            self._by_class[route_class] -= 1
+
+
+    def metrics(self):
+        """ Returns the requests in flight and shed by route class """
+        with self._lock:
+            result = {'http_in_flight': self._in_flight}
+            for name in sorted(self.shares):
+                result['http_in_flight_{}'.format(name)] = self._by_class[name]
+                result['http_shed_{}_total'.format(name)] = self._shed[name]
+            return result
+
+
+def route_class(routes, queries=None):
+    """ Returns the route class of the current request
+
+    :param queries: route -> (query argument, class) pairs; the first argument
+        the request has a value for picks its class
+    """
+    if request.url_rule is None:
+        return EXEMPT
+    route = '{} {}'.format(request.method, request.url_rule.rule)
+    for name, query_class in (queries or {}).get(route, ()):
+        if request.args.get(name):
+            return query_class
+    return routes.get(route, routes.get(request.url_rule.rule, DEFAULT_CLASS))
+
+
+def init_app(app):
+    """ Installs admission control on a Flask app and returns its controller """
+    shares = dict(app.config['ADMISSION_SHARES'])
+    shares.setdefault(DEFAULT_CLASS, 1.0)
+    controller = AdmissionController(app.config['ADMISSION_MAX_IN_FLIGHT'], shares)
+    routes = app.config['ADMISSION_ROUTES']
+    queries = app.config.get('ADMISSION_QUERIES', {})
+
+    @app.before_request
+    def admit_request():  # pylint: disable=unused-variable
+        """ Refuses the request if its route class has no room """
+        name = route_class(routes, queries)
+        if name == EXEMPT:
+            return None
+        if not controller.admit(name):
+            app.logger.warning('Shedding %s %s (%s)', request.method, request.path, name)
+            response = jsonify(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                               error='Service Unavailable',
+                               message='Server is overloaded, retry later')
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            response.headers['Retry-After'] = str(app.config['ADMISSION_RETRY_AFTER'])
+            return response
+        g.admitted_class = name
+        return None
+
+    @app.after_request
+    def release_on_close(response):  # pylint: disable=unused-variable
+        """ Counts an admitted request out once its body has been sent """
+        name = g.pop('admitted_class', None)
+        if name is not None:
+            response.call_on_close(lambda: controller.release(name))
+        return response
+
+    @app.teardown_request
+    def release_request(exception=None):  # pylint: disable=unused-variable,unused-argument
+        """ Counts an admitted request out if it never got to a response """
+        name = g.pop('admitted_class', None)
+        if name is not None:
+            controller.release(name)
+
+    return controller
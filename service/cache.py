@@ -0,0 +1,151 @@
+"""
+In-process cache of every Supplier
+----------------------------------
+SupplierCache holds all the Suppliers of the database in memory and is
+brought up to date before every read with one ``_changes`` request for
+the changes since the sequence it is current to, which is empty and
+cheap most of the time. Queries that used to scan the whole database,
+like the product query and the name index, read it instead.
+
+Only applying changes takes the lock: the ``_changes`` request is made
+outside it, so readers do not queue behind one another's round trip.
+
+With a snapshot path the cache starts from the snapshot file, when it
+belongs to the same database, and only catches up from the sequence
+saved in it. save() writes a new snapshot when the cache has moved on.
+"""
+
+import time
+import logging
+import threading
+from service import snapshot
+from service.models import Supplier, QUERY_PAGE_SIZE
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class SupplierCache(object):
+    """ Every Supplier, kept current with the ``_changes`` feed
+
+    The Suppliers returned are shared by every caller and must not be changed.
+
+    :param path: the snapshot file to start from and save to, or None
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._database = None
+        self._seq = None
+        self._saved_seq = None
+        self._suppliers = {}  # id -> Supplier
+        self._ordered = None  # Suppliers in id order, rebuilt after a change
+        self._thread = None
+
+
+    def suppliers(self):
+        """ Returns every Supplier in id order, as of now """
+        return self.current()[1]
+
+
+    def current(self):
+        """ Returns the sequence the cache is current to and every Supplier in id order """
+        self.refresh()
+        with self._lock:
+            if self._ordered is None:
+                self._ordered = [self._suppliers[key] for key in sorted(self._suppliers)]
+            return self._seq, self._ordered
+
+
+    def refresh(self):
+        """ Loads the cache if it is empty and catches up with the database """
+        database = Supplier.database.database_url
+        with self._lock:
+            if self._database != database:
+                self._load(database)
+            since = self._seq
+        pending = True
+        while pending:
+            changes, seq, pending = Supplier.changes(since, limit=QUERY_PAGE_SIZE)
+            with self._lock:
+                if self._database != database or self._seq != since:
+                    return  # another caller applied these changes, or later ones
+                self._apply(changes, seq)
+            since = seq
+            pending = pending and changes
+
+
+    def _apply(self, changes, seq):
+        for _, change in changes:
+            if change['deleted'] or change['supplier'] is None:
+                self._suppliers.pop(change['id'], None)
+            else:
+                self._suppliers[change['id']] = Supplier.from_document(change['supplier'])
+        if changes:
+            self._ordered = None
+        self._seq = seq
+
+
+    def _load(self, database):
+        start = time.perf_counter()
+        if self.path:
+            try:
+                seq, snapshot_database, documents = snapshot.read(self.path)
+            except snapshot.SnapshotError as error:
+                logger.info('No snapshot to start from: %s', error)
+            else:
+                if snapshot_database == database:
+                    self._reset(database, seq, (Supplier.from_document(document)
+                                                for document in documents))
+                    self._saved_seq = seq
+                    logger.info('Loaded %d suppliers from snapshot at %s in %.3f s',
+                                len(self._suppliers), seq, time.perf_counter() - start)
+                    return
+                logger.info('Snapshot is of %s, not %s', snapshot_database, database)
+        # the sequence is taken first, changes made during the scan are caught up after it,
+        # both from the primary so no change between them is missed
+        _, seq, _ = Supplier.changes('now')
+        self._reset(database, seq, Supplier.iterate())
+        logger.info('Loaded %d suppliers from the database in %.3f s',
+                    len(self._suppliers), time.perf_counter() - start)
+
+
+    def _reset(self, database, seq, suppliers):
+        self._database = database
+        self._seq = seq
+        self._suppliers = {supplier.id: supplier for supplier in suppliers}
+        self._ordered = None
+
+
+    def save(self):
+        """ Writes a snapshot if the cache changed since the last one
+
+        :return: True if a snapshot was written
+        """
+        with self._lock:
+            if not self.path or self._database is None or self._seq == self._saved_seq:
+                return False
+            seq, database = self._seq, self._database
+            documents = [supplier.serialize() for supplier in self._suppliers.values()]
+        snapshot.write(self.path, seq, database, documents)
+        self._saved_seq = seq
+        logger.info('Saved snapshot of %d suppliers at %s', len(documents), seq)
+        return True
+
+
+    def start_saving(self, interval):
+        """ Catches up and saves a snapshot every interval seconds from a background thread """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,),
+                                            name='snapshot', daemon=True)
+            self._thread.start()
+
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+                self.save()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Saving the snapshot failed')
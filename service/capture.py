@@ -0,0 +1,168 @@
+"""
+Traffic capture for the Supplier service
+----------------------------------------
+When CAPTURE_PATH is set, every request to a /suppliers route is
+appended to that file as one line of compact JSON, so production traffic
+can be replayed against a candidate build (see benchmarks/replay.py):
+
+t   the wall clock time the request started at, in seconds since the epoch
+m   method
+r   the URL rule that matched, like /suppliers/<supplier_id>
+p   path
+q   query arguments, as a list of [name, value] pairs
+b   JSON body, if the request had one
+d   milliseconds taken to respond, up to the end of the body
+s   response status
+
+Captures are anonymized. Supplier ids, in the path, the ids argument and
+the ids of a multi-get body, become "~" and a keyed hash, the same for
+the same id, so a replay can create one Supplier for each and use it
+wherever the id was used. Every other string, in the query or the body,
+becomes a keyed hash of the same length. Numbers, like product ids and
+ratings, and booleans are kept, also when they are query arguments.
+The key comes from CAPTURE_KEY, so the processes of a deployment
+pseudonymize alike; keep it out of the capture.
+"""
+
+import os
+import re
+import hmac
+import json
+import time
+import hashlib
+import threading
+from flask import g, request
+
+ID_MARK = '~'
+ID_LENGTH = 16
+NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+class Capture(object):
+    """ Appends anonymized requests to a capture file
+
+    :param path: the file to append to
+    :param key: the key of the pseudonyms, random if empty
+    :param max_body: the largest body in bytes that is captured, larger ones are dropped
+    """
+
+    def __init__(self, path, key=None, max_body=64 * 1024):
+        self.path = path
+        self.key = key.encode('utf8') if key else os.urandom(32)
+        self.max_body = max_body
+        self._file = open(path, 'a', encoding='utf8')
+        self._lock = threading.Lock()
+
+
+    def _hash(self, value):
+        return hmac.new(self.key, value.encode('utf8'), hashlib.sha256).hexdigest()
+
+
+    def supplier_id(self, value):
+        """ Returns the pseudonym of a supplier id """
+        return ID_MARK + self._hash(value)[:ID_LENGTH]
+
+
+    def text(self, value):
+        """ Returns the pseudonym of any other string, as long as the string
+
+        Numbers and booleans written as strings, like query arguments, are kept.
+        """
+        if value.lower() in ('true', 'false') or NUMBER.match(value):
+            return value
+        digest = self._hash(value)
+        return (digest * (len(value) // len(digest) + 1))[:len(value)]
+
+
+    def anonymize(self, value, ids=False):
+        """ Returns a JSON value with its strings replaced by pseudonyms
+
+        :param ids: True if the strings are supplier ids
+        """
+        if isinstance(value, str):
+            return self.supplier_id(value) if ids else self.text(value)
+        if isinstance(value, list):
+            return [self.anonymize(item, ids) for item in value]
+        if isinstance(value, dict):
+            return {key: self.anonymize(item, ids or key in ('ids', '_id'))
+                    for key, item in value.items()}
+        return value
+
+
+    def entry(self, req, status, started):
+        """ Returns the anonymized entry of a request, still without its duration
+
+        :param req: the Flask request
+        :param status: the status of the response
+        :param started: the time.time() the request started at
+        """
+        rule = req.url_rule.rule
+        path = rule
+        for name, value in (req.view_args or {}).items():
+            if name == 'supplier_id':
+                value = self.supplier_id(value)
+            path = path.replace('<{}>'.format(name), str(value))
+        entry = {
+            't': round(started, 3),
+            'm': req.method,
+            'r': rule,
+            'p': path,
+            'q': [[name, ','.join(self.supplier_id(item) for item in value.split(','))
+                   if name == 'ids' else self.text(value)]
+                  for name, value in req.args.items(multi=True)],
+            's': status
+        }
+        if req.is_json and (req.content_length or 0) <= self.max_body:
+            body = req.get_json(silent=True)
+            if body is not None:
+                entry['b'] = self.anonymize(body)
+        return entry
+
+
+    def write(self, entry, duration):
+        """ Appends an entry to the capture
+
+        :param duration: seconds taken to respond, up to the end of the body
+        """
+        entry['d'] = round(duration * 1000, 3)
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+    def close(self):
+        """ Closes the capture file """
+        with self._lock:
+            self._file.close()
+
+
+def init_app(app):
+    """ Installs traffic capture on a Flask app if CAPTURE_PATH is set
+
+    :return: the Capture, or None when capture is off
+    """
+    if not app.config['CAPTURE_PATH']:
+        return None
+    capture = Capture(app.config['CAPTURE_PATH'], app.config['CAPTURE_KEY'],
+                      app.config['CAPTURE_MAX_BODY'])
+
+    @app.before_request
+    def start_capture():  # pylint: disable=unused-variable
+        """ Notes when the request started """
+        g.capture_started = (time.time(), time.monotonic())
+
+    @app.after_request
+    def capture_request(response):  # pylint: disable=unused-variable
+        """ Appends a supplier request to the capture once its body has been sent """
+        started = g.pop('capture_started', None)
+        rule = request.url_rule.rule if request.url_rule else ''
+        if started is None or not rule.startswith('/suppliers') \
+                or rule in app.config['CAPTURE_EXCLUDE']:
+            return response
+        entry = capture.entry(request, response.status_code, started[0])
+        # a streamed body is only read after this, so the duration is taken when it is closed
+        response.call_on_close(lambda: capture.write(entry, time.monotonic() - started[1]))
+        return response
+
+    return capture
@@ -0,0 +1,109 @@
+"""
+Change stream of the Supplier database
+--------------------------------------
+ChangeFeed reads the CouchDB ``_changes`` feed once per process, with
+long polls from a background thread, and keeps the latest changes in a
+ring buffer. Any number of subscribers wait on the buffer for changes
+after the last one they saw, so a thousand clients cost one feed.
+
+A subscriber that falls further behind than the buffer holds gets a
+LaggedError and should resume from the last sequence it saw with a one
+off read of the database, which is what the /suppliers/changes endpoint
+does for a ``since`` token that is no longer buffered.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class LaggedError(Exception):
+    """ A subscriber asked for changes that already left the buffer """
+
+
+class ChangeFeed(object):
+    """ Fans one ``_changes`` reader out to many subscribers
+
+    :param read: a function of a sequence that long polls the feed and
+        returns (list of changes, last sequence)
+    :param buffer_size: the number of changes kept for subscribers
+    :param retry_delay: seconds to wait after a failed read
+    """
+
+    def __init__(self, read, buffer_size=1000, retry_delay=1.0):
+        self._read = read
+        self._retry_delay = retry_delay
+        self._buffer = deque(maxlen=buffer_size)  # (position, seq, change)
+        self._position = 0  # number of changes ever added
+        self._since = 'now'
+        self._condition = threading.Condition()
+        self._thread = None
+
+
+    def start(self):
+        """ Starts the reader thread, if it is not running yet """
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-feed',
+                                                daemon=True)
+                self._thread.start()
+
+
+    def position(self):
+        """ Returns the position of the latest change, where a new subscriber starts """
+        with self._condition:
+            return self._position
+
+
+    def head(self):
+        """ Returns the position of the latest change and the sequence the feed has read up to """
+        with self._condition:
+            return self._position, self._since
+
+
+    def find(self, seq):
+        """ Returns the position of the change with a sequence, or None if it is not buffered """
+        with self._condition:
+            for position, change_seq, _ in self._buffer:
+                if change_seq == seq:
+                    return position
+        return None
+
+
+    def wait(self, position, timeout=None):
+        """ Returns the changes after a position, waiting up to timeout seconds for one
+
+        :return: a list of (position, seq, change), empty if the timeout passed
+        :raises LaggedError: if changes after position were dropped from the buffer
+        """
+        with self._condition:
+            if self._position == position:
+                self._condition.wait(timeout)
+            if self._buffer and self._buffer[0][0] > position + 1:
+                raise LaggedError('Changes after position {} were dropped'.format(position))
+            return [entry for entry in self._buffer if entry[0] > position]
+
+
+    def publish(self, changes, last_seq):
+        """ Adds changes read from the feed and wakes the subscribers """
+        with self._condition:
+            for seq, change in changes:
+                self._position += 1
+                self._buffer.append((self._position, seq, change))
+            self._since = last_seq
+            self._condition.notify_all()
+
+
+    def _run(self):
+        while True:
+            try:
+                changes, last_seq = self._read(self._since)
+            except Exception:  # pylint: disable=broad-except
+                # keep the one reader alive, the subscribers are waiting on it
+                logger.exception('Reading the changes feed failed')
+                time.sleep(self._retry_delay)
+                continue
+            self.publish(changes, last_seq)
@@ -0,0 +1,76 @@
+"""
+JSON codec used for request bodies, responses and database documents
+--------------------------------------------------------------------
+orjson is used when it is installed and the stdlib json module otherwise.
+Set the JSON_CODEC environment variable to 'json' or 'orjson' to choose
+one explicitly.
+
+dumps() always returns bytes and loads() accepts bytes or str, whichever
+codec is in use. Both raise ValueError subclasses on bad input.
+"""
+
+import os
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+
+class StdlibCodec(object):
+    """ JSON codec backed by the standard library """
+
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj):
+        """ Encodes an object to compact JSON bytes """
+        return json.dumps(obj, separators=(',', ':')).encode('utf8')
+
+    @staticmethod
+    def loads(data):
+        """ Decodes JSON bytes or text """
+        return json.loads(data)
+
+
+class OrjsonCodec(object):
+    """ JSON codec backed by orjson """
+
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj):
+        """ Encodes an object to compact JSON bytes """
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson is stricter (e.g. integers over 64 bits), let json have a go
+            return StdlibCodec.dumps(obj)
+
+    @staticmethod
+    def loads(data):
+        """ Decodes JSON bytes or text """
+        return orjson.loads(data)
+
+
+def get_codec(name=None):
+    """ Returns the codec with the given name, or the fastest one available """
+    if name == 'json':
+        return StdlibCodec
+    if name == 'orjson' and not orjson:
+        raise ImportError('JSON_CODEC is orjson but orjson is not installed')
+    return OrjsonCodec if orjson else StdlibCodec
+
+
+codec = get_codec(os.environ.get('JSON_CODEC'))  # pylint: disable=invalid-name
+
+
+def dumps(obj):
+    """ Encodes an object to JSON bytes with the configured codec """
+    return codec.dumps(obj)
+
+
+def loads(data):
+    """ Decodes JSON with the configured codec """
+    return codec.loads(data)
@@ -0,0 +1,216 @@
+"""
+HTTP compression for the Supplier service
+-----------------------------------------
+Responses are compressed with the best encoding the client accepts
+(br if the brotli package is installed, then gzip, then deflate) when
+they are of a compressible type and at least COMPRESS_MIN_SIZE bytes.
+Streamed responses are compressed as they are generated and flushed
+every FLUSH_SIZE bytes, so they keep streaming without a flush per chunk.
+
+Request bodies sent with a Content-Encoding of gzip, deflate or br are
+decompressed before they reach Flask, up to DECOMPRESS_MAX_SIZE bytes.
+A compressed body needs a Content-Length or a server that ends the input
+(wsgi.input_terminated), so a chunked upload is read to its end.
+"""
+
+import io
+import zlib
+from flask import request
+from werkzeug.exceptions import BadRequest, LengthRequired, RequestEntityTooLarge, \
+    UnsupportedMediaType
+
+try:
+    import brotli
+except ImportError:  # brotli is optional
+    brotli = None
+
+# compressed bytes fed to the brotli decompressor at a time, so the size
+# of what it inflated is checked before all of a request body is inflated
+BR_CHUNK_SIZE = 4096
+
+# bytes read at a time from a compressed request body without a Content-Length
+READ_SIZE = 64 * 1024
+
+# uncompressed bytes of a streamed response between flushes of the compressor
+FLUSH_SIZE = 16 * 1024
+
+# zlib window bits for each encoding: gzip adds a gzip header, deflate a zlib one
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS
+}
+
+
+def available_encodings():
+    """ Returns the supported encodings in order of preference """
+    encodings = ['gzip', 'deflate']
+    if brotli:
+        encodings.insert(0, 'br')
+    return encodings
+
+
+class Compressor(object):
+    """ Incrementally compresses a body with one content encoding """
+
+    def __init__(self, encoding, level=6, br_level=4):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=br_level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+
+    def compress(self, data):
+        """ Compresses a chunk, the compressor may hold on to some of it until a flush """
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """ Returns what is held so far so it can be sent right away """
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def compress_all(self, data):
+        """ Compresses a whole body in one go """
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+    def finish(self):
+        """ Returns the end of the compressed stream """
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def decompress(data, encoding, max_size):
+    """ Decompresses a request body, refusing to inflate past max_size bytes """
+    if encoding == 'br':
+        return _decompress_br(data, max_size)
+    if encoding not in WBITS:
+        raise UnsupportedMediaType('Content-Encoding {} is not supported'.format(encoding))
+    decompressor = zlib.decompressobj(WBITS[encoding])
+    try:
+        result = decompressor.decompress(data, max_size)
+    except zlib.error:
+        raise BadRequest('Request body is not valid {} data'.format(encoding))
+    if decompressor.unconsumed_tail:
+        raise RequestEntityTooLarge()
+    return result
+
+
+def _decompress_br(data, max_size):
+    """ Decompresses a br body a chunk at a time, stopping once it inflates past max_size """
+    if not brotli:
+        raise UnsupportedMediaType('Content-Encoding br is not supported')
+    decompressor = brotli.Decompressor()
+    parts = []
+    size = 0
+    try:
+        for start in range(0, len(data), BR_CHUNK_SIZE):
+            part = decompressor.process(data[start:start + BR_CHUNK_SIZE])
+            size += len(part)
+            if size > max_size:
+                raise RequestEntityTooLarge()
+            parts.append(part)
+    except brotli.error:
+        raise BadRequest('Request body is not valid br data')
+    if not decompressor.is_finished():
+        raise BadRequest('Request body is not valid br data')
+    return b''.join(parts)
+
+
+def compress_stream(chunks, compressor, charset):
+    """ Compresses an iterable response body chunk by chunk
+
+    Closing it closes the body it compresses, which may hold the request open.
+    """
+    unflushed = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compressor.compress(chunk)
+            unflushed += len(chunk)
+            if unflushed >= FLUSH_SIZE:
+                data += compressor.flush()
+                unflushed = 0
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class DecompressionMiddleware(object):
+    """ WSGI middleware that decodes compressed request bodies """
+
+    def __init__(self, wsgi_app, max_size):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity':
+            try:
+                body = decompress(self.read_body(environ), encoding, self.max_size)
+            except (BadRequest, RequestEntityTooLarge, UnsupportedMediaType,
+                    LengthRequired) as error:
+                return error(environ, start_response)
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.wsgi_app(environ, start_response)
+
+    def read_body(self, environ):
+        """ Reads the compressed body, to its end when it has no Content-Length """
+        if environ.get('CONTENT_LENGTH'):
+            try:
+                length = int(environ['CONTENT_LENGTH'])
+            except ValueError:
+                raise BadRequest('Content-Length is not a number')
+            return environ['wsgi.input'].read(length) if length > 0 else b''
+        if not environ.get('wsgi.input_terminated'):
+            # without an end to the input, reading it could block forever
+            raise LengthRequired()
+        parts = []
+        size = 0
+        while True:
+            part = environ['wsgi.input'].read(READ_SIZE)
+            if not part:
+                return b''.join(parts)
+            size += len(part)
+            if size > self.max_size:
+                raise RequestEntityTooLarge()
+            parts.append(part)
+
+
+def init_app(app):
+    """ Installs response compression and request decompression on a Flask app """
+    app.wsgi_app = DecompressionMiddleware(app.wsgi_app, app.config['DECOMPRESS_MAX_SIZE'])
+
+    @app.after_request
+    def compress_response(response):  # pylint: disable=unused-variable
+        """ Compresses the response if the client accepts it """
+        if response.direct_passthrough or 'Content-Encoding' in response.headers \
+                or response.status_code < 200 or response.status_code in (204, 304) \
+                or response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if not encoding:
+            return response
+        compressor = Compressor(encoding, app.config['COMPRESS_LEVEL'],
+                                app.config['COMPRESS_BR_LEVEL'])
+        if response.is_streamed:
+            response.response = compress_stream(response.response, compressor, response.charset)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compressor.compress_all(data))
+        response.headers['Content-Encoding'] = encoding
+        return response
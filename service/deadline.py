@@ -0,0 +1,63 @@
+"""
+Deadline of the request being handled
+-------------------------------------
+Each request gets a time budget when it starts. Code running for it,
+like database retries, asks how much of the budget is left instead of
+taking a timeout argument through every call. The deadline is kept per
+thread, so background threads have none unless they set one.
+
+The database adapter turns what is left into the socket timeout of each
+call and raises DeadlineExceeded when nothing is left.
+"""
+
+import time
+import threading
+
+_local = threading.local()  # pylint: disable=invalid-name
+
+
+class DeadlineExceeded(Exception):
+    """ The time budget of the request ran out """
+
+
+def start(seconds):
+    """ Starts a deadline seconds from now for this thread, none if seconds is falsy """
+    _local.deadline = time.monotonic() + seconds if seconds else None
+
+
+def clear():
+    """ Removes the deadline of this thread """
+    _local.deadline = None
+
+
+def remaining():
+    """ Returns the seconds left before the deadline, never negative, or None if there is none """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired():
+    """ Returns True if this thread has a deadline and it has passed """
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout(requested=None):
+    """ Returns the timeout for a call: the time left, or requested if that is shorter
+
+    :param requested: the timeout the caller asked for, None, a number or a
+        (connect, read) tuple like requests takes
+    :raises DeadlineExceeded: if the deadline has already passed
+    """
+    left = remaining()
+    if left is None:
+        return requested
+    if left <= 0:
+        raise DeadlineExceeded('Request deadline passed')
+    if requested is None:
+        return left
+    if isinstance(requested, tuple):
+        return tuple(left if value is None else min(value, left) for value in requested)
+    return min(requested, left)
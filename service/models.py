@@ -15,7 +15,7 @@ To use with Docker couchdb database use:
 ------------------------
 Attributes in a Supplier
 ------------------------
-id (string) - the supplier Id
+id (string) - the supplier Id, "<partition>:<unique id>" in a partitioned database
 name (string) - the supplier name
 like_count (int) - the number of like given by customer
 is_active (boolean) - indicate whether the supplier is active or not
@@ -24,23 +24,98 @@ rating (float) - average rating given by customer, 0-10 (eg 7.8)
 """
 
 import os
+import re
 import json
+import uuid
+import heapq
+import atexit
 import logging
+import threading
+from urllib.parse import quote
 from cloudant.client import Cloudant
-from cloudant.query import Query
-from cloudant.adapters import Replay429Adapter
-from requests import HTTPError, ConnectionError
+from cloudant.document import Document
+from cloudant.error import CloudantClientException
+from requests import HTTPError, ConnectionError, Timeout
+from service import codec
+from service.products import ProductSet
+from service.write_behind import WriteBehindQueue
+from service.resilience import AdaptiveLimiter, CircuitBreaker, GuardedAdapter, ThrottledError
+from service.retry import RetryPolicy
 
 # get configruation from enviuronment (12-factor)
 ADMIN_PARTY = os.environ.get('ADMIN_PARTY', 'False').lower() == 'true'
 CLOUDANT_HOST = os.environ.get('CLOUDANT_HOST', 'localhost')
 CLOUDANT_USERNAME = os.environ.get('CLOUDANT_USERNAME', 'admin')
 CLOUDANT_PASSWORD = os.environ.get('CLOUDANT_PASSWORD', 'pass')
+# a replica of the database, like a CouchDB next to the app node, that finders
+# read from while writes go to the primary; none when it is empty
+CLOUDANT_READ_URL = os.environ.get('CLOUDANT_READ_URL', '')
 
-# global variables for retry (must be int)
+# global variables for retry: the most retries, the shortest wait in seconds, how
+# much longer each wait may be than the last and the longest wait in seconds
 RETRY_COUNT = int(os.environ.get('RETRY_COUNT', 10))
-RETRY_DELAY = int(os.environ.get('RETRY_DELAY', 1))
-RETRY_BACKOFF = int(os.environ.get('RETRY_BACKOFF', 2))
+RETRY_DELAY = float(os.environ.get('RETRY_DELAY', 1))
+RETRY_BACKOFF = float(os.environ.get('RETRY_BACKOFF', 2))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 30))
+
+# write-behind group commit (a window of 0 writes every document directly)
+WRITE_BEHIND_WINDOW_MS = float(os.environ.get('WRITE_BEHIND_WINDOW_MS', 0))
+WRITE_BEHIND_MAX_DOCS = int(os.environ.get('WRITE_BEHIND_MAX_DOCS', 500))
+
+# number of documents fetched per Mango query request
+QUERY_PAGE_SIZE = int(os.environ.get('QUERY_PAGE_SIZE', 500))
+
+# number of documents fetched per _all_docs request when iterating over every Supplier
+ALL_DOCS_BATCH_SIZE = int(os.environ.get('ALL_DOCS_BATCH_SIZE', 1000))
+
+# fields with a Mango json index, created by init_db
+INDEXED_FIELDS = ('rating', 'like_count', 'name')
+
+# design document with the update handler that changes some fields of a
+# Supplier in place, installed by init_db. The body of the request holds the
+# fields to change; a rev query argument must be the latest revision.
+DESIGN_ID = '_design/supplier'
+PATCH_HANDLER = """function (doc, req) {
+  if (!doc) {
+    return [null, {code: 404, json: {error: 'not_found', reason: 'missing'}}];
+  }
+  if (req.query.rev && req.query.rev !== doc._rev) {
+    return [null, {code: 409, json: {error: 'conflict', reason: 'Document update conflict.'}}];
+  }
+  var fields = JSON.parse(req.body);
+  for (var field in fields) {
+    if (field.charAt(0) !== '_') {
+      doc[field] = fields[field];
+    }
+  }
+  return [doc, {json: doc}];
+}"""
+
+# attempts of a patch without a revision that races another write to the Supplier
+PATCH_ATTEMPTS = 3
+
+# limit on database requests in flight, adapted between 1 and DB_CONCURRENCY_MAX,
+# and the seconds a request waits for a slot before it is refused
+DB_CONCURRENCY_INITIAL = int(os.environ.get('DB_CONCURRENCY_INITIAL', 20))
+DB_CONCURRENCY_MAX = int(os.environ.get('DB_CONCURRENCY_MAX', 100))
+DB_QUEUE_TIMEOUT = float(os.environ.get('DB_QUEUE_TIMEOUT', 1.0))
+
+# circuit breaker: opens when BREAKER_ERROR_RATE of the last BREAKER_WINDOW requests
+# (and at least BREAKER_MIN_REQUESTS) failed, for BREAKER_OPEN_SECONDS
+BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', 0.5))
+BREAKER_WINDOW = int(os.environ.get('BREAKER_WINDOW', 50))
+BREAKER_MIN_REQUESTS = int(os.environ.get('BREAKER_MIN_REQUESTS', 20))
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', 5))
+
+# partitioned layout: new databases are created partitioned and supplier ids
+# are prefixed with a partition key, DEFAULT_PARTITION when none is given
+PARTITIONED = os.environ.get('PARTITIONED', 'False').lower() == 'true'
+DEFAULT_PARTITION = os.environ.get('DEFAULT_PARTITION', 'default')
+
+# ephemeral databases: every process gets its own database, named after the
+# one asked for, its pid and a run id, which is dropped when the process exits
+EPHEMERAL_DB = os.environ.get('EPHEMERAL_DB', 'False').lower() == 'true'
+RUN_ID = uuid.uuid4().hex[:8]
 
 
 class DatabaseConnectionError(Exception):
@@ -49,7 +124,48 @@ class DatabaseConnectionError(Exception):
 
 class DataValidationError(Exception):
     """ Custom Exception with data validation fails """
-    #pass
+
+    def __init__(self, message='', errors=None):
+        super(DataValidationError, self).__init__(message)
+        self.errors = errors or []
+
+class DatabaseConflictError(Exception):
+    """ Custom Exception when a write is made against a stale revision """
+
+
+def check_partition(partition):
+    """ Returns the partition key if it is valid, raises DataValidationError if not """
+    if not isinstance(partition, str) or not partition or ':' in partition \
+            or partition.startswith('_'):
+        raise DataValidationError('Invalid partition: {!r} must be a non-empty string without '
+                                  'a colon that does not start with an underscore'.format(partition))
+    return partition
+
+
+def is_transient(error):
+    """ Returns True for database errors that may go away if the request is made again """
+    if isinstance(error, (ConnectionError, Timeout, ThrottledError)):
+        return True
+    return isinstance(error, HTTPError) and error.response is not None \
+        and error.response.status_code in (500, 502, 503, 504)
+
+
+def _process_exists(pid):
+    """ Returns True if a process with the pid runs on this host """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # it exists but belongs to someone else
+        return True
+    return True
+
+
+def partition_of(supplier_id):
+    """ Returns the partition key of a Supplier id, or None if it has none """
+    if isinstance(supplier_id, str) and ':' in supplier_id:
+        return supplier_id.split(':', 1)[0]
+    return None
 
 
 class Supplier(object):
@@ -63,13 +179,30 @@ class Supplier(object):
     logger = logging.getLogger(__name__)
     client = None   # cloudant.client.Cloudant
     database = [] # cloudant.database.CloudantDatabase
+    write_queue = None  # service.write_behind.WriteBehindQueue
+    partitioned = False  # True when the database is partitioned
+    ephemeral_databases = set()  # names of the databases to drop when the process exits
+    read_client = None  # cloudant.client.Cloudant of the replica
+    read_database = None  # cloudant.database.CloudantDatabase finders read, or None
+    routing = threading.local()  # per thread: the last write and whether to read the primary
+    # every client shares one adapter so the limit and breaker cover the whole process
+    adapter = GuardedAdapter(
+        AdaptiveLimiter(DB_CONCURRENCY_INITIAL, maximum=DB_CONCURRENCY_MAX,
+                        timeout=DB_QUEUE_TIMEOUT),
+        CircuitBreaker(BREAKER_ERROR_RATE, BREAKER_WINDOW, BREAKER_MIN_REQUESTS,
+                       BREAKER_OPEN_SECONDS))
+    # retries of idempotent requests and of connecting
+    retry_policy = RetryPolicy(RETRY_COUNT, RETRY_DELAY, RETRY_BACKOFF, RETRY_MAX_DELAY)
 
 
-    def __init__(self, name=None, like_count=None, is_active=True, products=None, rating=None):
+    def __init__(self, name=None, like_count=None, is_active=True, products=None, rating=None,
+                 partition=None):
         """ Constructor """
         if products is None:
             products = []
         self.id = None
+        self.rev = None
+        self.partition = partition
         self.name = name
         self.like_count = like_count
         self.is_active = is_active
@@ -77,42 +210,181 @@ class Supplier(object):
         self.rating = rating
 
 
+    @property
+    def products(self):
+        """ The list of product ids, as stored and sent over the wire """
+        return self._products
+
+
+    @products.setter
+    def products(self, products):
+        self._products = products
+        self._product_set = None
+
+
+    @property
+    def product_set(self):
+        """ The products as a ProductSet, built the first time it is needed
+
+        Assign a new list to products to change them, the set is not rebuilt
+        when the list is modified in place.
+        """
+        if self._product_set is None:
+            products = self._products if isinstance(self._products, list) else []
+            self._product_set = ProductSet(products)
+        return self._product_set
+
+
+    def has_product(self, product_id):
+        """ Returns True if the Supplier provides the product """
+        return product_id in self.product_set
+
+
     def create(self):
         """
         Creates a new Supplier in the database
         """
         if self.name is None:   # name is the only required field
             raise DataValidationError('name attribute is not set')
+        self._assign_partitioned_id()
+
+        if Supplier.write_queue:
+            result = self._write_behind(self.serialize())
+            if result:
+                self.id = result['id']
+                self.rev = result['rev']
+            return
 
+        # posted straight to the database, the client's document cache would keep every one
         try:
-            document = self.database.create_document(self.serialize())
+            result = self._request('POST', self.database.database_url, body=self.serialize())
         except HTTPError as err:
             Supplier.logger.info('Create failed: %s', err)
             return
+        self.id = result['id']
+        self.rev = result['rev']
+        Supplier.routing.last_write = (self.id, self.rev)
+
 
-        if document.exists():
-            self.id = document['_id']
+    @classmethod
+    def create_many(cls, suppliers):
+        """ Creates many Suppliers with a single ``_bulk_docs`` request
+
+        :param suppliers: a list of Suppliers without ids
+        :return: the bulk result row of each Supplier, in the same order
+        """
+        if any(supplier.name is None for supplier in suppliers):
+            raise DataValidationError('name attribute is not set')
+        if not suppliers:
+            return []
+        for supplier in suppliers:
+            supplier._assign_partitioned_id()  # pylint: disable=protected-access
+        results = cls._request('POST', cls._url('_bulk_docs'),
+                               body={'docs': [supplier.serialize() for supplier in suppliers]})
+        for supplier, result in zip(suppliers, results):
+            if 'error' in result:
+                Supplier.logger.info('Create failed: %s %s', result['error'], result.get('reason'))
+            else:
+                supplier.id = result['id']
+                supplier.rev = result['rev']
+                Supplier.routing.last_write = (supplier.id, supplier.rev)
+        return results
+
+
+    def _assign_partitioned_id(self):
+        """ Gives a new Supplier an id in its partition when the database is partitioned
+
+        Partitioned databases only accept documents whose id starts with a
+        partition key, so the id is made here instead of by the database.
+        """
+        if Supplier.partitioned and not self.id:
+            partition = check_partition(self.partition or DEFAULT_PARTITION)
+            self.id = '{}:{}'.format(partition, uuid.uuid4().hex)
+            self.partition = partition
 
 
     def update(self):
-        """ Updates a Supplier in the database """
+        """ Updates a Supplier in the database
+
+        The document is written with a single PUT carrying the revision the
+        Supplier was read at, so a concurrent change is never overwritten and
+        raises a DatabaseConflictError instead. If the revision is unknown the
+        latest one is looked up first and the last writer wins.
+        """
+        if not self.rev:
+            document = self._fetch_document(self.id)
+            if document is None:
+                return
+            self.rev = document['_rev']
+
+        if Supplier.write_queue:
+            result = self._write_behind(self.serialize())
+            if result:
+                self.rev = result['rev']
+            return
+
         try:
-            document = self.database[self.id]
-        except KeyError:
-            document = None
-        if document:
-            document.update(self.serialize())
-            document.save()
+            result = self._request('PUT', self._document_url(self.id), body=self.serialize())
+        except HTTPError as err:
+            if err.response is not None and err.response.status_code == 409:
+                raise DatabaseConflictError('Supplier [{}] was changed since revision {}'
+                                            .format(self.id, self.rev))
+            raise
+        self.rev = result['rev']
+        Supplier.routing.last_write = (self.id, self.rev)
 
 
     def delete(self):
         """ Deletes a Supplier from the database"""
+        if not self.rev:
+            document = self._fetch_document(self.id)
+            if document is None:
+                return
+            self.rev = document['_rev']
         try:
-            document = self.database[self.id]
-        except KeyError:
-            document = None
-        if document:
-            document.delete()
+            result = self._request('DELETE', self._document_url(self.id), params={'rev': self.rev})
+        except HTTPError as err:
+            if err.response is not None and err.response.status_code == 404:
+                return
+            if err.response is not None and err.response.status_code == 409:
+                raise DatabaseConflictError('Supplier [{}] was changed since revision {}'
+                                            .format(self.id, self.rev))
+            raise
+        Supplier.routing.last_write = (self.id, result['rev'])
+
+
+    @classmethod
+    def patch(cls, supplier_id, fields, rev=None):
+        """ Changes some fields of a Supplier with one request to the update handler
+
+        Only the changed fields are sent; the database merges them into the
+        stored document, instead of the whole Supplier being read and written
+        back. With a rev the change is refused unless it is the latest
+        revision, without one a change racing another write is tried again.
+
+        :param fields: a dictionary of the fields to change
+        :return: the changed Supplier, or None if there is none with that id
+        :raises DatabaseConflictError: if rev is not the latest revision
+        """
+        url = cls._url('{}/_update/patch/{}'.format(DESIGN_ID, quote(supplier_id, safe='')))
+        params = {'rev': rev} if rev else None
+        for attempt in range(1, PATCH_ATTEMPTS + 1):
+            try:
+                response = cls._send_once('PUT', url, params, fields)
+                break
+            except HTTPError as err:
+                code = err.response.status_code if err.response is not None else None
+                if code == 404:
+                    return None
+                if code != 409:
+                    raise
+                if rev or attempt == PATCH_ATTEMPTS:
+                    raise DatabaseConflictError('Supplier [{}] was changed since revision {}'
+                                                .format(supplier_id, rev or 'read'))
+        supplier = Supplier().deserialize(codec.loads(response.content))
+        supplier.rev = response.headers['X-Couch-Update-NewRev']
+        Supplier.routing.last_write = (supplier.id, supplier.rev)
+        return supplier
 
 
     def save(self):
@@ -125,6 +397,27 @@ class Supplier(object):
             self.create()
 
 
+    @staticmethod
+    def _write_behind(data):
+        """ Writes a document through the group commit queue
+
+        :return: the bulk result row for the document, or None if it failed
+        """
+        try:
+            result = Supplier.write_queue.write(data)
+        except HTTPError as err:
+            Supplier.logger.info('Write failed: %s', err)
+            return None
+        if result.get('error') == 'conflict':
+            raise DatabaseConflictError('Supplier [{}] was changed since revision {}'
+                                        .format(data.get('_id'), data.get('_rev')))
+        if 'error' in result:
+            Supplier.logger.info('Write failed: %s %s', result['error'], result.get('reason'))
+            return None
+        Supplier.routing.last_write = (result['id'], result['rev'])
+        return result
+
+
     def serialize(self):
         """ serializes a Supplier into a dictionary """
         supplier = {
@@ -136,6 +429,8 @@ class Supplier(object):
         }
         if self.id:
             supplier['_id'] = self.id
+        if self.rev:
+            supplier['_rev'] = self.rev
         return supplier
 
 
@@ -144,7 +439,7 @@ class Supplier(object):
 
         :param data: a Python dictionary representing a Supplier.
         """
-        Supplier.logger.info('deserialize(%s)', data)
+        Supplier.logger.debug('deserialize(%s)', data)
         try:
             self.name = data['name']
             self.like_count = data['like_count']
@@ -159,10 +454,27 @@ class Supplier(object):
         # if there is no id and the data has one, assign it
         if not self.id and '_id' in data:
             self.id = data['_id']
+            self.partition = partition_of(self.id)
+        # remember the revision it was read at for optimistic updates
+        if '_rev' in data:
+            self.rev = data['_rev']
 
         return self
 
 
+    @staticmethod
+    def from_document(document):
+        """ Makes a Supplier from a stored document, without the checks and logging of
+        deserialize, for code that reads many of them
+        """
+        supplier = Supplier(document['name'], document['like_count'], document['is_active'],
+                            document['products'], document['rating'])
+        supplier.id = document['_id']
+        supplier.rev = document.get('_rev')
+        supplier.partition = partition_of(supplier.id)
+        return supplier
+
+
 
 ######################################################################
 #  S T A T I C   D A T A B S E   M E T H O D S
@@ -171,81 +483,472 @@ class Supplier(object):
 
     @classmethod
     def remove_all(cls):
-        """ Removes all documents from the database (use for testing)  """
-        for document in cls.database:
-            document.delete()
+        """ Removes all Suppliers from the database (use for testing)
+
+        Deletes them a batch at a time with ``_bulk_docs``, design documents are kept.
+        """
+        for rows in cls._all_docs_batches():
+            deletes = [{'_id': row['id'], '_rev': row['value']['rev'], '_deleted': True}
+                       for row in rows if not row['id'].startswith('_design/')]
+            if deletes:
+                cls._request('POST', cls._url('_bulk_docs'), body={'docs': deletes})
 
 
     @classmethod
-    def all(cls):
-        """ Query that returns all Suppliers """
-        results = []
-        for doc in cls.database:
-            supplier = Supplier().deserialize(doc)
-            supplier.id = doc['_id']
-            results.append(supplier)
-        return results
+    def all(cls, partition=None):
+        """ Query that returns all Suppliers, or all the Suppliers of one partition """
+        return list(cls.iterate(partition, replica=True))
+
+
+    @classmethod
+    def iterate(cls, partition=None, batch_size=None, replica=False):
+        """ Yields every Supplier, or every Supplier of one partition, in id order
+
+        The documents are read from ``_all_docs`` a batch at a time and nothing
+        is kept once it is yielded, so memory stays flat however many there are.
+
+        :param replica: read from the replica, when there is one
+        """
+        for rows in cls._all_docs_batches(partition, batch_size, include_docs=True,
+                                          replica=replica):
+            for row in rows:
+                if not row['id'].startswith('_design/'):
+                    yield Supplier.from_document(row['doc'])
+
+
+    @classmethod
+    def _all_docs_batches(cls, partition=None, batch_size=None, include_docs=False,
+                          replica=False):
+        """ Yields the rows of ``_all_docs`` a batch at a time
+
+        Each request asks for one row more than the batch, whose id is where
+        the next batch starts, instead of skipping over the rows already read.
+        """
+        batch_size = batch_size or ALL_DOCS_BATCH_SIZE
+        params = {'limit': batch_size + 1}
+        if include_docs:
+            params['include_docs'] = 'true'
+        url = cls._url('_all_docs', partition, replica)
+        while True:
+            rows = cls._request('GET', url, params=params)['rows']
+            yield rows[:batch_size]
+            if len(rows) <= batch_size:
+                return
+            params['startkey'] = json.dumps(rows[batch_size]['id'])
+
+
+    @classmethod
+    def changes(cls, since='now', timeout=None, limit=None):
+        """ Reads the ``_changes`` feed of the database after a sequence
+
+        :param since: the sequence to read after, 0 for every change or 'now'
+        :param timeout: seconds to long poll for a change, or None to return at once
+        :param limit: the most changes to return
+        :return: a tuple of (list of (seq, change), last sequence, number of changes left)
+            where a change is a dictionary of the seq, id, rev, whether it was deleted
+            and the serialized Supplier
+        """
+        params = {'since': since, 'include_docs': 'true'}
+        if timeout is not None:
+            params['feed'] = 'longpoll'
+            params['timeout'] = int(timeout * 1000)
+        if limit is not None:
+            params['limit'] = limit
+        response = cls._request('GET', cls._url('_changes'), params=params)
+        changes = []
+        for row in response['results']:
+            if row['id'].startswith('_design/'):
+                continue
+            deleted = bool(row.get('deleted'))
+            changes.append((row['seq'], {
+                'seq': row['seq'],
+                'id': row['id'],
+                'rev': row['changes'][0]['rev'] if row.get('changes') else None,
+                'deleted': deleted,
+                'supplier': None if deleted or not row.get('doc')
+                            else Supplier().deserialize(row['doc']).serialize()
+            }))
+        return changes, response['last_seq'], response.get('pending', 0)
+
+
+    @classmethod
+    def enable_write_behind(cls, window=0.005, max_docs=500):
+        """ Groups the creates and updates of concurrent writers into bulk requests
+
+        :param window: seconds to wait for more writes before sending a batch
+        :param max_docs: the largest number of documents in one batch
+        """
+        cls.disable_write_behind()
+        cls.write_queue = WriteBehindQueue(
+            lambda docs: cls._request('POST', cls._url('_bulk_docs'), body={'docs': docs}),
+            window, max_docs)
+
+
+    @classmethod
+    def disable_write_behind(cls):
+        """ Flushes any queued writes and goes back to one request per write """
+        if cls.write_queue:
+            cls.write_queue.close()
+            cls.write_queue = None
 
 
 ######################################################################
-#  F I N D E R   M E T H O D S
+#  D A T A B A S E   R E Q U E S T S
 ######################################################################
 
 
     @classmethod
-    def find(cls, supplier_id):
-        """ Query that finds Suppliers by their id """
+    def _url(cls, path, partition=None, replica=False):
+        """ Returns the URL of a path inside the database, or inside one of its partitions
+
+        :param replica: a URL of the database finders read from, see _reader
+        """
+        database = cls._reader() if replica else cls.database
+        if partition is None:
+            return '/'.join((database.database_url, path))
+        if not cls.partitioned:
+            raise DataValidationError('Invalid request: the database is not partitioned')
+        return '/'.join((database.database_partition_url(check_partition(partition)), path))
+
+
+    @classmethod
+    def _document_url(cls, supplier_id, replica=False):
+        """ Returns the URL of a document, with the id properly encoded """
+        return Document(cls._reader() if replica else cls.database, supplier_id).document_url
+
+
+    @classmethod
+    def _reader(cls):
+        """ Returns the database finders read from
+
+        That is the replica, unless there is none or this thread must read the
+        primary to see its own writes (see read_after).
+        """
+        if cls.read_database is None or cls.reading_own_writes():
+            return cls.database
+        return cls.read_database
+
+
+    @classmethod
+    def reading_own_writes(cls):
+        """ Returns True if this thread must read the primary to see its own writes """
+        return getattr(cls.routing, 'primary', False)
+
+
+    @classmethod
+    def read_after(cls, supplier_id, rev):
+        """ Makes this thread read the primary until the replica has a revision
+
+        A client that sends back the id and revision of its last write is
+        then sure to read it, even if the replica has not caught up yet.
+        """
+        cls.routing.primary = cls.read_database is not None \
+            and not cls._replica_has(supplier_id, rev)
+
+
+    @classmethod
+    def _replica_has(cls, supplier_id, rev):
+        """ Returns True if the replica has a revision of a document, deleted or not """
+        url = Document(cls.read_database, supplier_id).document_url
         try:
-            document = cls.database[supplier_id]
-            return Supplier().deserialize(document)
-        except KeyError:
+            response = cls.read_database.r_session.head(url, params={'rev': rev})
+        except (ConnectionError, Timeout):
+            return False
+        return response.status_code == 200
+
+
+    @classmethod
+    def last_write(cls):
+        """ Returns the (id, revision) of this thread's last write, or None """
+        return getattr(cls.routing, 'last_write', None)
+
+
+    @classmethod
+    def reset_routing(cls):
+        """ Forgets this thread's last write and reads from the replica again """
+        cls.routing.last_write = None
+        cls.routing.primary = False
+
+
+    @classmethod
+    def _request(cls, method, url, params=None, body=None, idempotent=None):
+        """ Sends a request on the client session, encoding and decoding JSON with the codec
+
+        Idempotent requests, GET and HEAD unless told otherwise, are retried
+        with the retry policy when they fail with a transient error.
+
+        :raises HTTPError: if the database answers with an error status
+        """
+        if idempotent is None:
+            idempotent = method in ('GET', 'HEAD')
+        if idempotent:
+            return cls.retry_policy.call(cls._send, is_transient, method, url, params, body)
+        return cls._send(method, url, params, body)
+
+
+    @classmethod
+    def _send(cls, method, url, params=None, body=None):
+        """ Sends a request once """
+        return codec.loads(cls._send_once(method, url, params, body).content)
+
+
+    @classmethod
+    def _send_once(cls, method, url, params=None, body=None):
+        """ Sends a request once and returns the response, for callers that need its headers """
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+            data = codec.dumps(body)
+        database = cls.database
+        if cls.read_database is not None and url.startswith(cls.read_database.database_url):
+            database = cls.read_database
+        response = database.r_session.request(method, url, params=params,
+                                              data=data, headers=headers)
+        response.raise_for_status()
+        return response
+
+
+    @classmethod
+    def _fetch_document(cls, supplier_id, replica=False):
+        """ Reads the latest revision of a document, or None if it does not exist """
+        try:
+            return cls._request('GET', cls._document_url(supplier_id, replica))
+        except HTTPError as err:
+            if err.response is not None and err.response.status_code == 404:
+                return None
+            raise
+
+
+######################################################################
+#  F I N D E R   M E T H O D S
+######################################################################
+
+
+    @classmethod
+    def find(cls, supplier_id, replica=True):
+        """ Query that finds Suppliers by their id
+
+        :param replica: False to read the primary, as a read-modify-write must,
+            so a lagging replica cannot hand back a stale or missing Supplier
+        """
+        document = cls._fetch_document(supplier_id, replica)
+        if document is None:
             return None
+        return Supplier().deserialize(document)
 
 
     @classmethod
-    def find_by_greater(cls, field: str, limit):
-        """ Find records using selector """
-        query = Query(cls.database, selector={field: {'$gt': limit}})
+    def find_many(cls, supplier_ids):
+        """ Query that finds many Suppliers by their ids in a single request
+
+        Uses one ``_all_docs?include_docs=true`` call with the ids as keys
+        instead of one round trip per id.
+
+        :param supplier_ids: an iterable of Supplier ids
+        :return: a tuple of (list of Suppliers found, list of missing ids)
+        """
+        # de-duplicate but keep the order the caller asked for
+        supplier_ids = list(dict.fromkeys(str(supplier_id) for supplier_id in supplier_ids))
+        if not supplier_ids:
+            return [], []
+        response = cls._request('POST', cls._url('_all_docs', replica=True),
+                                params={'include_docs': 'true'},
+                                body={'keys': supplier_ids}, idempotent=True)
+        suppliers = []
+        missing = []
+        for row in response.get('rows', []):
+            document = row.get('doc')
+            if document is None:
+                # unknown ids come back with an error, deleted ones with a null doc
+                missing.append(row['key'])
+            else:
+                suppliers.append(Supplier().deserialize(document))
+        return suppliers, missing
+
+
+    @classmethod
+    def find_by_selector(cls, selector, sort=None, limit=None, partition=None):
+        """ Find records using a Mango selector, a page at a time
+
+        :param selector: the Mango selector
+        :param sort: an optional Mango sort, e.g. [{'name': 'asc'}]
+        :param limit: the most records to return, all of them if None
+        :param partition: query only this partition, which is served by a single shard
+        """
+        page_size = QUERY_PAGE_SIZE if limit is None else min(limit, QUERY_PAGE_SIZE)
+        query = {'selector': selector, 'limit': page_size}
+        if sort:
+            query['sort'] = sort
         results = []
-        for doc in query.result:
-            supplier = Supplier()
-            supplier.deserialize(doc)
-            results.append(supplier)
-        return results
+        while True:
+            response = cls._request('POST', cls._url('_find', partition, replica=True),
+                                    body=query, idempotent=True)
+            for doc in response['docs']:
+                results.append(Supplier().deserialize(doc))
+            if len(response['docs']) < page_size or not response.get('bookmark') \
+                    or limit is not None and len(results) >= limit:
+                return results if limit is None else results[:limit]
+            query['bookmark'] = response['bookmark']
 
 
     @classmethod
-    def find_by_equal(cls, **kwargs):
+    def find_by_greater(cls, field: str, limit, partition=None):
         """ Find records using selector """
-        query = Query(cls.database, selector=kwargs)
-        results = []
-        for doc in query.result:
-            supplier = Supplier()
-            supplier.deserialize(doc)
-            results.append(supplier)
-        return results
+        return cls.find_by_selector({field: {'$gt': limit}}, partition=partition)
+
+
+    @classmethod
+    def find_by_range(cls, field: str, minimum=None, maximum=None, partition=None):
+        """ Find records whose numeric field is between minimum and maximum
+
+        Both bounds are inclusive and either may be left out. The bounds
+        become $gte/$lte on the field's index, so only the matching slice
+        of the index is read.
+        """
+        if minimum is None and maximum is None:
+            raise DataValidationError('A minimum or a maximum {} is required'.format(field))
+        # numbers sort before strings in CouchDB, so keep blank strings out of open ranges
+        condition = {'$type': 'number'}
+        if minimum is not None:
+            condition['$gte'] = minimum
+        if maximum is not None:
+            condition['$lte'] = maximum
+        return cls.find_by_selector({field: condition}, partition=partition)
 
 
     @classmethod
-    def find_by_name(cls, name):
+    def find_by_equal(cls, partition=None, **kwargs):
+        """ Find records using selector """
+        return cls.find_by_selector(kwargs, partition=partition)
+
+
+    @classmethod
+    def find_by_name(cls, name, partition=None):
         """ Query that finds Suppliers by their name """
-        return cls.find_by_equal(name=name)
+        return cls.find_by_equal(partition, name=name)
+
+
+    @classmethod
+    def find_by_name_prefix(cls, prefix, limit=None, partition=None):
+        """ Query that finds Suppliers whose name starts with prefix, in name order
+
+        The prefix becomes a range on the name index, from the prefix up to
+        the prefix followed by a character that sorts after any name.
+        """
+        selector = {'name': {'$gte': prefix, '$lt': prefix + '\ufff0'}}
+        return cls.find_by_selector(selector, sort=[{'name': 'asc'}], limit=limit,
+                                    partition=partition)
 
 
     @classmethod
-    def find_by_is_active(cls, is_active):
+    def find_by_is_active(cls, is_active, partition=None):
         """ Query that finds Suppliers by their active status """
-        return cls.find_by_equal(is_active=is_active)
+        return cls.find_by_equal(partition, is_active=is_active)
+
+
+    @classmethod
+    def recommend(cls, product_ids, k=1, partition=None):
+        """ Recommends the top k highly-rated active Suppliers for each product
+
+        All the products are served by one query for the active Suppliers that
+        provide any of them, and every Supplier returned is visited only once.
+
+        :param product_ids: a list of product ids
+        :param k: the number of Suppliers to recommend per product
+        :param partition: recommend only Suppliers of this partition
+        :return: a dictionary of product id to a list of Suppliers, best first
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        if not product_ids:
+            return {}
+        wanted = ProductSet(product_ids)
+        selector = {
+            'is_active': True,
+            'products': {'$elemMatch': {'$in': product_ids}}
+        }
+        # a bounded min-heap per product keeps only the k best seen so far
+        heaps = {product_id: [] for product_id in product_ids}
+        for position, supplier in enumerate(cls.find_by_selector(selector, partition=partition)):
+            rating = supplier.rating if isinstance(supplier.rating, (int, float)) else float('-inf')
+            # ties go to the supplier seen first, like max() did
+            entry = (rating, -position, supplier)
+            for product_id in supplier.product_set.intersection(wanted):
+                heap = heaps[product_id]
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+        return {
+            product_id: [entry[2] for entry in sorted(heap, key=lambda e: e[:2], reverse=True)]
+            for product_id, heap in heaps.items()
+        }
 
 
 ############################################################
 #  C L O U D A N T   D A T A B A S E   C O N N E C T I O N
 ############################################################
 
+    @classmethod
+    def create_indexes(cls):
+        """ Creates the Mango indexes used by the finders, if they are missing
+
+        A partitioned database needs global indexes for queries across all
+        partitions and partitioned ones for queries inside a partition.
+        """
+        for field in INDEXED_FIELDS:
+            # one design document per index so adding one does not rebuild the others
+            index = {
+                'index': {'fields': [field]},
+                'ddoc': 'index-' + field,
+                'name': 'by-' + field,
+                'type': 'json'
+            }
+            if cls.partitioned:
+                index['partitioned'] = False
+                cls._request('POST', cls._url('_index'), body=dict(
+                    index, ddoc='index-' + field + '-partitioned', partitioned=True),
+                             idempotent=True)
+            cls._request('POST', cls._url('_index'), body=index, idempotent=True)
+
+
+    @classmethod
+    def install_design(cls):
+        """ Installs the design document with the update handler behind patch
+
+        It is only written when it is missing or differs, and a conflict means
+        another process installed it at the same time.
+        """
+        design = cls._fetch_document(DESIGN_ID) or {'_id': DESIGN_ID}
+        handlers = {'patch': PATCH_HANDLER}
+        if design.get('updates') == handlers:
+            return
+        design.update(language='javascript', updates=handlers)
+        if cls.partitioned:
+            # update handlers only run in global design documents
+            design['options'] = {'partitioned': False}
+        try:
+            cls._request('PUT', cls._document_url(DESIGN_ID), body=design)
+        except HTTPError as err:
+            if err.response is None or err.response.status_code != 409:
+                raise
+
+
     @staticmethod
-    def init_db(dbname='suppliers'):
+    def init_db(dbname='suppliers', partitioned=PARTITIONED, ephemeral=EPHEMERAL_DB,
+                read_url=CLOUDANT_READ_URL):
         """
         Initialized Coundant database connection
+
+        A missing database is created partitioned if partitioned is True,
+        an existing one is used with the layout it already has.
+
+        If ephemeral is True the database is this process's own copy of dbname
+        (see ephemeral_name), dropped when the process exits, so test and
+        benchmark processes can run side by side against one CouchDB.
+
+        With a read_url finders read the database of that name from there, a
+        replica kept by CouchDB replication, and writes go to the primary.
         """
         opts = {}
         # Try and get VCAP from the environment
@@ -277,24 +980,113 @@ class Supplier(object):
         try:
             if ADMIN_PARTY:
                 Supplier.logger.info('Running in Admin Party Mode...')
-            Supplier.client = Cloudant(opts['username'],
-                                       opts['password'],
-                                       url=opts['url'],
-                                       connect=True,
-                                       auto_renew=True,
-                                       admin_party=ADMIN_PARTY,
-                                       adapter=Replay429Adapter(retries=10, initialBackoff=0.01)
-                                      )
-
-        except ConnectionError:
+            # the service may start before the database is ready, keep trying a while
+            Supplier.client = Supplier.retry_policy.call(Cloudant, is_transient,
+                                                         opts['username'],
+                                                         opts['password'],
+                                                         url=opts['url'],
+                                                         connect=True,
+                                                         auto_renew=True,
+                                                         admin_party=ADMIN_PARTY,
+                                                         adapter=Supplier.adapter
+                                                        )
+
+        except (ConnectionError, Timeout, ThrottledError):
             raise DatabaseConnectionError('Cloudant service could not be reached')
 
+        if ephemeral:
+            dbname = Supplier.ephemeral_name(dbname)
+            if dbname not in Supplier.ephemeral_databases:
+                Supplier.drop_stale_databases(dbname)
+                if not Supplier.ephemeral_databases:
+                    atexit.register(Supplier.drop_ephemeral_databases)
+                Supplier.ephemeral_databases.add(dbname)
+
         # Create database if it doesn't exist
         try:
             Supplier.database = Supplier.client[dbname]
         except KeyError:
             # Create a database using an initialized client
-            Supplier.database = Supplier.client.create_database(dbname)
+            Supplier.database = Supplier.client.create_database(dbname, partitioned=partitioned)
         # check for success
         if not Supplier.database.exists():
             raise DatabaseConnectionError('Database [{}] could not be obtained'.format(dbname))
+
+        Supplier.partitioned = bool(Supplier.database.metadata().get('props', {})
+                                    .get('partitioned'))
+        if Supplier.partitioned != partitioned:
+            Supplier.logger.warning('Database [%s] already exists %s partitions',
+                                    dbname, 'with' if Supplier.partitioned else 'without')
+
+        Supplier.create_indexes()
+        Supplier.install_design()
+        Supplier.connect_replica(read_url, dbname, opts)
+
+        if WRITE_BEHIND_WINDOW_MS > 0 and not Supplier.write_queue:
+            Supplier.logger.info('Write-behind enabled: %sms window, %d documents per batch',
+                                 WRITE_BEHIND_WINDOW_MS, WRITE_BEHIND_MAX_DOCS)
+            Supplier.enable_write_behind(WRITE_BEHIND_WINDOW_MS / 1000.0, WRITE_BEHIND_MAX_DOCS)
+
+
+    @staticmethod
+    def connect_replica(read_url, dbname, opts):
+        """ Connects to the replica finders read from, the primary is read if there is none """
+        Supplier.read_client = None
+        Supplier.read_database = None
+        if not read_url:
+            return
+        Supplier.logger.info('Cloudant read replica: %s', read_url)
+        try:
+            Supplier.read_client = Supplier.retry_policy.call(Cloudant, is_transient,
+                                                              opts['username'],
+                                                              opts['password'],
+                                                              url=read_url,
+                                                              connect=True,
+                                                              auto_renew=True,
+                                                              admin_party=ADMIN_PARTY,
+                                                              adapter=Supplier.adapter)
+            Supplier.read_database = Supplier.read_client[dbname]
+        except KeyError:
+            Supplier.logger.warning('Replica has no database [%s], reading the primary', dbname)
+        except (ConnectionError, Timeout, ThrottledError):
+            Supplier.logger.warning('Replica could not be reached, reading the primary')
+
+
+    @staticmethod
+    def ephemeral_name(dbname):
+        """ Returns the name of this process's own copy of a database """
+        return '{}-{}-{}'.format(dbname, os.getpid(), RUN_ID)
+
+
+    @staticmethod
+    def drop_ephemeral_databases():
+        """ Drops the ephemeral databases of this process """
+        for dbname in sorted(Supplier.ephemeral_databases):
+            Supplier.drop_database(dbname)
+        Supplier.ephemeral_databases.clear()
+
+
+    @staticmethod
+    def drop_stale_databases(dbname):
+        """ Drops the ephemeral copies of a database left by processes that are gone
+
+        Processes are looked up on this host, so this assumes the processes
+        sharing the CouchDB run on one machine, as tests and benchmarks do.
+        """
+        base = dbname.rsplit('-', 2)[0]
+        pattern = re.compile(r'^{}-(\d+)-[0-9a-f]{{8}}$'.format(re.escape(base)))
+        for name in Supplier.client.all_dbs():
+            match = pattern.match(name)
+            if match and name != dbname and not _process_exists(int(match.group(1))):
+                Supplier.drop_database(name)
+
+
+    @staticmethod
+    def drop_database(dbname):
+        """ Drops a database, if it exists """
+        Supplier.logger.info('Dropping database [%s]', dbname)
+        try:
+            Supplier.client.delete_database(dbname)
+        except (CloudantClientException, HTTPError) as error:
+            Supplier.logger.warning('Database [%s] could not be dropped: %s', dbname, error)
+
@@ -0,0 +1,80 @@
+"""
+Compact product membership for Suppliers
+----------------------------------------
+A Supplier's products travel as a JSON list, where ``product_id in
+products`` is a linear scan. ProductSet keeps the same ids as a sorted,
+de-duplicated array of 64 bit integers: membership is a binary search,
+intersections are a merge or a series of binary searches, and it takes
+8 bytes per product instead of a list slot plus an int object.
+"""
+
+from array import array
+from bisect import bisect_left
+
+MIN_ID = -2 ** 63
+MAX_ID = 2 ** 63 - 1
+
+
+def is_product_id(value):
+    """ Returns True for integers that fit the array """
+    return isinstance(value, int) and not isinstance(value, bool) and MIN_ID <= value <= MAX_ID
+
+
+class ProductSet(object):
+    """ An immutable sorted array of product ids """
+
+    __slots__ = ('_ids',)
+
+    def __init__(self, products=()):
+        # anything that is not a product id is skipped, integer lookups never matched it
+        self._ids = array('q', sorted(set(filter(is_product_id, products))))
+
+
+    def __contains__(self, product_id):
+        if not is_product_id(product_id):
+            return False
+        ids = self._ids
+        index = bisect_left(ids, product_id)
+        return index < len(ids) and ids[index] == product_id
+
+
+    def __len__(self):
+        return len(self._ids)
+
+
+    def __iter__(self):
+        return iter(self._ids)
+
+
+    def __repr__(self):
+        return 'ProductSet({})'.format(list(self._ids))
+
+
+    def intersection(self, product_ids):
+        """ Returns the sorted list of the given product ids in this set """
+        if isinstance(product_ids, ProductSet):
+            other = product_ids._ids  # pylint: disable=protected-access
+        else:
+            other = sorted(set(filter(is_product_id, product_ids)))
+        ids = self._ids
+        if len(other) * 8 < len(ids):
+            # few ids to look for: binary search each one
+            return [product_id for product_id in other if product_id in self]
+        # similar sizes: merge the two sorted sequences
+        result = []
+        i = j = 0
+        while i < len(ids) and j < len(other):
+            if ids[i] < other[j]:
+                i += 1
+            elif ids[i] > other[j]:
+                j += 1
+            else:
+                result.append(ids[i])
+                i += 1
+                j += 1
+        return result
+
+
+    def isdisjoint(self, product_ids):
+        """ Returns True if none of the given product ids are in this set """
+        return not any(product_id in self for product_id in product_ids)
@@ -0,0 +1,91 @@
+"""
+On-demand profiling of single requests
+--------------------------------------
+A request sent with an ``X-Profile: 1`` header and the service's API key
+in ``X-Api-Key`` runs under cProfile. The pstats of the run are saved in
+PROFILE_DIR and named in the ``X-Profile-File`` header of the response;
+only the latest PROFILE_KEEP files are kept. Load one with
+``python -m pstats <file>`` or a viewer like snakeviz.
+
+Requests without the header only pay for looking it up. The profile ends
+when the view returns, so the body of a streamed response is not in it.
+"""
+
+import os
+import re
+import hmac
+import time
+import cProfile
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+SUFFIX = '.pstats'
+UNSAFE = re.compile(r'[^A-Za-z0-9]+')
+
+
+def profile_name(method, path):
+    """ Returns a file name for a profile of a request that sorts by time """
+    return '{}-{}-{}-{}{}'.format(time.time_ns(), os.getpid(), method,
+                                  UNSAFE.sub('_', path).strip('_')[:80], SUFFIX)
+
+
+def save(profiler, directory, name, keep):
+    """ Saves the stats of a profiler and removes all but the latest keep profiles
+
+    :return: the path the stats were saved to
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path)
+    profiles = sorted(entry for entry in os.listdir(directory) if entry.endswith(SUFFIX))
+    for old in profiles[:-keep]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:  # another process removed it first
+            pass
+    return path
+
+
+def authorized(api_key):
+    """ Returns True if the request carries the API key """
+    token = request.headers.get('X-Api-Key')
+    return bool(api_key and token) and hmac.compare_digest(api_key, token)
+
+
+def init_app(app):
+    """ Installs per-request profiling on a Flask app """
+
+    @app.before_request
+    def start_profile():  # pylint: disable=unused-variable
+        """ Profiles the request if it asks to and carries the API key """
+        if request.headers.get(PROFILE_HEADER) != '1':
+            return
+        if not authorized(app.config['API_KEY']):
+            app.logger.warning('Ignoring %s without a valid API key', PROFILE_HEADER)
+            return
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    @app.after_request
+    def save_profile(response):  # pylint: disable=unused-variable
+        """ Saves the profile of the request, if it has one """
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        name = profile_name(request.method, request.path)
+        try:
+            save(profiler, app.config['PROFILE_DIR'], name, app.config['PROFILE_KEEP'])
+        except OSError as error:
+            app.logger.error('Cannot save profile %s: %s', name, error)
+            return response
+        app.logger.info('Saved profile %s', name)
+        response.headers['X-Profile-File'] = name
+        return response
+
+    @app.teardown_request
+    def stop_profile(exception=None):  # pylint: disable=unused-variable,unused-argument
+        """ Stops a profile the response never got to, so it does not follow the thread """
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
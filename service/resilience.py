@@ -0,0 +1,310 @@
+"""
+Overload protection for the Cloudant connection
+-----------------------------------------------
+Every request to Cloudant goes through a GuardedAdapter, which puts two
+guards in front of it:
+
+AdaptiveLimiter   caps the requests in flight from this process. The cap
+                  grows by one per cap's worth of good responses and is
+                  halved, at most once per round trip, when Cloudant
+                  throttles (429), fails (5xx) or cannot be reached
+                  (AIMD, like TCP congestion control). A request waits up
+                  to a timeout for a slot and is refused after that.
+
+CircuitBreaker    opens when too many of the latest requests failed and
+                  then refuses every request until a cool off has passed.
+                  A single probe is let through after it: if it succeeds
+                  the circuit closes, if not it opens again.
+
+Refused and throttled requests raise an OverloadedError carrying the
+number of seconds the client should wait, which the service returns as
+a 503 with a Retry-After header instead of queuing more work.
+
+Long polls of the ``_changes`` feed skip the limiter: they wait for
+changes rather than for the database, so they would hold slots for their
+whole timeout and teach the limiter that the database got slow.
+
+The adapter also holds every call to the deadline of the request being
+handled: the time left becomes the socket timeout of the call and the
+wait for a slot, and a call that runs out of it raises DeadlineExceeded.
+"""
+
+import time
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from requests import Timeout
+from requests.adapters import HTTPAdapter
+from service import deadline
+
+
+class OverloadedError(Exception):
+    """ Cloudant is overloaded or failing and the request was not made """
+
+    def __init__(self, message='', retry_after=1):
+        super(OverloadedError, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimitError(OverloadedError):
+    """ No slot for a request came free in time """
+
+
+class CircuitOpenError(OverloadedError):
+    """ The circuit breaker is refusing requests """
+
+
+class ThrottledError(OverloadedError):
+    """ Cloudant answered 429 Too Many Requests """
+
+
+class AdaptiveLimiter(object):
+    """ An additive increase, multiplicative decrease limit on requests in flight
+
+    :param initial: the limit to start from
+    :param minimum: the lowest the limit goes
+    :param maximum: the highest the limit goes
+    :param backoff: what the limit is multiplied by on an overload
+    :param timeout: seconds to wait for a slot
+    """
+
+    def __init__(self, initial=20, minimum=1, maximum=200, backoff=0.5, timeout=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.timeout = timeout
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._latency = 0.0  # moving average of the round trip, in seconds
+        self._last_decrease = 0.0
+        self._rejected = 0
+        self._condition = threading.Condition()
+
+
+    @property
+    def limit(self):
+        """ The current number of requests allowed in flight """
+        return int(self._limit)
+
+
+    def acquire(self, timeout=None):
+        """ Takes a slot, waiting up to the timeout for one
+
+        :param timeout: seconds to wait if shorter than the limiter's timeout
+        :return: the time the slot was taken, to pass to release()
+        :raises ConcurrencyLimitError: if no slot came free in time
+        """
+        wait = self.timeout if timeout is None else min(timeout, self.timeout)
+        give_up = time.monotonic() + wait
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                remaining = give_up - time.monotonic()
+                if remaining <= 0:
+                    self._rejected += 1
+                    raise ConcurrencyLimitError('Too many database requests in flight ({})'
+                                                .format(self._in_flight))
+                self._condition.wait(remaining)
+            self._in_flight += 1
+        return time.monotonic()
+
+
+    def release(self, started, overloaded=False):
+        """ Gives a slot back and adapts the limit to how the request went """
+        now = time.monotonic()
+        with self._condition:
+            self._in_flight -= 1
+            self._latency += ((now - started) - self._latency) * 0.1
+            if overloaded:
+                # one decrease per round trip, the requests already in flight saw the same overload
+                if now - self._last_decrease >= self._latency:
+                    self._limit = max(self.minimum, self._limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._condition.notify()
+
+
+    def metrics(self):
+        """ Returns the state of the limiter """
+        with self._condition:
+            return {
+                'db_concurrency_limit': int(self._limit),
+                'db_in_flight': self._in_flight,
+                'db_latency_seconds': round(self._latency, 6),
+                'db_limiter_rejected_total': self._rejected
+            }
+
+
+class CircuitBreaker(object):
+    """ Fails fast while the recent error rate of requests is too high
+
+    :param error_rate: the share of failed requests that opens the circuit
+    :param window: the number of latest requests the rate is measured over
+    :param minimum_requests: the fewest requests in the window to judge on
+    :param open_seconds: how long the circuit stays open before a probe
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, error_rate=0.5, window=50, minimum_requests=20, open_seconds=5.0):
+        self.error_rate = error_rate
+        self.minimum_requests = minimum_requests
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)  # True for a failure
+        self._state = self.CLOSED
+        self._opened = 0.0
+        self._probing = False
+        self._rejected = 0
+        self._opened_total = 0
+        self._lock = threading.Lock()
+
+
+    @property
+    def state(self):
+        """ closed, half_open or open """
+        with self._lock:
+            return self._current_state()
+
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened >= self.open_seconds:
+            self._state = self.HALF_OPEN
+        return self._state
+
+
+    def allow(self):
+        """ Lets a request through or raises CircuitOpenError """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self._rejected += 1
+            retry_after = max(1, int(round(self._opened + self.open_seconds - time.monotonic())))
+            raise CircuitOpenError('Database circuit is {}'.format(state), retry_after)
+
+
+    def cancel(self):
+        """ Gives back a request that was let through but never sent """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+
+
+    def record(self, failed):
+        """ Records how a request that was let through went """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failed)
+            if self._state == self.CLOSED and len(self._outcomes) >= self.minimum_requests \
+                    and sum(self._outcomes) >= self.error_rate * len(self._outcomes):
+                self._open()
+
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened = time.monotonic()
+        self._opened_total += 1
+        self._outcomes.clear()
+
+
+    def metrics(self):
+        """ Returns the state of the breaker """
+        with self._lock:
+            state = self._current_state()
+            failures = sum(self._outcomes)
+            return {
+                'db_circuit_state': (self.CLOSED, self.HALF_OPEN, self.OPEN).index(state),
+                'db_circuit_error_rate': round(failures / len(self._outcomes), 4)
+                                         if self._outcomes else 0.0,
+                'db_circuit_opened_total': self._opened_total,
+                'db_circuit_rejected_total': self._rejected
+            }
+
+
+def is_feed(request):
+    """ Returns True if a request follows a feed, like a long poll of ``_changes`` """
+    feed = parse_qs(urlsplit(request.url).query).get('feed')
+    return bool(feed) and feed[0] in ('longpoll', 'continuous', 'eventsource')
+
+
+class GuardedAdapter(HTTPAdapter):
+    """ A requests transport adapter that sends through a limiter and a circuit breaker """
+
+    def __init__(self, limiter, breaker, **kwargs):
+        super(GuardedAdapter, self).__init__(**kwargs)
+        self.limiter = limiter
+        self.breaker = breaker
+        self._counts = {'db_requests_total': 0, 'db_throttled_total': 0,
+                        'db_failures_total': 0}
+        self._lock = threading.Lock()
+
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        kwargs['timeout'] = deadline.timeout(kwargs.get('timeout'))
+        self.breaker.allow()
+        started = None
+        if not is_feed(request):
+            try:
+                started = self.limiter.acquire(deadline.remaining())
+            except ConcurrencyLimitError:
+                self.breaker.cancel()
+                raise
+        response = None
+        exceeded = False
+        try:
+            response = super(GuardedAdapter, self).send(request, **kwargs)
+        except Timeout:
+            # a request out of time is not a sign the database is failing
+            exceeded = deadline.expired()
+            if exceeded:
+                raise deadline.DeadlineExceeded('Request deadline passed waiting for the database')
+            raise
+        finally:
+            throttled = response is not None and response.status_code == 429
+            failed = not exceeded and (response is None or throttled
+                                       or response.status_code >= 500)
+            if started is not None:
+                self.limiter.release(started, overloaded=failed)
+            if exceeded:
+                self.breaker.cancel()
+            else:
+                self.breaker.record(failed)
+            self._count(throttled, failed)
+        if throttled:
+            raise ThrottledError('Database is throttling requests',
+                                 retry_after_seconds(response.headers.get('Retry-After')))
+        return response
+
+
+    def _count(self, throttled, failed):
+        with self._lock:
+            self._counts['db_requests_total'] += 1
+            self._counts['db_throttled_total'] += throttled
+            self._counts['db_failures_total'] += failed
+
+
+    def metrics(self):
+        """ Returns the request counts with the state of the limiter and the breaker """
+        with self._lock:
+            result = dict(self._counts)
+        result.update(self.limiter.metrics())
+        result.update(self.breaker.metrics())
+        return result
+
+
+def retry_after_seconds(value, default=1):
+    """ Returns the seconds of a Retry-After header, or default if it has none """
+    try:
+        return max(1, int(float(value)))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,68 @@
+"""
+Retries with decorrelated jitter
+--------------------------------
+RetryPolicy calls a function again when it fails with an error the
+caller says is transient. The wait before each retry is drawn at random
+between the base delay and backoff times the previous wait, capped at
+max_delay ("decorrelated jitter"), so clients that failed together do
+not retry together.
+
+A retry is only made if its wait ends before the deadline of the current
+request (see service.deadline); otherwise the last error is raised
+straight away rather than spending the rest of the budget asleep.
+"""
+
+import time
+import random
+import logging
+from service import deadline
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class RetryPolicy(object):
+    """ How many times, and after how long, to retry a failed call
+
+    :param count: the most retries after the first attempt
+    :param delay: the shortest wait, in seconds
+    :param backoff: how much longer than the previous wait the next may be
+    :param max_delay: the longest wait, in seconds
+    """
+
+    def __init__(self, count=10, delay=1.0, backoff=2.0, max_delay=30.0):
+        self.count = count
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+
+
+    def delays(self):
+        """ Yields the wait before each retry """
+        delay = self.delay
+        for _ in range(self.count):
+            delay = min(self.max_delay, random.uniform(self.delay, delay * self.backoff))
+            yield delay
+
+
+    def call(self, function, retryable, *args, **kwargs):
+        """ Calls function, retrying it while it raises errors retryable returns True for
+
+        :raises: the last error once it is not retryable, the retries are used up
+            or the next wait would pass the deadline
+        """
+        delays = self.delays()
+        attempt = 1
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:  # pylint: disable=broad-except
+                if not retryable(error):
+                    raise
+                delay = next(delays, None)
+                remaining = deadline.remaining()
+                if delay is None or remaining is not None and delay >= remaining:
+                    raise
+                logger.warning('Attempt %d failed with %r, retrying in %.3f s',
+                               attempt, error, delay)
+                time.sleep(delay)
+                attempt += 1
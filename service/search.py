@@ -0,0 +1,157 @@
+"""
+In-process name search index
+----------------------------
+NameIndex answers typeahead style lookups on Supplier names without a
+database round trip:
+
+prefix(p)     names starting with p, from a sorted list and a binary search
+contains(s)   names containing s, by intersecting trigram posting lists
+similar(q)    names that look like q (typos, word order), ranked by the
+              Jaccard similarity of their padded trigrams
+
+All lookups are case-insensitive and return Supplier ids.
+"""
+
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+GRAM = 3
+
+
+def normalize(name):
+    """ Folds a name for case-insensitive matching """
+    return name.casefold() if isinstance(name, str) else ''
+
+
+def grams(text):
+    """ Returns the set of trigrams of a normalized text """
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def padded_grams(text):
+    """ Returns the trigrams of a text padded so short words and word edges count """
+    return grams('  ' + text + ' ')
+
+
+class NameIndex(object):
+    """ Prefix, substring and fuzzy lookups over Supplier names """
+
+    def __init__(self, suppliers=()):
+        self._lock = threading.Lock()
+        self._names = {}      # id -> normalized name
+        self._sorted = []     # sorted (normalized name, id) for prefix lookups
+        self._postings = {}   # padded trigram -> set of ids
+        self._sizes = {}      # id -> number of padded trigrams of the name
+        for supplier_id, name in suppliers:
+            name = normalize(name)
+            if supplier_id in self._names:
+                self._remove(supplier_id)
+            self._names[supplier_id] = name
+            name_grams = padded_grams(name)
+            self._sizes[supplier_id] = len(name_grams)
+            for gram in name_grams:
+                self._postings.setdefault(gram, set()).add(supplier_id)
+        # sort once instead of inserting every name in order
+        self._sorted = sorted((name, supplier_id) for supplier_id, name in self._names.items())
+
+
+    def __len__(self):
+        return len(self._names)
+
+
+    def add(self, supplier_id, name):
+        """ Adds a name, or replaces the name the id had """
+        with self._lock:
+            self._remove(supplier_id)
+            self._add(supplier_id, name)
+
+
+    def remove(self, supplier_id):
+        """ Removes the name of an id, if it has one """
+        with self._lock:
+            self._remove(supplier_id)
+
+
+    def _add(self, supplier_id, name):
+        name = normalize(name)
+        self._names[supplier_id] = name
+        insort(self._sorted, (name, supplier_id))
+        name_grams = padded_grams(name)
+        self._sizes[supplier_id] = len(name_grams)
+        for gram in name_grams:
+            self._postings.setdefault(gram, set()).add(supplier_id)
+
+
+    def _remove(self, supplier_id):
+        name = self._names.pop(supplier_id, None)
+        if name is None:
+            return
+        del self._sizes[supplier_id]
+        index = bisect_left(self._sorted, (name, supplier_id))
+        del self._sorted[index]
+        for gram in padded_grams(name):
+            posting = self._postings[gram]
+            posting.discard(supplier_id)
+            if not posting:
+                del self._postings[gram]
+
+
+    def prefix(self, prefix, limit=20):
+        """ Returns the ids of names starting with prefix, in name order """
+        prefix = normalize(prefix)
+        with self._lock:
+            names = self._sorted
+            index = bisect_left(names, (prefix,))
+            results = []
+            while index < len(names) and len(results) < limit \
+                    and names[index][0].startswith(prefix):
+                results.append(names[index][1])
+                index += 1
+            return results
+
+
+    def contains(self, text, limit=20):
+        """ Returns the ids of names containing text, in name order """
+        text = normalize(text)
+        wanted = grams(text)
+        with self._lock:
+            if not wanted:
+                # too short for a trigram: walk the names in order until the limit
+                results = []
+                for name, supplier_id in self._sorted:
+                    if len(results) == limit:
+                        break
+                    if text in name:
+                        results.append(supplier_id)
+                return results
+            postings = sorted((self._postings.get(gram, ()) for gram in wanted), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            names = self._names
+            matches = sorted((names[supplier_id], supplier_id) for supplier_id in candidates
+                             if text in names[supplier_id])
+        return [supplier_id for _, supplier_id in matches[:limit]]
+
+
+    def similar(self, text, limit=20, threshold=0.4):
+        """ Returns the ids of names similar to text, most similar first """
+        wanted = padded_grams(normalize(text))
+        if not wanted:
+            return []
+        # Jaccard >= threshold needs at least this many shared trigrams
+        min_shared = max(1, int(math.ceil(threshold * len(wanted))))
+        with self._lock:
+            shared = Counter()
+            for gram in wanted:
+                shared.update(self._postings.get(gram, ()))
+            sizes = self._sizes
+            scored = []
+            for supplier_id, count in shared.items():
+                if count < min_shared:
+                    continue
+                score = count / float(len(wanted) + sizes[supplier_id] - count)
+                if score >= threshold:
+                    scored.append((-score, self._names[supplier_id], supplier_id))
+        scored.sort()
+        return [supplier_id for _, _, supplier_id in scored[:limit]]
@@ -4,23 +4,50 @@ Supplier Store Service
 Paths:
 ------
 GET /suppliers - Returns a list all of the Suppliers
+GET /suppliers?ids={id},{id} - Returns the Suppliers with the given ids and the ids not found
+GET /suppliers?partition={key}&... - Runs a query inside one partition of a partitioned database
+GET /suppliers?name_prefix={text} - Returns the Suppliers whose name starts with text
+GET /suppliers?name_contains={text} - Returns the Suppliers whose name contains text
+GET /suppliers?name_like={text} - Returns the Suppliers whose name looks like text
 GET /suppliers/{id} - Returns the Supplier with a given id number
+GET /suppliers/changes?since={seq} - Streams the changes to Suppliers as Server-Sent Events
+POST /suppliers/_mget - Returns the Suppliers with the ids in the body and the ids not found
 POST /suppliers - creates a new Supplier record in the database
-PUT /suppliers/{id} - updates a Supplier record in the database
+POST /suppliers/_bulk - creates many Supplier records in the database at once
+PUT /suppliers/{id} - updates a Supplier record in the database, at the revision in If-Match
+PATCH /suppliers/{id} - changes only the fields in the body of a Supplier record in the database
 DELETE /suppliers/{id} - deletes a Supplier record in the database
 ACTION /suppliers/{id}/like - increments the like count of the Supplier
 ACTION /suppliers/{product_id}/recommend - recommend top 1 highly-rated supplier based on a given product
+POST /suppliers/recommend - recommend the top k highly-rated suppliers for each of many products
+GET /metrics - Reports requests in flight and shed, the database concurrency limit,
+               circuit breaker state and request counts
+
+Every write names itself in an X-Last-Write: {id}@{rev} response header. A
+client that sends it back on its next requests reads the primary database,
+instead of the read replica, until the replica has that revision.
 """
 
 import sys
+import time
 import uuid
+import threading
 import logging
 from functools import wraps
-from flask import jsonify, request, make_response, abort, url_for
+from flask import jsonify, request, make_response, abort, url_for, Response, g, \
+    stream_with_context
 from flask_api import status    # HTTP Status Codes
 from flask_restplus import Api, Resource, fields, reqparse, inputs, apidoc
 from werkzeug.exceptions import NotFound
-from service.models import Supplier, DataValidationError, DatabaseConnectionError
+from service.models import Supplier, DataValidationError, DatabaseConnectionError, \
+    DatabaseConflictError, check_partition, QUERY_PAGE_SIZE
+from service import admission, capture, codec, compression, deadline, profiling, \
+    validation
+from service.search import NameIndex
+from service.changes import ChangeFeed, LaggedError
+from service.cache import SupplierCache
+from service.shared_index import SharedIndex
+from service.resilience import OverloadedError
 from . import app
 
 # Error handlers require app to be initialized so we must import
@@ -39,6 +66,93 @@ authorizations = {
 # initialize DB without @app.before_first_request, to prevent nosetests using supplier DB
 Supplier.init_db("suppliers")
 
+# profile requests sent with X-Profile: 1 and the API key
+profiling.init_app(app)
+
+# record anonymized supplier traffic for replay when CAPTURE_PATH is set
+traffic_capture = capture.init_app(app)  # pylint: disable=invalid-name
+
+# negotiate gzip/deflate/br for responses and accept compressed request bodies
+compression.init_app(app)
+
+# shed expensive routes first when too many requests are in flight
+admission_control = admission.init_app(app)  # pylint: disable=invalid-name
+
+# every supplier in memory, when asked for, warmed from the snapshot file when there is one
+supplier_cache = None  # pylint: disable=invalid-name
+if app.config['SUPPLIER_CACHE']:
+    supplier_cache = SupplierCache(app.config['SNAPSHOT_PATH'])  # pylint: disable=invalid-name
+    if app.config['SNAPSHOT_PATH']:
+        supplier_cache.refresh()
+        supplier_cache.start_saving(app.config['SNAPSHOT_INTERVAL'])
+
+# one index of every supplier mapped by all the workers, kept by one of them
+shared_index = None  # pylint: disable=invalid-name
+if app.config['SHARED_INDEX_PATH']:
+    shared_index = SharedIndex(app.config['SHARED_INDEX_PATH'])  # pylint: disable=invalid-name
+    shared_index.start_updating(app.config['SHARED_INDEX_INTERVAL'])
+
+# one reader of the _changes feed per process, started by the first subscriber
+change_feed = ChangeFeed(  # pylint: disable=invalid-name
+    lambda since: Supplier.changes(since, app.config['CHANGES_POLL_TIMEOUT'])[:2],
+    app.config['CHANGES_BUFFER_SIZE'])
+
+######################################################################
+# REQUEST DEADLINE
+######################################################################
+@app.before_request
+def start_deadline():
+    """ Gives the request its time budget, from X-Request-Timeout or the default """
+    deadline.start(request_timeout(request.headers.get('X-Request-Timeout')))
+    g.deadline_started = True
+
+
+@app.after_request
+def clear_deadline_on_close(response):
+    """ Keeps the deadline until the body has been sent, which a streamed body reads under """
+    if g.pop('deadline_started', False):
+        response.call_on_close(deadline.clear)
+    return response
+
+
+@app.teardown_request
+def clear_deadline(exception=None):  # pylint: disable=unused-argument
+    """ Removes the deadline of a request without a response, so it does not follow the thread """
+    if g.pop('deadline_started', False):
+        deadline.clear()
+
+
+######################################################################
+# READ YOUR WRITES
+######################################################################
+@app.before_request
+def read_after_last_write():
+    """ Reads the primary if the replica lacks the write named in X-Last-Write """
+    last_write = request.headers.get('X-Last-Write', '')
+    if '@' in last_write:
+        supplier_id, rev = last_write.rsplit('@', 1)
+        Supplier.read_after(supplier_id, rev)
+
+
+@app.after_request
+def last_write_header(response):
+    """ Names the last write of the request, for the client to send back on its next reads """
+    last_write = Supplier.last_write()
+    if last_write:
+        response.headers['X-Last-Write'] = '{}@{}'.format(*last_write)
+    # a streamed body still reads with the routing of the request
+    response.call_on_close(Supplier.reset_routing)
+    g.routing_reset_on_close = True
+    return response
+
+
+@app.teardown_request
+def reset_routing(exception=None):  # pylint: disable=unused-argument
+    """ Forgets the writes of a request without a response so they do not follow the thread """
+    if not g.pop('routing_reset_on_close', False):
+        Supplier.reset_routing()
+
+
 ######################################################################
 # GET HOME PAGE
 ######################################################################
@@ -62,6 +176,15 @@ api = Api(app,
          )
 
 
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    """ Encodes every API response with the configured JSON codec """
+    response = make_response(codec.dumps(data), code)
+    response.headers.extend(headers or {})
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
 # Define the model so that the docs reflect what can be sent
 supplier_model = api.model('Supplier', {
     '_id': fields.String(readOnly = True,
@@ -93,6 +216,20 @@ create_model = api.model('Supplier', {
 })
 
 
+patch_model = api.model('SupplierPatch', {
+    'name': fields.String(required=False,
+                          description='The name of the Supplier'),
+    'like_count': fields.Integer(required=False,
+                                 description='The like count of the Supplier'),
+    'is_active': fields.Boolean(required=False,
+                                description='Is the Supplier active?'),
+    'rating': fields.Float(required=False,
+                           description='The rating of the Supplier'),
+    'products': fields.List(fields.Integer,required=False,
+                              description='List of products the Supplier provide')
+})
+
+
 # query string arguments
 supplier_args = reqparse.RequestParser()
 supplier_args.add_argument('name', type=str, required=False, help='List Suppliers by name')
@@ -100,6 +237,38 @@ supplier_args.add_argument('like_count', type=int, required=False, help='List Su
 supplier_args.add_argument('is_active', type=bool, required=False, help='List Suppliers by is_active')
 supplier_args.add_argument('rating', type=float, required=False, help='List Suppliers by rating')
 supplier_args.add_argument('product_id', type=int, required=False, help='List Suppliers by product_id')
+supplier_args.add_argument('rating_min', type=float, required=False,
+                           help='List Suppliers with a rating of at least rating_min')
+supplier_args.add_argument('rating_max', type=float, required=False,
+                           help='List Suppliers with a rating of at most rating_max')
+supplier_args.add_argument('like_min', type=int, required=False,
+                           help='List Suppliers with a like_count of at least like_min')
+supplier_args.add_argument('like_max', type=int, required=False,
+                           help='List Suppliers with a like_count of at most like_max')
+supplier_args.add_argument('ids', type=str, required=False,
+                           help='List Suppliers by a comma separated list of ids')
+supplier_args.add_argument('name_prefix', type=str, required=False,
+                           help='List Suppliers whose name starts with name_prefix')
+supplier_args.add_argument('name_contains', type=str, required=False,
+                           help='List Suppliers whose name contains name_contains')
+supplier_args.add_argument('name_like', type=str, required=False,
+                           help='List Suppliers whose name looks like name_like, best match first')
+supplier_args.add_argument('limit', type=int, required=False,
+                           help='The most Suppliers a name search returns')
+supplier_args.add_argument('partition', type=str, required=False,
+                           help='Query only the Suppliers of this partition')
+
+mget_model = api.model('SupplierIds', {
+    'ids': fields.List(fields.String, required=True,
+                       description='The ids of the Suppliers to retrieve')
+})
+
+recommend_model = api.model('RecommendRequest', {
+    'products': fields.List(fields.Integer, required=True,
+                            description='The products to recommend Suppliers for'),
+    'k': fields.Integer(required=False, default=1,
+                        description='The number of Suppliers to recommend per product')
+})
 
 
 ######################################################################
@@ -110,11 +279,26 @@ def request_validation_error(error):
     """ Handles Value Errors from bad data """
     message = str(error)
     app.logger.error(message)
-    return {
+    body = {
         'status_code': status.HTTP_400_BAD_REQUEST,
         'error': 'Bad Request',
         'message': message
-    }, status.HTTP_400_BAD_REQUEST
+    }
+    if error.errors:
+        body['errors'] = error.errors
+    return body, status.HTTP_400_BAD_REQUEST
+
+
+@api.errorhandler(DatabaseConflictError)
+def database_conflict_error(error):
+    """ Handles writes made against a stale revision """
+    message = str(error)
+    app.logger.warning(message)
+    return {
+        'status_code': status.HTTP_412_PRECONDITION_FAILED,
+        'error': 'Precondition Failed',
+        'message': message
+    }, status.HTTP_412_PRECONDITION_FAILED
 
 
 @api.errorhandler(DatabaseConnectionError)
@@ -129,6 +313,30 @@ def database_connection_error(error):
     }, status.HTTP_503_SERVICE_UNAVAILABLE
 
 
+@api.errorhandler(deadline.DeadlineExceeded)
+def deadline_exceeded_error(error):
+    """ Handles requests that ran out of time waiting for the database """
+    message = str(error)
+    app.logger.warning(message)
+    return {
+        'status_code': status.HTTP_504_GATEWAY_TIMEOUT,
+        'error': 'Gateway Timeout',
+        'message': message
+    }, status.HTTP_504_GATEWAY_TIMEOUT
+
+
+@api.errorhandler(OverloadedError)
+def database_overloaded_error(error):
+    """ Handles requests refused to protect an overloaded database """
+    message = str(error)
+    app.logger.warning(message)
+    return {
+        'status_code': status.HTTP_503_SERVICE_UNAVAILABLE,
+        'error': 'Service Unavailable',
+        'message': message
+    }, status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': str(error.retry_after)}
+
+
 ######################################################################
 # Authorization Decorator
 ######################################################################
@@ -163,6 +371,17 @@ def healthcheck():
     return make_response(jsonify(status=200, message='Healthy'), status.HTTP_200_OK)
 
 
+######################################################################
+# GET METRICS
+######################################################################
+@app.route('/metrics')
+def metrics():
+    """ Reports admission control and database guard state in the Prometheus text format """
+    values = dict(Supplier.adapter.metrics(), **admission_control.metrics())
+    lines = ['{} {}'.format(name, value) for name, value in sorted(values.items())]
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain')
+
+
 ######################################################################
 # GET API DOCS
 ######################################################################
@@ -183,6 +402,7 @@ class SupplierResource(Resource):
     Allows the manipulation of a single Supplier
     GET /suppliers/{id} - Returns a Supplier with the id
     PUT /suppliers/{id} - Update a Supplier with the id
+    PATCH /suppliers/{id} - Change some fields of a Supplier with the id
     DELETE /suppliers/{id} -  Deletes a Supplier with the id
     """
 
@@ -201,7 +421,7 @@ class SupplierResource(Resource):
         supplier = Supplier.find(supplier_id)
         if not supplier:
             api.abort(status.HTTP_404_NOT_FOUND, "Supplier with id '{}' was not found.".format(supplier_id))
-        return supplier.serialize(), status.HTTP_200_OK
+        return supplier.serialize(), status.HTTP_200_OK, etag_header(supplier)
 
 
     #------------------------------------------------------------------
@@ -210,28 +430,74 @@ class SupplierResource(Resource):
     @api.doc('update_suppliers', security='apikey')
     @api.response(404, 'Supplier not found')
     @api.response(400, 'The posted Supplier data was not valid')
+    @api.response(412, 'The Supplier was changed since the given revision')
     @api.expect(supplier_model)
     # @api.marshal_with(supplier_model)
     def put(self, supplier_id):
         """
         Update a supplier
-        This endpoint will update a Supplier based the body that is posted
+        This endpoint will update a Supplier based the body that is posted.
+        If the revision is sent in an If-Match header or as _rev in the body
+        the Supplier is written in one step and a stale revision returns 412,
+        or 404 if there is no Supplier with that id.
         """
         app.logger.info('Request to Update a supplier with id [%s]', supplier_id)
         check_content_type('application/json')
-        supplier = Supplier.find(supplier_id)
-        if not supplier:
-            return api.abort(status.HTTP_404_NOT_FOUND, "Supplier with id '{}' not found".format(supplier_id))
+        data = validation.validate(get_json_body())
+        rev = request.headers.get('If-Match', '').strip('"') or data.get('_rev')
 
-        data = request.get_json()
-        # Data type transfer
-        data = data_type_transfer(data)
+        if rev and rev != '*':
+            supplier = Supplier()
+            supplier.id = supplier_id
+        else:
+            supplier = Supplier.find(supplier_id, replica=False)
+            if not supplier:
+                return api.abort(status.HTTP_404_NOT_FOUND, "Supplier with id '{}' not found".format(supplier_id))
 
         app.logger.info(data)
         supplier.deserialize(data)
         supplier.id = supplier_id
-        supplier.save()
-        return supplier.serialize(), status.HTTP_200_OK
+        if rev and rev != '*':
+            supplier.rev = rev
+        try:
+            supplier.save()
+        except DatabaseConflictError:
+            # the database refuses a revision of a missing Supplier the same way
+            if Supplier.find(supplier_id, replica=False) is None:
+                return api.abort(status.HTTP_404_NOT_FOUND, "Supplier with id '{}' not found".format(supplier_id))
+            raise
+        index_name(supplier.id, supplier.name)
+        return supplier.serialize(), status.HTTP_200_OK, etag_header(supplier)
+
+
+    #------------------------------------------------------------------
+    # CHANGE SOME FIELDS OF A SUPPLIER
+    #------------------------------------------------------------------
+    @api.doc('patch_suppliers', security='apikey')
+    @api.response(404, 'Supplier not found')
+    @api.response(400, 'The posted fields were not valid')
+    @api.response(412, 'The Supplier was changed since the given revision')
+    @api.expect(patch_model)
+    def patch(self, supplier_id):
+        """
+        Change some fields of a Supplier
+        This endpoint will send only the fields in the body to the database,
+        which changes them in the stored Supplier in one step. If the revision
+        is sent in an If-Match header or as _rev in the body a stale revision
+        returns 412.
+        """
+        app.logger.info('Request to Patch a supplier with id [%s]', supplier_id)
+        check_content_type('application/json')
+        data = validation.validate_partial(get_json_body())
+        rev = request.headers.get('If-Match', '').strip('"') or data.pop('_rev', None)
+        data.pop('_rev', None)
+
+        supplier = Supplier.patch(supplier_id, data, rev if rev != '*' else None)
+        if not supplier:
+            return api.abort(status.HTTP_404_NOT_FOUND, "Supplier with id '{}' not found".format(supplier_id))
+        if 'name' in data:
+            index_name(supplier.id, supplier.name)
+        return supplier.serialize(), status.HTTP_200_OK, etag_header(supplier)
 
 
     #------------------------------------------------------------------
@@ -245,9 +511,10 @@ class SupplierResource(Resource):
         This endpoint will delete a Supplier based the id specified in the path
         """
         app.logger.info('Request to Delete a Supplier with id [%s]', supplier_id)
-        supplier = Supplier.find(supplier_id)
+        supplier = Supplier.find(supplier_id, replica=False)
         if supplier:
             supplier.delete()
+            index_name(supplier_id)
             app.logger.info("Supplier with ID [%s] delete complete.", supplier_id)
         else:
             app.logger.info("Supplier with ID [%s] does not exist.", supplier_id)
@@ -276,30 +543,66 @@ class SupplierCollection(Resource):
         rating = request.args.get('rating')
         product_id = request.args.get('product_id')
         like_count = request.args.get('like_count')
+        ids = request.args.get('ids')
+        name_prefix = request.args.get('name_prefix')
+        name_contains = request.args.get('name_contains')
+        name_like = request.args.get('name_like')
+        partition = get_partition_arg()
+        rating_min = get_number_arg('rating_min', float)
+        rating_max = get_number_arg('rating_max', float)
+        like_min = get_number_arg('like_min', int)
+        like_max = get_number_arg('like_max', int)
 
-        if name:
+        if ids:
+            supplier_ids = [supplier_id for supplier_id in ids.split(',') if supplier_id]
+            app.logger.info('Find suppliers by ids: %s', supplier_ids)
+            suppliers, missing = find_many(supplier_ids)
+            results = [supplier.serialize() for supplier in suppliers]
+            app.logger.info("Returning %d suppliers, %d missing", len(results), len(missing))
+            return {'suppliers': results, 'missing': missing}, status.HTTP_200_OK
+        elif name:
             app.logger.info('Find suppliers by name: %s', name)
-            suppliers = Supplier.find_by_name(name)
+            suppliers = Supplier.find_by_name(name, partition)
+        elif name_prefix:
+            app.logger.info('Find suppliers by name prefix: %s', name_prefix)
+            suppliers = Supplier.find_by_name_prefix(name_prefix, get_search_limit(),
+                                                   partition)
+        elif name_contains:
+            app.logger.info('Find suppliers with a name containing: %s', name_contains)
+            suppliers, _ = find_many(get_name_index().contains(name_contains, get_search_limit()))
+        elif name_like:
+            app.logger.info('Find suppliers with a name like: %s', name_like)
+            suppliers, _ = find_many(get_name_index().similar(name_like, get_search_limit()))
         elif like_count:
             app.logger.info('Find suppliers with rating greater than: %s', rating)
             like_count = int(like_count)
-            suppliers = Supplier.find_by_greater("like_count", like_count)
+            suppliers = Supplier.find_by_greater("like_count", like_count, partition)
+        elif rating_min is not None or rating_max is not None:
+            app.logger.info('Find suppliers with rating between %s and %s', rating_min, rating_max)
+            suppliers = Supplier.find_by_range("rating", rating_min, rating_max, partition)
+        elif like_min is not None or like_max is not None:
+            app.logger.info('Find suppliers with like_count between %s and %s', like_min, like_max)
+            suppliers = Supplier.find_by_range("like_count", like_min, like_max, partition)
         elif is_active:
             app.logger.info('Find suppliers by is_active: %s', is_active)
             is_active = (is_active == 'true')
-            suppliers = Supplier.find_by_is_active(is_active)
+            suppliers = Supplier.find_by_is_active(is_active, partition)
         elif rating:
             app.logger.info('Find suppliers with rating greater than: %s', rating)
             rating = float(rating)
-            suppliers = Supplier.find_by_greater("rating", rating)
+            suppliers = Supplier.find_by_greater("rating", rating, partition)
         elif product_id:
             app.logger.info('Find suppliers containing product with id %s in their products',
                             product_id)
             product_id = int(product_id)
-            suppliers = [supplier for supplier in Supplier.all() if product_id in supplier.products]
+            suppliers = suppliers_with_product(product_id, partition)
         else:
             app.logger.info('Find all suppliers')
-            suppliers = Supplier.all()
+            if partition or not (shared_index or supplier_cache):
+                # nothing in memory to list them from: stream them a batch at a time
+                return stream_suppliers(Supplier.iterate(
+                    partition, replica=not Supplier.reading_own_writes()))
+            suppliers = all_suppliers(partition)
 
         app.logger.info('[%s] Suppliers returned', len(suppliers))
         results = [supplier.serialize() for supplier in suppliers]
@@ -325,29 +628,107 @@ class SupplierCollection(Resource):
         # Check for form submission data
         if request.headers.get('Content-Type') == 'application/x-www-form-urlencoded':
             app.logger.info('Getting data from form submit')
-            data = {
-                "name": request.form['name'],
-                "like_count": request.form['like_count'],
-                "is_active": request.form['is_active'],
-                "products": request.form['products'],
-                "rating": request.form['rating']
-            }
+            data = validation.validate(request.form.to_dict())
         else:
             check_content_type('application/json')
             app.logger.info('Getting json data from API call')
-            data = request.get_json()
-            # Data type transfer
-            data = data_type_transfer(data)
+            data = validation.validate(get_json_body())
 
         app.logger.info(data)
-        supplier = Supplier()
+        supplier = Supplier(partition=get_partition_arg())
         supplier.deserialize(data)
         supplier.save()
+        index_name(supplier.id, supplier.name)
         app.logger.info('Supplier with new id [%s] saved!', supplier.id)
         location_url = api.url_for(SupplierResource, supplier_id=supplier.id, _external=True)
         return supplier.serialize(), status.HTTP_201_CREATED, {'Location': location_url}
 
 
+######################################################################
+# PATH: /suppliers/_bulk
+######################################################################
+@api.route('/suppliers/_bulk')
+class SupplierBulk(Resource):
+    """ Creates many Suppliers in a single call """
+    @api.doc('bulk_create_suppliers', security='apikey')
+    @api.expect([create_model])
+    @api.response(400, 'The posted data was not valid')
+    @api.response(201, 'Suppliers created')
+    def post(self):
+        """
+        Creates many Suppliers
+        This endpoint will validate every Supplier in the posted list and then create them
+        all with one database request. Nothing is created if any of them is invalid.
+        """
+        check_content_type('application/json')
+        data = get_json_body()
+        if isinstance(data, list) and len(data) > app.config['BULK_MAX_DOCS']:
+            raise DataValidationError('Invalid request: at most {} suppliers may be posted'
+                                      .format(app.config['BULK_MAX_DOCS']))
+        partition = get_partition_arg()
+        suppliers = [Supplier(partition=partition).deserialize(item)
+                     for item in validation.validate_many(data)]
+        app.logger.info('Request to Create %d suppliers', len(suppliers))
+        results = Supplier.create_many(suppliers)
+        for supplier in suppliers:
+            if supplier.id:
+                index_name(supplier.id, supplier.name)
+        return [dict(supplier.serialize(), error=result['error'])
+                if 'error' in result else supplier.serialize()
+                for supplier, result in zip(suppliers, results)], status.HTTP_201_CREATED
+
+
+######################################################################
+# PATH: /suppliers/changes
+######################################################################
+@api.route('/suppliers/changes')
+class SupplierChanges(Resource):
+    """ Streams the changes made to Suppliers """
+    @api.doc('stream_supplier_changes', params={
+        'since': 'The sequence of the last change seen, 0 for every change'})
+    @api.produces(['text/event-stream'])
+    def get(self):
+        """
+        Streams Supplier changes as Server-Sent Events
+        Every event carries the sequence of the change as its id, so a client can resume
+        after it with the since query string argument or the Last-Event-ID header.
+        Changes may be repeated once around a resume but are never skipped.
+        """
+        since = request.args.get('since') or request.headers.get('Last-Event-ID')
+        app.logger.info('Request to stream Supplier changes since %s', since)
+        change_feed.start()
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(stream_changes(change_feed, since, app.config['CHANGES_HEARTBEAT'],
+                                       app.config['CHANGES_STREAM_SECONDS']),
+                        mimetype='text/event-stream', headers=headers)
+
+
+######################################################################
+# PATH: /suppliers/_mget
+######################################################################
+@api.route('/suppliers/_mget')
+class SupplierMultiGet(Resource):
+    """ Retrieves many Suppliers by id in a single call """
+    @api.doc('mget_suppliers')
+    @api.expect(mget_model)
+    @api.response(400, 'The posted ids were not valid')
+    def post(self):
+        """
+        Retrieve many Suppliers
+        This endpoint will return the Suppliers with the ids in the body and the ids not found
+        """
+        check_content_type('application/json')
+        data = get_json_body()
+        if not isinstance(data, dict) or not isinstance(data.get('ids'), list):
+            raise DataValidationError('Invalid request: body must contain a list of ids')
+        app.logger.info('Request to Retrieve %d suppliers by id', len(data['ids']))
+        suppliers, missing = find_many(data['ids'])
+        return {
+            'suppliers': [supplier.serialize() for supplier in suppliers],
+            'missing': missing
+        }, status.HTTP_200_OK
+
+
 ######################################################################
 # PATH: /suppliers/{supplier_id}/like
 ######################################################################
@@ -360,7 +741,7 @@ class SupplierLike(Resource):
         Like a single Supplier
         This endpoint will update the like_count of the Supplier based on it's id in the database
         """
-        supplier = Supplier.find(supplier_id)
+        supplier = Supplier.find(supplier_id, replica=False)
         if not supplier:
             raise NotFound("Supplier with id '{}' was not found.".format(supplier_id))
         supplier.like_count += 1
@@ -384,12 +765,10 @@ class SupplierRecommend(Resource):
                         product_id)
         product_id = int(product_id)
 
-        # retrieve all suppliers including this product first
-        suppliers = [supplier for supplier in Supplier.all() if product_id in supplier.products and supplier.is_active == True]
-
-        # get top 1 rated supplier, None if suppliers is empty
+        # get top 1 rated active supplier, None if no supplier provides the product
+        suppliers = recommend([product_id], 1)[product_id]
         if suppliers:
-            res_supplier = max(suppliers, key=lambda x: x.rating).serialize()
+            res_supplier = suppliers[0].serialize()
             app.logger.info('Recommended supplier is: {}'.format(res_supplier))
         else:
             res_supplier = []
@@ -398,6 +777,41 @@ class SupplierRecommend(Resource):
         return res_supplier, status.HTTP_200_OK
 
 
+######################################################################
+# PATH: /suppliers/recommend
+######################################################################
+@api.route('/suppliers/recommend')
+class SupplierRecommendBatch(Resource):
+    @api.doc('recommend_suppliers_batch')
+    @api.expect(recommend_model)
+    @api.response(400, 'The posted products were not valid')
+    def post(self):
+        """
+        Recommend Suppliers for many products
+        This endpoint will recommend the top k highly-rated active suppliers for each given product
+        """
+        check_content_type('application/json')
+        data = get_json_body()
+        if not isinstance(data, dict) or not isinstance(data.get('products'), list):
+            raise DataValidationError('Invalid request: body must contain a list of products')
+        try:
+            product_ids = [int(product_id) for product_id in data['products']]
+            k = int(data.get('k', 1))
+        except (TypeError, ValueError):
+            raise DataValidationError('Invalid request: products and k must be integers')
+        if k < 1:
+            raise DataValidationError('Invalid request: k must be at least 1')
+        if len(product_ids) > app.config['RECOMMEND_MAX_PRODUCTS']:
+            raise DataValidationError('Invalid request: at most {} products may be requested'
+                                      .format(app.config['RECOMMEND_MAX_PRODUCTS']))
+        app.logger.info('Recommend top %d suppliers for products %s', k, product_ids)
+        recommendations = recommend(product_ids, k, get_partition_arg())
+        return [{
+            'product_id': product_id,
+            'suppliers': [supplier.serialize() for supplier in suppliers]
+        } for product_id, suppliers in recommendations.items()], status.HTTP_200_OK
+
+
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
@@ -405,20 +819,213 @@ class SupplierRecommend(Resource):
 def data_reset():
     """ Removes all Suppliers from the database """
     Supplier.remove_all()
+    with name_index_lock:
+        name_index['index'] = None
+
+
+# the name index is built on first use and rebuilt once it is NAME_INDEX_TTL old
+name_index = {'index': None, 'built': 0.0}  # pylint: disable=invalid-name
+name_index_lock = threading.Lock()  # pylint: disable=invalid-name
 
 
-def data_type_transfer(data):
-    """ Transfer string fields in submitted json data if necessary """
-    if isinstance(data['is_active'], str):
-        data['is_active'] = data['is_active'] in ["true", "True", "1"]
-    if data['like_count']: data['like_count'] = int(data['like_count'])
-    if isinstance(data['products'], str):
-        if data['products']:
-            data['products'] = [int(i) for i in data['products'].split(',') if i]
+def get_name_index():
+    """ Returns the in-process name index, building it if it is missing or stale """
+    with name_index_lock:
+        if name_index['index'] is None \
+                or time.monotonic() - name_index['built'] > app.config['NAME_INDEX_TTL']:
+            app.logger.info('Building the name index')
+            name_index['index'] = NameIndex((supplier.id, supplier.name)
+                                            for supplier in all_suppliers())
+            name_index['built'] = time.monotonic()
+        return name_index['index']
+
+
+def index_name(supplier_id, name=None):
+    """ Keeps a built name index up to date with a write made by this process """
+    index = name_index['index']
+    if index is None:
+        return
+    if name is None:
+        index.remove(supplier_id)
+    else:
+        index.add(supplier_id, name)
+
+
+def all_suppliers(partition=None):
+    """ Returns every Supplier: from the shared index or cache when there is one, else, or for
+    a partition or a request that must see its own writes, from the database
+    """
+    if partition or Supplier.reading_own_writes():
+        return Supplier.all(partition)
+    suppliers = shared_index.suppliers() if shared_index else None
+    if suppliers is None:
+        suppliers = supplier_cache.suppliers() if supplier_cache else Supplier.all()
+    return suppliers
+
+
+def suppliers_with_product(product_id, partition=None):
+    """ Returns the Suppliers that provide a product """
+    suppliers = shared_index.with_product(product_id) \
+        if shared_index and not partition and not Supplier.reading_own_writes() else None
+    if suppliers is None:
+        suppliers = [supplier for supplier in all_suppliers(partition)
+                     if supplier.has_product(product_id)]
+    return suppliers
+
+
+def recommend(product_ids, k, partition=None):
+    """ Recommends the top k Suppliers of each product, from the shared index if there is one """
+    recommendations = shared_index.recommend(product_ids, k) \
+        if shared_index and not partition and not Supplier.reading_own_writes() else None
+    if recommendations is None:
+        recommendations = Supplier.recommend(product_ids, k, partition)
+    return recommendations
+
+
+def request_timeout(header):
+    """ Returns the seconds a request may take given its X-Request-Timeout header """
+    if header:
+        try:
+            seconds = float(header)
+        except ValueError:
+            app.logger.info('Ignoring bad X-Request-Timeout: %s', header)
         else:
-            data['products'] = []
-    if data['rating']: data['rating'] = float(data['rating'])
-    return data
+            if seconds > 0:
+                return min(seconds, app.config['REQUEST_TIMEOUT_MAX'])
+    return app.config['REQUEST_TIMEOUT']
+
+
+def get_search_limit():
+    """ Returns the limit query string argument of a name search """
+    limit = get_number_arg('limit', int)
+    if limit is None:
+        return app.config['NAME_SEARCH_LIMIT']
+    if limit < 1:
+        raise DataValidationError('Invalid request: limit must be at least 1')
+    return limit
+
+
+def stream_suppliers(suppliers):
+    """ Returns a response that encodes Suppliers as a JSON list as they are read
+
+    Only a batch of them is in memory at a time. The first one is read before
+    the response starts, so a database error still gets its error response.
+    The rest are read in the request context, under its deadline and routing,
+    and the request holds its admission slot until the body is closed.
+    """
+    suppliers = iter(suppliers)
+    first = next(suppliers, None)
+
+    def encode():
+        if first is None:
+            yield b'[]'
+            return
+        yield b'[' + codec.dumps(first.serialize())
+        for supplier in suppliers:
+            yield b',' + codec.dumps(supplier.serialize())
+        yield b']'
+
+    return Response(stream_with_context(encode()), mimetype='application/json')
+
+
+def change_event(seq, change):
+    """ Formats a change as a Server-Sent Event """
+    return 'id: {}\nevent: change\ndata: {}\n\n'.format(seq, codec.dumps(change).decode('utf8'))
+
+
+def start_event(seq):
+    """ Formats the sequence a stream starts after as a Server-Sent Event """
+    data = codec.dumps({'seq': seq}).decode('utf8')
+    return 'id: {}\nevent: start\ndata: {}\n\n'.format(seq, data)
+
+
+def stream_changes(feed, since, heartbeat, duration):
+    """ Yields the changes after since, then the live changes, as Server-Sent Events
+
+    A stream without since starts with a start event whose id is the current
+    sequence, so a client that reconnects before any change resumes from it.
+
+    A since that is no longer buffered by the feed is caught up from the
+    database first, and the live changes follow on from the sequence the
+    catch up ended at. The stream ends after duration seconds, or when the
+    client falls behind the feed, and the client reconnects from its last id.
+    """
+    deadline = time.monotonic() + duration
+    position = feed.position()
+    if since in (None, 'now'):
+        position, since = feed.head()
+        if since == 'now':
+            # the feed has not been read yet, ask the database where it is
+            _, since, _ = Supplier.changes('now')
+        yield start_event(since)
+    else:
+        buffered = feed.find(since)
+        if buffered is None:
+            pending = True
+            while pending:
+                changes, last_seq, pending = Supplier.changes(since, limit=QUERY_PAGE_SIZE)
+                for seq, change in changes:
+                    yield change_event(seq, change)
+                pending = pending and last_seq != since
+                since = last_seq
+            # the live feed goes on after the sequence the catch up stopped at,
+            # or from where it stood before the catch up if that is not buffered
+            buffered = feed.find(since)
+        if buffered is not None:
+            position = buffered
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        try:
+            entries = feed.wait(position, min(heartbeat, remaining))
+        except LaggedError:
+            app.logger.info('Change stream subscriber fell behind, closing the stream')
+            return
+        if not entries:
+            yield ': keep-alive\n\n'
+        for position, seq, change in entries:
+            yield change_event(seq, change)
+
+
+def find_many(supplier_ids):
+    """ Looks up many Suppliers at once, rejecting oversized requests """
+    if len(supplier_ids) > app.config['MGET_MAX_IDS']:
+        raise DataValidationError('Invalid request: at most {} ids may be requested'
+                                  .format(app.config['MGET_MAX_IDS']))
+    return Supplier.find_many(supplier_ids)
+
+
+def etag_header(supplier):
+    """ Returns the ETag header that carries the revision of a Supplier """
+    return {'ETag': '"{}"'.format(supplier.rev)} if supplier.rev else {}
+
+
+def get_partition_arg():
+    """ Returns the partition query string argument, or None if it was not given """
+    partition = request.args.get('partition')
+    if not partition:
+        return None
+    return check_partition(partition)
+
+
+def get_number_arg(name, number_type):
+    """ Returns a numeric query string argument, or None if it was not given """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return number_type(value)
+    except ValueError:
+        raise DataValidationError('Invalid request: {} must be a number'.format(name))
+
+
+def get_json_body():
+    """ Decodes the JSON request body with the configured codec """
+    try:
+        return codec.loads(request.get_data())
+    except ValueError:
+        raise DataValidationError('Invalid request: body is not valid JSON')
 
 
 def check_content_type(content_type):
@@ -0,0 +1,288 @@
+"""
+Supplier index shared by every worker process
+---------------------------------------------
+With SHARED_INDEX_PATH set, one worker keeps an index of every Supplier
+in a file, from the ``_changes`` feed, and every worker memory maps it.
+The pages of the file are shared through the page cache, so N workers
+hold one copy instead of N and always agree on what it says.
+The list, the product query and recommend are answered from the mapping
+without copying it into Python objects first. Only the matching
+documents are decoded. Reads of one Supplier by id are not: the index
+lags the database by up to the update interval, and a client reading
+back its own write or delete must see it. (Python 3.7 has no multiprocessing.shared_memory;
+a memory mapped file is what it is built on.)
+
+A segment names the database it was read from, and readers ignore one
+of any other database. A segment file is never changed once written. The updater writes a new
+one next to it and renames it over the old one. Readers take no lock:
+before a lookup they check whether the path names a new file and map it
+if so. A reader halfway through a lookup keeps the mapping it started
+with.
+
+Which worker updates is settled with an exclusive flock on a lock file
+next to the index. The worker holding it updates, and the others retry
+taking it every interval, so another worker takes over if that one
+exits.
+
+Layout, version 1 (every array in native byte order, padded to 8 bytes):
+
+header     magic b'SUPIDX01', byte order, uint32 Suppliers, uint32 products
+strings    sequence (as JSON), database url
+ids        uint64 offsets and UTF-8 text of the ids, in id order
+documents  uint64 offsets and JSON text of each Supplier, in id order
+products   int64 product ids in order, then for each product the rows of
+           the Suppliers that provide it (uint64 offsets, uint32 rows) and
+           the rows of the active ones best rated first (same again)
+"""
+
+import os
+import sys
+import time
+import mmap
+import fcntl
+import json
+import struct
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from service import codec
+from service.products import ProductSet
+from service.models import Supplier
+from service.cache import SupplierCache
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MAGIC = b'SUPIDX01'
+BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+_HEADER = struct.Struct('<8sBII')
+_LENGTH = struct.Struct('<Q')
+
+
+class SegmentError(Exception):
+    """ A segment file is truncated or not a segment of this version """
+
+
+def _rating(document):
+    """ Returns the rating of a document for ordering, unrated documents last """
+    rating = document.get('rating')
+    return rating if isinstance(rating, (int, float)) else float('-inf')
+
+
+def _pack(data, out):
+    out.append(_LENGTH.pack(len(data)))
+    out.append(data)
+    out.append(b'\0' * (-len(data) % 8))
+
+
+def _pack_texts(texts, out):
+    offsets = array('Q', [0])
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+    _pack(offsets.tobytes(), out)
+    _pack(b''.join(texts), out)
+
+
+def _pack_postings(postings, out):
+    offsets = array('Q', [0])
+    rows = array('I')
+    for posting in postings:
+        rows.extend(posting)
+        offsets.append(len(rows))
+    _pack(offsets.tobytes(), out)
+    _pack(rows.tobytes(), out)
+
+
+def dumps(seq, database, documents):
+    """ Encodes documents, in id order, as a segment """
+    providers = {}
+    for row, document in enumerate(documents):
+        for product_id in ProductSet(document.get('products') or ()):
+            providers.setdefault(product_id, []).append(row)
+    product_ids = sorted(providers)
+    active = [sorted((row for row in providers[product_id]
+                      if documents[row].get('is_active') is True),
+                     key=lambda row: -_rating(documents[row]))
+              for product_id in product_ids]
+    out = [_HEADER.pack(MAGIC, BYTE_ORDER, len(documents), len(product_ids))]
+    _pack_texts([json.dumps(seq).encode('utf8'), database.encode('utf8')], out)
+    _pack_texts([document['_id'].encode('utf8') for document in documents], out)
+    _pack_texts([codec.dumps(document) for document in documents], out)
+    _pack(array('q', product_ids).tobytes(), out)
+    _pack_postings((providers[product_id] for product_id in product_ids), out)
+    _pack_postings(active, out)
+    return b''.join(out)
+
+
+def write(path, seq, database, documents):
+    """ Writes a segment file and renames it over the old one """
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as segment:
+        segment.write(dumps(seq, database, documents))
+    os.replace(temporary, path)
+
+
+class Segment(object):
+    """ A memory mapped segment, read in place """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        magic, byte_order, self.count, products = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise SegmentError('Not a supplier index segment of version 1')
+        if byte_order != BYTE_ORDER:
+            raise SegmentError('Segment was written with the other byte order')
+        self._offset = _HEADER.size
+        seq, database = self._texts(2)
+        self.seq = json.loads(seq)
+        self.database = database.decode('utf8')
+        self._id_offsets, self._ids = self._blob('Q'), self._blob()
+        self._document_offsets, self._documents = self._blob('Q'), self._blob()
+        self._product_ids = self._blob('q')
+        self._provider_offsets, self._providers = self._blob('Q'), self._blob('I')
+        self._active_offsets, self._active = self._blob('Q'), self._blob('I')
+        if len(self._id_offsets) != self.count + 1 or len(self._product_ids) != products:
+            raise SegmentError('Segment sections do not match its header')
+
+    def _blob(self, typecode=None):
+        length, = _LENGTH.unpack_from(self._buffer, self._offset)
+        start = self._offset + _LENGTH.size
+        self._offset = start + length + (-length % 8)
+        if start + length > len(self._buffer):
+            raise SegmentError('Truncated segment')
+        view = self._view[start:start + length]
+        return view.cast(typecode) if typecode else view
+
+    def _texts(self, count):
+        offsets, text = self._blob('Q'), self._blob()
+        return [bytes(text[offsets[i]:offsets[i + 1]]) for i in range(count)]
+
+    def document(self, row):
+        """ Returns the document of a row """
+        return codec.loads(bytes(self._documents[self._document_offsets[row]:
+                                                 self._document_offsets[row + 1]]))
+
+    def documents(self):
+        """ Yields every document in id order """
+        for row in range(self.count):
+            yield self.document(row)
+
+    def _rows(self, offsets, rows, product_id):
+        index = bisect_left(self._product_ids, product_id)
+        if index == len(self._product_ids) or self._product_ids[index] != product_id:
+            return self._providers[0:0]
+        return rows[offsets[index]:offsets[index + 1]]
+
+    def with_product(self, product_id):
+        """ Returns the documents that provide a product, in id order """
+        return [self.document(row)
+                for row in self._rows(self._provider_offsets, self._providers, product_id)]
+
+    def best_active(self, product_id, k):
+        """ Returns the k best rated active documents that provide a product """
+        return [self.document(row)
+                for row in self._rows(self._active_offsets, self._active, product_id)[:k]]
+
+
+class SharedIndex(object):
+    """ Lock-free reader, and possibly the updater, of a segment file
+
+    :param path: the segment file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._segment = None
+        self._identity = None
+        self._thread = None
+
+    def segment(self):
+        """ Returns the latest segment, or None if there is none yet
+
+        A segment of another database, like one left behind by a run against
+        a test database, is ignored until the updater replaces it.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        if identity != self._identity:
+            try:
+                with open(self.path, 'rb') as segment:
+                    buffer = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+                segment = Segment(buffer)
+            except (OSError, ValueError, struct.error, SegmentError) as error:
+                logger.warning('Cannot map the supplier index %s: %s', self.path, error)
+                return self._segment
+            if segment.database != Supplier.database.database_url:
+                logger.warning('Ignoring the supplier index %s of another database %s',
+                               self.path, segment.database)
+                segment = None
+            self._segment = segment
+            self._identity = identity
+        return self._segment
+
+    def suppliers(self):
+        """ Returns every Supplier in id order, or None if there is no index yet """
+        segment = self.segment()
+        if segment is None:
+            return None
+        return [Supplier.from_document(document) for document in segment.documents()]
+
+    def with_product(self, product_id):
+        """ Returns the Suppliers that provide a product, or None if there is no index yet """
+        segment = self.segment()
+        if segment is None:
+            return None
+        return [Supplier.from_document(document)
+                for document in segment.with_product(product_id)]
+
+    def recommend(self, product_ids, k=1):
+        """ Like Supplier.recommend, or None if there is no index yet """
+        segment = self.segment()
+        if segment is None:
+            return None
+        return {product_id: [Supplier.from_document(document)
+                             for document in segment.best_active(product_id, k)]
+                for product_id in dict.fromkeys(product_ids)}
+
+    def start_updating(self, interval):
+        """ Updates the segment from a background thread while this process holds the lock """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,),
+                                            name='shared-index', daemon=True)
+            self._thread.start()
+
+    def _run(self, interval):
+        lock = open(self.path + '.lock', 'a')
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                time.sleep(interval)
+                continue
+            logger.info('Updating the supplier index %s from this process', self.path)
+            cache = SupplierCache()
+            written = None
+            while True:
+                try:
+                    written = self.update(cache, written)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Updating the supplier index failed')
+                time.sleep(interval)
+
+    def update(self, cache, written=None):
+        """ Writes a new segment if the cache moved past the sequence last written
+
+        :return: the sequence of the latest segment
+        """
+        seq, suppliers = cache.current()
+        if seq == written and os.path.exists(self.path):
+            return written
+        write(self.path, seq, Supplier.database.database_url,
+              [supplier.serialize() for supplier in suppliers])
+        logger.info('Wrote the supplier index of %d suppliers at %s', len(suppliers), seq)
+        return seq
@@ -0,0 +1,243 @@
+"""
+Binary snapshot of the Supplier dataset
+---------------------------------------
+A snapshot file holds every Supplier document and the ``_changes``
+sequence it is current to, so a process can start from it and catch up
+with the changes since, instead of reading the whole database.
+
+The file is columnar, so reading it is a handful of bulk array copies
+out of a memory map rather than a parse of every value:
+
+header     magic b'SUPSNAP2', byte order, uint32 document count
+strings    sequence (as JSON), database url
+columns    _id, _rev, name, like_count, is_active, products, rating
+extras     JSON text of the values that did not fit their column
+
+Every column starts with one tag byte per document (NONE, VALUE, BLANK
+for "", TRUE, FALSE or EXTRA). String columns then hold the character
+offsets of each value in one UTF-8 text, number columns an array of 64
+bit integers or floats, and the products column the offsets of each
+Supplier's ids in one array of 64 bit product ids.
+
+Arrays are in the byte order of the machine that wrote the snapshot, a
+snapshot from a machine of the other order is refused. Snapshots are
+written to a temporary file and renamed over the old one, so readers
+never see a partial file.
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+from array import array
+from service.products import is_product_id
+
+MAGIC = b'SUPSNAP2'
+BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+NONE, VALUE, BLANK, EXTRA, TRUE, FALSE = range(6)
+
+STRING, INTEGER, FLOAT, BOOLEAN, PRODUCTS = range(5)
+
+# document field and the kind of column it is stored in
+COLUMNS = (
+    ('_id', STRING),
+    ('_rev', STRING),
+    ('name', STRING),
+    ('like_count', INTEGER),
+    ('is_active', BOOLEAN),
+    ('products', PRODUCTS),
+    ('rating', FLOAT),
+)
+
+_HEADER = struct.Struct('<8sBI')
+_LENGTH = struct.Struct('<Q')
+
+
+class SnapshotError(Exception):
+    """ A snapshot file is missing, truncated or not a snapshot """
+
+
+def _tag(kind, value):
+    """ Returns how a value is stored in a column of a kind """
+    if value is None:
+        return NONE
+    if isinstance(value, bool) and kind == BOOLEAN:
+        return TRUE if value else FALSE
+    if kind == STRING and isinstance(value, str) \
+            or kind == INTEGER and is_product_id(value) \
+            or kind == FLOAT and isinstance(value, float) \
+            or kind == PRODUCTS and isinstance(value, list) and all(map(is_product_id, value)):
+        return VALUE
+    if value == '':
+        return BLANK
+    return EXTRA
+
+
+def _pack_blob(data, out):
+    out.append(_LENGTH.pack(len(data)))
+    out.append(data)
+
+
+def _pack_offsets(sizes, out):
+    offsets = array('Q', [0])
+    total = 0
+    for size in sizes:
+        total += size
+        offsets.append(total)
+    _pack_blob(offsets.tobytes(), out)
+
+
+def _pack_strings(strings, out):
+    _pack_offsets(map(len, strings), out)
+    _pack_blob(''.join(strings).encode('utf8'), out)
+
+
+def _pack_column(kind, values, out, extras):
+    tags = bytes(_tag(kind, value) for value in values)
+    _pack_blob(tags, out)
+    extras.extend(json.dumps(value) for tag, value in zip(tags, values) if tag == EXTRA)
+    stored = [value for tag, value in zip(tags, values) if tag == VALUE]
+    if kind == STRING:
+        _pack_strings(stored, out)
+    elif kind == INTEGER:
+        _pack_blob(array('q', stored).tobytes(), out)
+    elif kind == FLOAT:
+        _pack_blob(array('d', stored).tobytes(), out)
+    elif kind == PRODUCTS:
+        _pack_offsets(map(len, stored), out)
+        _pack_blob(array('q', [item for products in stored for item in products]).tobytes(),
+                   out)
+
+
+class _Reader(object):
+    """ Reads length prefixed blobs out of a buffer """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.offset = 0
+
+    def header(self):
+        """ Returns the magic, byte order and document count """
+        self.offset = _HEADER.size
+        return _HEADER.unpack_from(self.buffer, 0)
+
+    def blob(self):
+        """ Returns the next blob as bytes """
+        length, = _LENGTH.unpack_from(self.buffer, self.offset)
+        start = self.offset + _LENGTH.size
+        self.offset = start + length
+        if self.offset > len(self.buffer):
+            raise SnapshotError('Truncated snapshot: {} bytes of {}'
+                                .format(len(self.buffer), self.offset))
+        return self.buffer[start:self.offset]
+
+    def array(self, typecode):
+        """ Returns the next blob as an array """
+        result = array(typecode)
+        result.frombytes(self.blob())
+        return result
+
+    def strings(self):
+        """ Returns the next offsets and text as a list of strings """
+        offsets = self.array('Q')
+        text = str(self.blob(), 'utf8')
+        return [text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def _unpack_column(kind, reader):
+    """ Returns the tags of a column and an iterator over its stored values """
+    tags = reader.blob()
+    if kind == STRING:
+        values = reader.strings()
+    elif kind == INTEGER:
+        values = reader.array('q').tolist()
+    elif kind == FLOAT:
+        values = reader.array('d').tolist()
+    elif kind == PRODUCTS:
+        offsets = reader.array('Q')
+        ids = reader.array('q')
+        values = [ids[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+    else:
+        values = []
+    if len(values) != tags.count(VALUE):
+        raise SnapshotError('Column has {} values for {} tags'
+                            .format(len(values), tags.count(VALUE)))
+    return tags, iter(values)
+
+
+def dumps(seq, database, documents):
+    """ Encodes documents and the sequence they are current to as a snapshot """
+    out = [_HEADER.pack(MAGIC, BYTE_ORDER, len(documents))]
+    _pack_strings([json.dumps(seq), database], out)
+    extras = []
+    for field, kind in COLUMNS:
+        _pack_column(kind, [document.get(field) for document in documents], out, extras)
+    _pack_strings(extras, out)
+    return b''.join(out)
+
+
+def loads(buffer):
+    """ Decodes a snapshot
+
+    :param buffer: the bytes, or a memory map, of a snapshot
+    :return: a tuple of (sequence, database url, list of documents)
+    :raises SnapshotError: if the buffer is not a whole snapshot
+    """
+    reader = _Reader(buffer)
+    try:
+        magic, byte_order, count = reader.header()
+        if magic != MAGIC:
+            raise SnapshotError('Not a snapshot')
+        if byte_order != BYTE_ORDER:
+            raise SnapshotError('Snapshot was written with the other byte order')
+        seq, database = reader.strings()
+        columns = [(field,) + _unpack_column(kind, reader) for field, kind in COLUMNS]
+        extras = iter(reader.strings())
+        if reader.offset != len(buffer):
+            raise SnapshotError('Unexpected data after the last column')
+        documents = [{} for _ in range(count)]
+        for field, tags, values in columns:
+            if len(tags) != count:
+                raise SnapshotError('Column {} has {} of {} documents'
+                                    .format(field, len(tags), count))
+            for document, tag in zip(documents, tags):
+                if tag == VALUE:
+                    document[field] = next(values)
+                elif tag == NONE:
+                    document[field] = None
+                elif tag == TRUE or tag == FALSE:
+                    document[field] = tag == TRUE
+                elif tag == BLANK:
+                    document[field] = ''
+                else:
+                    document[field] = json.loads(next(extras))
+        return json.loads(seq), database, documents
+    except (struct.error, ValueError, StopIteration) as error:
+        raise SnapshotError('Truncated or corrupt snapshot: {}'.format(error))
+
+
+def write(path, seq, database, documents):
+    """ Writes a snapshot file atomically """
+    data = dumps(seq, database, documents)
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as snapshot:
+        snapshot.write(data)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temporary, path)
+
+
+def read(path):
+    """ Reads a snapshot file through a memory map
+
+    :return: a tuple of (sequence, database url, list of documents)
+    :raises SnapshotError: if the file is missing or not a whole snapshot
+    """
+    try:
+        with open(path, 'rb') as snapshot:
+            with mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return loads(buffer)
+    except (OSError, ValueError) as error:
+        raise SnapshotError('Cannot read snapshot {}: {}'.format(path, error))
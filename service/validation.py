@@ -0,0 +1,181 @@
+"""
+Validation of Supplier payloads
+-------------------------------
+The schema below is compiled once, at import, into a tuple of
+(field, coercer) pairs. validate() then walks a payload a single time,
+coercing every field to its stored type (form posts and the web UI send
+strings, products may be a comma separated string) and collecting every
+problem it finds, instead of stopping at the first one.
+
+Problems are raised as one DataValidationError whose ``errors`` attribute
+lists a {'field', 'message'} dictionary per bad field. validate_many()
+does the same for a list of payloads and reports errors by index, and
+validate_partial() checks the fields of a partial update, none required.
+
+Empty values ("" or None) for like_count and rating are kept as they are,
+as they always were, so clients can leave them blank.
+"""
+
+from service.models import DataValidationError
+
+TRUE_STRINGS = frozenset(['true', 'True', '1'])
+
+
+class FieldError(ValueError):
+    """ A single field of a payload could not be coerced """
+
+
+def _name(value):
+    if not isinstance(value, str):
+        raise FieldError('must be a string')
+    return value
+
+
+def _like_count(value):
+    if value in ('', None):
+        return value
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise FieldError('must be an integer')
+        return int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise FieldError('must be an integer')
+
+
+def _is_active(value):
+    if isinstance(value, str):
+        return value in TRUE_STRINGS
+    if value is None or isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    raise FieldError('must be a boolean')
+
+
+def _product(value):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def _products(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item.strip()]
+    elif not isinstance(value, list):
+        raise FieldError('must be a list of integers')
+    try:
+        return [_product(item) for item in value]
+    except (TypeError, ValueError):
+        raise FieldError('must be a list of integers')
+
+
+def _rating(value):
+    if value in ('', None):
+        return value
+    if isinstance(value, bool):
+        raise FieldError('must be a number')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise FieldError('must be a number')
+
+
+def _rev(value):
+    if not isinstance(value, str):
+        raise FieldError('must be a string')
+    return value
+
+
+# field name, coercer, required
+SCHEMA = (
+    ('name', _name, True),
+    ('like_count', _like_count, True),
+    ('is_active', _is_active, True),
+    ('products', _products, True),
+    ('rating', _rating, True),
+    ('_rev', _rev, False),
+)
+
+# compiled forms of the schema used by the validators
+FIELDS = tuple((field, coercer) for field, coercer, _ in SCHEMA)
+REQUIRED = tuple(field for field, _, required in SCHEMA if required)
+
+
+def _check(data, required=REQUIRED):
+    """ Coerces one payload, returning (clean data, list of errors) """
+    if not isinstance(data, dict):
+        return None, [{'field': None, 'message': 'body of request contained bad or no data'}]
+    clean = {}
+    errors = []
+    for field, coercer in FIELDS:
+        if field not in data:
+            continue
+        try:
+            clean[field] = coercer(data[field])
+        except FieldError as error:
+            errors.append({'field': field, 'message': '{} {}'.format(field, error)})
+    for field in required:
+        if field not in data:
+            errors.append({'field': field, 'message': 'missing ' + field})
+    return clean, errors
+
+
+def validate(data):
+    """ Validates and coerces a single Supplier payload
+
+    :param data: a dictionary from a JSON body or a form
+    :return: a new dictionary with every field coerced to its stored type
+    :raises DataValidationError: listing every bad field in ``errors``
+    """
+    clean, errors = _check(data)
+    if errors:
+        raise DataValidationError('Invalid supplier: ' + '; '.join(e['message'] for e in errors),
+                                  errors)
+    return clean
+
+
+def validate_partial(data):
+    """ Validates and coerces the fields of a partial Supplier update
+
+    :param data: a dictionary with some of the fields of a Supplier
+    :return: a new dictionary with every field coerced to its stored type
+    :raises DataValidationError: listing every bad field in ``errors``, or if
+        there is no field to change
+    """
+    clean, errors = _check(data, required=())
+    if not errors and not any(field != '_rev' for field in clean):
+        errors.append({'field': None, 'message': 'no field to change'})
+    if errors:
+        raise DataValidationError('Invalid supplier: ' + '; '.join(e['message'] for e in errors),
+                                  errors)
+    return clean
+
+
+def validate_many(items):
+    """ Validates and coerces a batch of Supplier payloads in one pass
+
+    :param items: a list of dictionaries
+    :return: the list of coerced dictionaries
+    :raises DataValidationError: with an {'index', 'field', 'message'} entry
+        in ``errors`` for every bad field of every bad payload
+    """
+    if not isinstance(items, list):
+        raise DataValidationError('Invalid request: body must be a list of suppliers')
+    check = _check
+    results = []
+    errors = []
+    for index, data in enumerate(items):
+        clean, item_errors = check(data)
+        if item_errors:
+            errors.extend(dict(error, index=index) for error in item_errors)
+        results.append(clean)
+    if errors:
+        raise DataValidationError('Invalid suppliers: {} errors in batch'.format(len(errors)),
+                                  errors)
+    return results
@@ -0,0 +1,51 @@
+"""
+Write-behind queue that group commits documents
+-----------------------------------------------
+Writers hand their document to the queue and block until it is stored.
+A single background thread collects the documents that arrive within a
+short window (or until a maximum batch size is reached) and stores them
+all with one ``_bulk_docs`` request. Each writer gets back its own row of
+the bulk response, so it still learns its own id, revision or error.
+
+The windowing and the background thread are the Batcher shared with the
+client's coalesced lookups (batching.py).
+"""
+
+import logging
+from batching import Batcher
+
+
+class WriteBehindQueue(Batcher):
+    """
+    Groups documents written within a window into a single bulk request
+
+    :param flush: a callable that stores a list of documents and returns
+        one result dictionary per document, in the same order
+    :param window: how long, in seconds, to wait for more documents
+        after the first one arrives
+    :param max_docs: the largest number of documents sent in one request
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, flush, window=0.005, max_docs=500):
+        self.flush = flush
+        super().__init__(self._store, window, max_docs, 'write-behind')
+
+
+    @property
+    def max_docs(self):
+        """ The largest number of documents sent in one request """
+        return self.max_items
+
+
+    def write(self, document, timeout=None):
+        """ Queues a document and waits for its bulk result row """
+        return self.submit(document).result(timeout)
+
+
+    def _store(self, documents):
+        """ Stores a batch of documents with one bulk request """
+        results = self.flush(documents)
+        self.logger.debug('Bulk wrote %d documents', len(documents))
+        return results
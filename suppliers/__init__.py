@@ -0,0 +1,8 @@
+"""
+Package: suppliers
+Client of the Supplier service, with a pooled session, batch helpers
+and coalesced lookups; AsyncSupplierClient is the same for asyncio
+"""
+
+from suppliers.client import SupplierClient, SupplierError, ConflictError
+from suppliers.aio import AsyncSupplierClient
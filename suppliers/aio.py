@@ -0,0 +1,150 @@
+"""
+Supplier Service Client for asyncio
+-----------------------------------
+AsyncSupplierClient has the calls of SupplierClient as coroutines. They
+run the pooled client on a thread pool as large as its connection pool,
+so a coroutine waits for the service without blocking the event loop and
+at most pool_size calls are sent at once.
+
+lookup coalesces on the event loop itself: the ids looked up while a
+batch is collecting, for window seconds, are found with one multi-get.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from suppliers.client import SupplierClient, MAX_IDS
+
+
+class AsyncSupplierClient(object):
+    """
+    Asyncio client of the Supplier service, see SupplierClient for the parameters
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=10.0, pool_size=10, window=0.002):
+        self.client = SupplierClient(base_url, api_key, timeout, pool_size, window)
+        self.window = window
+        self._executor = ThreadPoolExecutor(pool_size, thread_name_prefix='suppliers')
+        self._pending = {}
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+    def close(self):
+        """ Waits for the calls being sent and closes the pooled connections """
+        self._executor.shutdown()
+        self.client.close()
+
+
+    async def _call(self, method, *args, **kwargs):
+        """ Runs a call of the client on the thread pool """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+
+    async def get(self, supplier_id):
+        """ Returns the Supplier with an id, or None if there is none """
+        return await self._call(self.client.get, supplier_id)
+
+
+    async def lookup(self, supplier_id):
+        """ Like get, but sent in one multi-get with the other lookups of the window """
+        supplier_id = str(supplier_id)
+        future = self._pending.get(supplier_id)
+        if future is None:
+            if not self._pending:
+                asyncio.get_event_loop().call_later(self.window, self._flush)
+            future = self._pending[supplier_id] = asyncio.get_event_loop().create_future()
+            if len(self._pending) >= MAX_IDS:
+                self._flush()
+        return await future
+
+
+    def _flush(self):
+        """ Looks up the ids collected so far and hands every caller its Supplier """
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        asyncio.ensure_future(self._fetch(batch))
+
+
+    async def _fetch(self, batch):
+        try:
+            suppliers, _ = await self._call(self.client.get_many, list(batch))
+        except Exception as error:  # pylint: disable=broad-except
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+            return
+        found = {str(supplier['_id']): supplier for supplier in suppliers}
+        for supplier_id, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(supplier_id))
+
+
+    async def create(self, supplier):
+        """ Creates a Supplier and returns it with its id and revision """
+        return await self._call(self.client.create, supplier)
+
+
+    async def update(self, supplier_id, supplier, rev=None):
+        """ Replaces a Supplier, refused with a ConflictError if rev is not the latest """
+        return await self._call(self.client.update, supplier_id, supplier, rev)
+
+
+    async def patch(self, supplier_id, fields, rev=None):
+        """ Changes only some fields of a Supplier, see update for rev """
+        return await self._call(self.client.patch, supplier_id, fields, rev)
+
+
+    async def delete(self, supplier_id):
+        """ Deletes a Supplier, if there is one with that id """
+        await self._call(self.client.delete, supplier_id)
+
+
+    async def like(self, supplier_id):
+        """ Adds a like to a Supplier and returns it """
+        return await self._call(self.client.like, supplier_id)
+
+
+    async def list(self, **query):
+        """ Returns the Suppliers that match the query string arguments, all without any """
+        return await self._call(self.client.list, **query)
+
+
+    async def get_many(self, supplier_ids):
+        """ Returns the Suppliers with the ids, in order, and the ids not found """
+        return await self._call(self.client.get_many, supplier_ids)
+
+
+    async def create_many(self, suppliers):
+        """ Creates many Suppliers with as few bulk calls as the service allows """
+        return await self._call(self.client.create_many, suppliers)
+
+
+    async def recommend(self, product_ids, k=1):
+        """ Returns the k best rated active Suppliers of each product, by product """
+        return await self._call(self.client.recommend, product_ids, k)
+
+
+    async def changes(self, since=None, reconnect=True):
+        """ Yields the (seq, change) of every change to Suppliers after since
+
+        The stream holds one thread of the pool while it is being read.
+        """
+        changes = self.client.changes(since, reconnect)
+        done = object()
+        try:
+            while True:
+                change = await self._call(next, changes, done)
+                if change is done:
+                    return
+                yield change
+        finally:
+            changes.close()
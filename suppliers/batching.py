@@ -0,0 +1,42 @@
+"""
+Coalescing of single Supplier lookups
+-------------------------------------
+Callers hand an id to the batcher and block until its Supplier is found.
+The ids that arrive within a short window are looked up with one
+multi-get request (see batching.Batcher), so many threads each asking
+for one Supplier cost one round trip instead of one each. Every caller
+gets back its own Supplier, or None if it does not exist.
+"""
+
+import logging
+from batching import Batcher
+
+
+class LookupBatcher(Batcher):
+    """
+    Groups the ids looked up within a window into a single multi-get
+
+    :param fetch: a callable that takes a list of distinct ids and returns
+        a dictionary of the Suppliers found, by id
+    :param window: how long, in seconds, to wait for more ids after the
+        first one arrives
+    :param max_ids: the largest number of ids sent in one request
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, fetch, window=0.002, max_ids=1000):
+        self.fetch = fetch
+        super().__init__(self._lookup, window, max_ids, 'supplier-lookups', key=str)
+
+
+    def lookup(self, supplier_id, timeout=None):
+        """ Queues an id and waits for its Supplier, None if there is none """
+        return self.submit(str(supplier_id)).result(timeout)
+
+
+    def _lookup(self, supplier_ids):
+        """ Looks up a batch of ids, the Suppliers come back keyed by their string id """
+        found = self.fetch(supplier_ids)
+        self.logger.debug('Looked up %d suppliers at once', len(supplier_ids))
+        return [found.get(str(supplier_id)) for supplier_id in supplier_ids]
@@ -0,0 +1,264 @@
+"""
+Supplier Service Client
+-----------------------
+SupplierClient talks to the Supplier service over one keep-alive
+``requests`` session, so consecutive calls reuse pooled connections
+instead of opening a new one each time.
+
+Calls that concern many Suppliers go through the batch endpoints:
+get_many posts the ids to ``/suppliers/_mget`` and create_many posts the
+Suppliers to ``/suppliers/_bulk``, in chunks the service accepts, and
+changes follows the ``/suppliers/changes`` event stream. lookup finds a
+single Supplier like get, but the lookups of every thread made within a
+short window are sent as one multi-get (see batching.py).
+
+Suppliers are plain dictionaries, as the service serializes them. The
+client sends back the X-Last-Write header of its last write, so its
+reads see its own writes even when the service reads from a replica.
+"""
+
+import json
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from suppliers.batching import LookupBatcher
+
+# what the service accepts in one multi-get and one bulk create
+# (MGET_MAX_IDS and BULK_MAX_DOCS in its config)
+MAX_IDS = 1000
+MAX_DOCS = 1000
+
+
+class SupplierError(Exception):
+    """ The service answered with an error status
+
+    :param status_code: the HTTP status of the response
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ConflictError(SupplierError):
+    """ A write was refused because the Supplier changed since its revision """
+
+
+def parse_events(lines):
+    """ Yields the (id, event, data) of every Server-Sent Event in lines of text """
+    event_id, event, data = None, 'message', []
+    for line in lines:
+        if not line:
+            if data:
+                yield event_id, event, '\n'.join(data)
+            event, data = 'message', []
+            continue
+        if line.startswith(':'):
+            continue
+        name, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if name == 'id':
+            event_id = value
+        elif name == 'event':
+            event = value
+        elif name == 'data':
+            data.append(value)
+
+
+class SupplierClient(object):
+    """
+    Client of the Supplier service
+
+    :param base_url: the root of the service, like http://localhost:5000
+    :param api_key: sent as X-Api-Key, if given
+    :param timeout: seconds to wait for the service on every call
+    :param pool_size: connections kept open, the most calls sent at once
+    :param window: seconds lookups wait for others to share a multi-get
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, base_url, api_key=None, timeout=10.0, pool_size=10, window=0.002):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.last_write = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept'] = 'application/json'
+        if api_key:
+            self.session.headers['X-Api-Key'] = api_key
+        self.window = window
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def close(self):
+        """ Stops coalescing lookups and closes the pooled connections """
+        with self._batcher_lock:
+            batcher, self._batcher = self._batcher, None
+        if batcher is not None:
+            batcher.close()
+        self.session.close()
+
+
+    def _request(self, method, path, params=None, body=None, headers=None, stream=False):
+        """ Sends a request and returns the response, raising on an error status """
+        headers = dict(headers or {})
+        if self.last_write:
+            headers['X-Last-Write'] = self.last_write
+        response = self.session.request(method, self.base_url + path, params=params,
+                                        json=body, headers=headers, stream=stream,
+                                        timeout=self.timeout)
+        if 'X-Last-Write' in response.headers:
+            self.last_write = response.headers['X-Last-Write']
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('message') or response.reason
+            except ValueError:
+                message = response.reason
+            error = ConflictError if response.status_code == 412 else SupplierError
+            raise error('{} {}: {}'.format(method, path, message), response.status_code)
+        return response
+
+
+    @staticmethod
+    def _path(supplier_id, action=None):
+        path = '/suppliers/' + requests.utils.quote(str(supplier_id), safe='')
+        return path + '/' + action if action else path
+
+
+    @staticmethod
+    def _if_match(rev):
+        return {'If-Match': '"{}"'.format(rev)} if rev else None
+
+
+    ##################################################################
+    # SINGLE SUPPLIERS
+    ##################################################################
+
+    def get(self, supplier_id):
+        """ Returns the Supplier with an id, or None if there is none """
+        try:
+            return self._request('GET', self._path(supplier_id)).json()
+        except SupplierError as error:
+            if error.status_code == 404:
+                return None
+            raise
+
+
+    def lookup(self, supplier_id, timeout=None):
+        """ Like get, but sent in one multi-get with the lookups of other threads """
+        with self._batcher_lock:
+            if self._batcher is None:
+                self._batcher = LookupBatcher(self._find, self.window, MAX_IDS)
+            batcher = self._batcher
+        return batcher.lookup(supplier_id, timeout)
+
+
+    def create(self, supplier):
+        """ Creates a Supplier and returns it with its id and revision """
+        return self._request('POST', '/suppliers', body=supplier).json()
+
+
+    def update(self, supplier_id, supplier, rev=None):
+        """ Replaces a Supplier, refused with a ConflictError if rev is not the latest """
+        return self._request('PUT', self._path(supplier_id), body=supplier,
+                             headers=self._if_match(rev)).json()
+
+
+    def patch(self, supplier_id, fields, rev=None):
+        """ Changes only some fields of a Supplier, see update for rev """
+        return self._request('PATCH', self._path(supplier_id), body=fields,
+                             headers=self._if_match(rev)).json()
+
+
+    def delete(self, supplier_id):
+        """ Deletes a Supplier, if there is one with that id """
+        self._request('DELETE', self._path(supplier_id))
+
+
+    def like(self, supplier_id):
+        """ Adds a like to a Supplier and returns it """
+        return self._request('PUT', self._path(supplier_id, 'like')).json()
+
+
+    ##################################################################
+    # MANY SUPPLIERS
+    ##################################################################
+
+    def list(self, **query):
+        """ Returns the Suppliers that match the query string arguments, all without any """
+        return self._request('GET', '/suppliers', params=query or None).json()
+
+
+    def get_many(self, supplier_ids):
+        """ Returns the Suppliers with the ids, in order, and the ids not found
+
+        The ids are sent to the multi-get endpoint in as few calls as it allows.
+        """
+        suppliers, missing = [], []
+        for start in range(0, len(supplier_ids), MAX_IDS):
+            result = self._request('POST', '/suppliers/_mget',
+                                   body={'ids': supplier_ids[start:start + MAX_IDS]}).json()
+            suppliers.extend(result['suppliers'])
+            missing.extend(result['missing'])
+        return suppliers, missing
+
+
+    def _find(self, supplier_ids):
+        """ Returns the Suppliers with the ids, by id """
+        suppliers, _ = self.get_many(supplier_ids)
+        return {str(supplier['_id']): supplier for supplier in suppliers}
+
+
+    def create_many(self, suppliers):
+        """ Creates many Suppliers with as few bulk calls as the service allows
+
+        :return: each Supplier as created, with an 'error' if it was not
+        """
+        created = []
+        for start in range(0, len(suppliers), MAX_DOCS):
+            created.extend(self._request('POST', '/suppliers/_bulk',
+                                         body=suppliers[start:start + MAX_DOCS]).json())
+        return created
+
+
+    def recommend(self, product_ids, k=1):
+        """ Returns the k best rated active Suppliers of each product, by product """
+        result = self._request('POST', '/suppliers/recommend',
+                               body={'products': list(product_ids), 'k': k}).json()
+        return {item['product_id']: item['suppliers'] for item in result}
+
+
+    def changes(self, since=None, reconnect=True):
+        """ Yields the (seq, change) of every change to Suppliers after since
+
+        The event stream is read as it arrives. When the service ends it, it
+        is opened again after the last change seen, unless reconnect is False.
+        Without since the stream starts at the current sequence, which the
+        service sends first, so a reconnect before any change resumes there.
+        """
+        while True:
+            params = {'since': since} if since is not None else None
+            with self._request('GET', '/suppliers/changes', params=params,
+                               headers={'Accept': 'text/event-stream'}, stream=True) as response:
+                lines = response.iter_lines(decode_unicode=True)
+                for event_id, event, data in parse_events(lines):
+                    if event_id is not None:
+                        since = event_id
+                    if event == 'change':
+                        yield event_id, json.loads(data)
+            if not reconnect:
+                return
+            self.logger.debug('Change stream ended, resuming after %s', since)
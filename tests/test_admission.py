@@ -0,0 +1,99 @@
+"""
+Admission Control Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_admission.py:TestAdmissionController
+"""
+
+from unittest import TestCase
+from flask import Flask, Response, stream_with_context
+from service import admission
+from service.admission import AdmissionController, route_class
+from config import ADMISSION_ROUTES, ADMISSION_QUERIES
+
+
+def make_app():
+    """ Returns a Flask app with admission control and a streamed route """
+    app = Flask(__name__)
+    app.config.update(ADMISSION_MAX_IN_FLIGHT=4, ADMISSION_RETRY_AFTER=1,
+                      ADMISSION_SHARES={'expensive': 0.5},
+                      ADMISSION_ROUTES={'/suppliers': 'expensive'})
+    controller = admission.init_app(app)
+    in_flight = []
+
+    @app.route('/suppliers')
+    def suppliers():  # pylint: disable=unused-variable
+        def body():
+            for number in range(3):
+                in_flight.append(controller.metrics()['http_in_flight'])
+                yield str(number)
+        return Response(stream_with_context(body()))
+
+    return app, controller, in_flight
+
+
+class TestAdmissionController(TestCase):
+    """ Admission Controller Tests """
+
+    def setUp(self):
+        self.controller = AdmissionController(4, {'cheap': 1.0, 'normal': 0.75,
+                                                  'expensive': 0.5})
+
+    def test_sheds_expensive_first(self):
+        """ Expensive requests are refused before cheap ones """
+        self.assertTrue(self.controller.admit('expensive'))
+        self.assertTrue(self.controller.admit('expensive'))
+        self.assertFalse(self.controller.admit('expensive'))
+        self.assertTrue(self.controller.admit('normal'))
+        self.assertFalse(self.controller.admit('normal'))
+        self.assertTrue(self.controller.admit('cheap'))
+        self.assertFalse(self.controller.admit('cheap'))
+        metrics = self.controller.metrics()
+        self.assertEqual(metrics['http_in_flight'], 4)
+        self.assertEqual(metrics['http_in_flight_expensive'], 2)
+        self.assertEqual(metrics['http_shed_expensive_total'], 1)
+        self.assertEqual(metrics['http_shed_cheap_total'], 1)
+
+    def test_release(self):
+        """ A released request makes room again """
+        self.assertTrue(self.controller.admit('expensive'))
+        self.assertTrue(self.controller.admit('expensive'))
+        self.assertFalse(self.controller.admit('expensive'))
+        self.controller.release('expensive')
+        self.assertTrue(self.controller.admit('expensive'))
+        self.assertEqual(self.controller.metrics()['http_in_flight'], 2)
+
+    def test_unlimited(self):
+        """ A capacity of 0 admits everything """
+        controller = AdmissionController(0, {'expensive': 0.5})
+        for _ in range(100):
+            self.assertTrue(controller.admit('expensive'))
+
+    def test_streamed_body_holds_the_slot(self):
+        """ A streamed request is counted out when its body is closed """
+        app, controller, in_flight = make_app()
+        resp = app.test_client().get('/suppliers')
+        self.assertEqual(resp.get_data(), b'012')
+        self.assertEqual(in_flight, [1, 1, 1])
+        self.assertEqual(controller.metrics()['http_in_flight'], 1)
+        resp.close()
+        self.assertEqual(controller.metrics()['http_in_flight'], 0)
+
+    def test_route_class_by_query(self):
+        """ The supplier list is classed by the query it runs """
+        app = Flask(__name__)
+        app.add_url_rule('/suppliers', 'suppliers', lambda: '', methods=['GET', 'POST'])
+        app.add_url_rule('/suppliers/<supplier_id>', 'supplier', lambda supplier_id: '')
+        expected = {'/suppliers': 'expensive',
+                    '/suppliers?ids=a,b': 'cheap',
+                    '/suppliers?name_prefix=ac&rating_min=2': 'cheap',
+                    '/suppliers?partition=east': 'normal',
+                    '/suppliers?partition=east&product_id=2': 'expensive',
+                    '/suppliers?rating_min=2&rating_max=4': 'expensive',
+                    '/suppliers?ids=&product_id=2': 'expensive',
+                    '/suppliers/a?ids=b': 'cheap'}
+        for url, name in expected.items():
+            with app.test_request_context(url):
+                self.assertEqual(route_class(ADMISSION_ROUTES, ADMISSION_QUERIES), name, url)
+        with app.test_request_context('/suppliers?ids=a', method='POST'):
+            self.assertEqual(route_class(ADMISSION_ROUTES, ADMISSION_QUERIES), 'normal')
@@ -0,0 +1,50 @@
+"""
+Batcher Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_batching.py:TestBatcher
+"""
+
+from unittest import TestCase
+from batching import Batcher
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestBatcher(TestCase):
+    """ Test Cases for the shared batching loop """
+
+    def setUp(self):
+        self.batches = []
+
+    def handle(self, items):
+        """ Returns every item doubled """
+        self.batches.append(list(items))
+        return [item * 2 for item in items]
+
+
+    def test_same_key_shares_a_result(self):
+        """ Items with the same key are handled once """
+        batcher = Batcher(self.handle, window=10, max_items=10, key=str)
+        futures = [batcher.submit(item) for item in [1, 2, 1]]
+        batcher.close()
+        self.assertEqual([future.result(0) for future in futures], [2, 4, 2])
+        self.assertEqual(self.batches, [[1, 2]])
+
+
+    def test_max_items(self):
+        """ Batches hold at most max_items, and items without a key are all handled """
+        batcher = Batcher(self.handle, window=10, max_items=2)
+        futures = [batcher.submit(1) for _ in range(3)]
+        batcher.close()
+        self.assertEqual([future.result(0) for future in futures], [2, 2, 2])
+        self.assertEqual(sorted(len(batch) for batch in self.batches), [1, 2])
+
+
+    def test_wrong_number_of_results(self):
+        """ A handler that loses results fails every caller of the batch """
+        batcher = Batcher(lambda items: [], window=0.01, max_items=10)
+        future = batcher.submit('a')
+        self.assertRaises(RuntimeError, future.result, 5)
+        batcher.close()
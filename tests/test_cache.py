@@ -0,0 +1,99 @@
+"""
+Supplier Cache Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_cache.py:TestSupplierCache
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from service import snapshot
+from service.cache import SupplierCache
+from service.models import Supplier
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestSupplierCache(TestCase):
+    """ Test Cases for the in-process Supplier cache """
+
+    def setUp(self):
+        """ Initialize the Cloudant database """
+        Supplier.init_db("test")
+        Supplier.remove_all()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'suppliers.snapshot')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_follows_changes(self):
+        """ The cache sees creates, updates and deletes """
+        cache = SupplierCache()
+        self.assertEqual(cache.suppliers(), [])
+        supplier1 = Supplier("supplier1", 2, True, [1, 2, 3], 8.5)
+        supplier1.save()
+        supplier2 = Supplier("supplier2", 4, False, [1, 3, 5, 7], 6.5)
+        supplier2.save()
+        self.assertEqual(sorted(s.name for s in cache.suppliers()), ["supplier1", "supplier2"])
+        supplier1.rating = 9.0
+        supplier1.save()
+        supplier2.delete()
+        suppliers = cache.suppliers()
+        self.assertEqual([(s.name, s.rating) for s in suppliers], [("supplier1", 9.0)])
+        self.assertTrue(suppliers[0].has_product(3))
+
+
+    def test_warm_start_from_snapshot(self):
+        """ A new cache starts from the snapshot and catches up after it """
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        cache = SupplierCache(self.path)
+        cache.refresh()
+        self.assertTrue(cache.save())
+        self.assertFalse(cache.save())
+        _, _, documents = snapshot.read(self.path)
+        self.assertEqual([document['name'] for document in documents], ["supplier1"])
+
+        Supplier("supplier2", 4, False, [1, 3, 5, 7], 6.5).save()
+        warm = SupplierCache(self.path)
+        self.assertEqual(sorted(s.name for s in warm.suppliers()), ["supplier1", "supplier2"])
+
+
+    def test_changes_read_outside_the_lock(self):
+        """ Readers do not hold the lock while the changes are fetched """
+        cache = SupplierCache()
+        cache.refresh()
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        changes = Supplier.changes
+
+        def unlocked_changes(*args, **kwargs):
+            self.assertFalse(cache._lock.locked())  # pylint: disable=protected-access
+            return changes(*args, **kwargs)
+
+        with patch.object(Supplier, 'changes', side_effect=unlocked_changes) as changes_mock:
+            self.assertEqual([s.name for s in cache.suppliers()], ["supplier1"])
+        changes_mock.assert_called()
+
+
+    def test_stale_changes_not_applied(self):
+        """ Changes fetched while another reader moved the cache on are dropped """
+        cache = SupplierCache()
+        cache.refresh()
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        changes = Supplier.changes
+
+        def overtaken(*args, **kwargs):
+            result = changes(*args, **kwargs)
+            cache._seq = 'later'  # pylint: disable=protected-access
+            return result
+
+        with patch.object(Supplier, 'changes', side_effect=overtaken):
+            cache.refresh()
+        self.assertEqual(cache._suppliers, {})  # pylint: disable=protected-access
+        self.assertEqual(cache._seq, 'later')  # pylint: disable=protected-access
@@ -0,0 +1,139 @@
+"""
+Traffic Capture Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_capture.py:TestCapture
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+from unittest import TestCase
+from flask import Flask, Response, jsonify
+from service import capture
+from benchmarks.replay import pseudonymous_ids, build_request, schedule, summarize
+
+
+def make_app(path):
+    """ Returns a Flask app with two supplier routes, capturing to path """
+    app = Flask(__name__)
+    app.config.update(CAPTURE_PATH=path, CAPTURE_KEY='test-key', CAPTURE_MAX_BODY=1024,
+                      CAPTURE_EXCLUDE=['/suppliers/changes'])
+
+    @app.route('/suppliers/<supplier_id>', methods=['GET', 'PUT'])
+    def supplier(supplier_id):  # pylint: disable=unused-variable
+        return jsonify(_id=supplier_id)
+
+    @app.route('/suppliers')
+    def suppliers():  # pylint: disable=unused-variable
+        def body():
+            yield '['
+            time.sleep(0.05)
+            yield ']'
+        return Response(body(), mimetype='application/json')
+
+    @app.route('/healthcheck')
+    def healthcheck():  # pylint: disable=unused-variable
+        return jsonify(status=200)
+
+    return app, capture.init_app(app)
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestCapture(TestCase):
+    """ Test Cases for capturing and replaying traffic """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'capture.log')
+        self.app, self.capture = make_app(self.path)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.capture.close()
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        """ Returns the captured entries """
+        with open(self.path) as log:
+            return [json.loads(line) for line in log]
+
+    def test_capture_off(self):
+        """ Nothing is installed without a capture path """
+        app = Flask(__name__)
+        app.config['CAPTURE_PATH'] = ''
+        self.assertIsNone(capture.init_app(app))
+        self.assertEqual(app.before_request_funcs, {})
+
+    def test_capture_anonymized(self):
+        """ Supplier requests are captured without their ids and names """
+        before = time.time()
+        self.client.put('/suppliers/abc123', query_string='name=Acme&limit=5&ids=abc123,def',
+                        json={'name': 'Acme Foods', 'products': [1, 2], 'rating': 4.5,
+                              'is_active': True}).close()
+        self.client.get('/healthcheck').close()
+        entries = self.read()
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        pseudonym = self.capture.supplier_id('abc123')
+        self.assertTrue(pseudonym.startswith('~'))
+        self.assertEqual(entry['m'], 'PUT')
+        self.assertEqual(entry['r'], '/suppliers/<supplier_id>')
+        self.assertEqual(entry['p'], '/suppliers/' + pseudonym)
+        self.assertEqual(entry['s'], 200)
+        self.assertGreaterEqual(entry['d'], 0)
+        self.assertGreaterEqual(entry['t'], round(before, 3))
+        self.assertLessEqual(entry['t'], time.time())
+        query = dict(entry['q'])
+        self.assertEqual(query['limit'], '5')
+        self.assertEqual(len(query['name']), 4)
+        self.assertNotEqual(query['name'], 'Acme')
+        self.assertEqual(query['ids'].split(',')[0], pseudonym)
+        self.assertEqual(len(entry['b']['name']), len('Acme Foods'))
+        self.assertNotIn('Acme', json.dumps(entry))
+        self.assertEqual(entry['b']['products'], [1, 2])
+        self.assertEqual(entry['b']['rating'], 4.5)
+        self.assertTrue(entry['b']['is_active'])
+
+    def test_capture_streamed_body(self):
+        """ A streamed response is captured once its body is sent, with the time it took """
+        resp = self.client.get('/suppliers')
+        self.assertEqual(resp.get_data(), b'[]')
+        self.assertEqual(self.read(), [])
+        resp.close()
+        entries = self.read()
+        self.assertEqual(len(entries), 1)
+        self.assertGreaterEqual(entries[0]['d'], 50)
+
+    def test_replay_request(self):
+        """ A replay sends captured requests to the suppliers made for their ids """
+        self.client.get('/suppliers/abc123', query_string='ids=abc123').close()
+        entries = self.read()
+        pseudonym = self.capture.supplier_id('abc123')
+        self.assertEqual(pseudonymous_ids(entries), {pseudonym})
+        method, path, query, body = build_request(entries[0], {pseudonym: 'real'})
+        self.assertEqual(method, 'GET')
+        self.assertEqual(path, '/suppliers/real')
+        self.assertEqual(query, [('ids', 'real')])
+        self.assertIsNone(body)
+
+    def test_schedule(self):
+        """ A replay is paced from the earliest wall clock time of the capture """
+        entries = [{'t': 1700000000.0}, {'t': 1700000000.5}, {'t': 1700000002.0}]
+        self.assertEqual(schedule(entries, 1.0), [0.0, 0.5, 2.0])
+        self.assertEqual(schedule(entries, 2.0), [0.0, 0.25, 1.0])
+        self.assertEqual(schedule(entries, 0), [0.0, 0.0, 0.0])
+        self.assertEqual(schedule([], 1.0), [])
+
+    def test_summarize(self):
+        """ A replay reports the latency of each route """
+        report = summarize([('GET /suppliers', 10.0, 12.0, 200, 200),
+                            ('GET /suppliers', 20.0, 18.0, 200, 503)])
+        self.assertEqual(report['GET /suppliers']['count'], 2)
+        self.assertEqual(report['GET /suppliers']['captured_p95'], 20.0)
+        self.assertEqual(report['GET /suppliers']['p50'], 18.0)
+        self.assertEqual(report['GET /suppliers']['status_mismatches'], 1)
@@ -0,0 +1,81 @@
+"""
+Change Feed Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_changes.py:TestChangeFeed
+"""
+
+import threading
+from unittest import TestCase
+from service.changes import ChangeFeed, LaggedError
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestChangeFeed(TestCase):
+    """ Test Cases for the shared change feed """
+
+    def test_wait_for_changes(self):
+        """ Subscribers get the changes after their position """
+        feed = ChangeFeed(None, buffer_size=10)
+        start = feed.position()
+        feed.publish([('1-a', {'id': 'a'}), ('2-b', {'id': 'b'})], '2-b')
+        entries = feed.wait(start)
+        self.assertEqual([seq for _, seq, _ in entries], ['1-a', '2-b'])
+        self.assertEqual(feed.wait(entries[0][0]), entries[1:])
+        self.assertEqual(feed.wait(feed.position(), timeout=0.01), [])
+
+
+    def test_head(self):
+        """ The head is the latest position and the sequence read up to """
+        feed = ChangeFeed(None, buffer_size=10)
+        self.assertEqual(feed.head(), (0, 'now'))
+        feed.publish([('1-a', {'id': 'a'})], '3-c')
+        self.assertEqual(feed.head(), (1, '3-c'))
+
+
+    def test_find(self):
+        """ Find the position of a buffered sequence """
+        feed = ChangeFeed(None, buffer_size=10)
+        feed.publish([('1-a', {'id': 'a'}), ('2-b', {'id': 'b'})], '2-b')
+        self.assertEqual([seq for _, seq, _ in feed.wait(feed.find('1-a'))], ['2-b'])
+        self.assertIsNone(feed.find('0-z'))
+
+
+    def test_lagging_subscriber(self):
+        """ A subscriber behind the buffer is told it lagged """
+        feed = ChangeFeed(None, buffer_size=2)
+        start = feed.position()
+        feed.publish([(str(seq), {}) for seq in range(3)], '2')
+        self.assertRaises(LaggedError, feed.wait, start)
+        self.assertEqual(len(feed.wait(start + 1)), 2)
+
+
+    def test_one_reader_for_many_subscribers(self):
+        """ The feed is read by one thread and fanned out """
+        reads = []
+        released = threading.Event()
+
+        def read(since):
+            reads.append(since)
+            if len(reads) > 1:
+                released.wait()
+                return [], since
+            return [('1-a', {'id': 'a'})], '1-a'
+
+        feed = ChangeFeed(read)
+        results = []
+        subscribers = [threading.Thread(target=lambda: results.append(feed.wait(0, timeout=5)))
+                       for _ in range(5)]
+        for subscriber in subscribers:
+            subscriber.start()
+        feed.start()
+        feed.start()
+        for subscriber in subscribers:
+            subscriber.join()
+        released.set()
+        self.assertEqual(reads[:2], ['now', '1-a'])
+        self.assertEqual(len(results), 5)
+        for entries in results:
+            self.assertEqual([seq for _, seq, _ in entries], ['1-a'])
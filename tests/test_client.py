@@ -0,0 +1,166 @@
+"""
+Supplier Client Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_client.py:TestClient
+"""
+
+import json
+import asyncio
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from suppliers import SupplierClient, AsyncSupplierClient, SupplierError, ConflictError
+from suppliers.client import parse_events, MAX_IDS
+
+BASE_URL = 'http://localhost:5000'
+
+
+def response(status_code=200, body=None, headers=None, lines=None):
+    """ Returns a fake response of the session """
+    resp = MagicMock(status_code=status_code, headers=headers or {}, reason='Reason')
+    resp.json.return_value = body
+    resp.iter_lines.return_value = lines or []
+    resp.__enter__.return_value = resp
+    return resp
+
+
+def mget(method, url, json=None, **kwargs):  # pylint: disable=redefined-outer-name,unused-argument
+    """ Answers a multi-get with a Supplier for every id but 'missing', and a get """
+    if json is None:
+        return response(body={'_id': url.rsplit('/', 1)[1]})
+    ids = json['ids']
+    return response(body={'suppliers': [{'_id': supplier_id} for supplier_id in ids
+                                         if supplier_id != 'missing'],
+                          'missing': [supplier_id for supplier_id in ids
+                                      if supplier_id == 'missing']})
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestClient(TestCase):
+    """ Test Cases for the Supplier service client """
+
+    def setUp(self):
+        self.client = SupplierClient(BASE_URL + '/', api_key='key', window=0.05)
+        self.request = patch.object(self.client.session, 'request').start()
+
+    def tearDown(self):
+        patch.stopall()
+        self.client.close()
+
+    def test_pooled_session(self):
+        """ Every call goes through one session with a connection pool """
+        self.request.return_value = response(body={'_id': 'a'})
+        self.assertEqual(self.client.get('a'), {'_id': 'a'})
+        self.assertEqual(self.client.get('a/b'), {'_id': 'a'})
+        urls = [call[0][1] for call in self.request.call_args_list]
+        self.assertEqual(urls, [BASE_URL + '/suppliers/a', BASE_URL + '/suppliers/a%2Fb'])
+        adapter = self.client.session.get_adapter(BASE_URL)
+        self.assertEqual(adapter._pool_maxsize, 10)  # pylint: disable=protected-access
+        self.assertEqual(self.client.session.headers['X-Api-Key'], 'key')
+
+    def test_errors(self):
+        """ Error statuses are raised, a missing Supplier is None """
+        self.request.return_value = response(404, {'message': 'not found'})
+        self.assertIsNone(self.client.get('a'))
+        self.request.return_value = response(412, {'message': 'stale'})
+        with self.assertRaises(ConflictError) as context:
+            self.client.update('a', {'name': 'x'}, rev='1-a')
+        self.assertEqual(context.exception.status_code, 412)
+        self.assertEqual(self.request.call_args[1]['headers'], {'If-Match': '"1-a"'})
+        self.request.return_value = response(503, {'message': 'overloaded'})
+        self.assertRaises(SupplierError, self.client.list)
+
+    def test_last_write(self):
+        """ The last write is sent back so reads see it """
+        self.request.return_value = response(201, {'_id': 'a', '_rev': '1-a'},
+                                             {'X-Last-Write': 'a@1-a'})
+        self.client.create({'name': 'x'})
+        self.request.return_value = response(body=[])
+        self.client.list(name='x')
+        self.assertEqual(self.request.call_args[1]['headers'], {'X-Last-Write': 'a@1-a'})
+        self.assertEqual(self.request.call_args[1]['params'], {'name': 'x'})
+
+    def test_batches(self):
+        """ Many Suppliers are read and created in as few calls as the service allows """
+        self.request.side_effect = mget
+        ids = [str(i) for i in range(MAX_IDS * 2 + 1)] + ['missing']
+        suppliers, missing = self.client.get_many(ids)
+        self.assertEqual(len(suppliers), len(ids) - 1)
+        self.assertEqual(missing, ['missing'])
+        self.assertEqual(self.request.call_count, 3)
+        self.request.side_effect = lambda method, url, json=None, **kwargs: response(
+            201, [dict(supplier, _id='x') for supplier in json])
+        created = self.client.create_many([{'name': str(i)} for i in range(1500)])
+        self.assertEqual(len(created), 1500)
+        self.assertEqual(self.request.call_count, 5)
+        self.assertEqual(self.request.call_args[0][1], BASE_URL + '/suppliers/_bulk')
+
+    def test_lookup_coalesced(self):
+        """ Lookups of many threads within the window are one multi-get """
+        self.request.side_effect = mget
+        results = {}
+
+        def lookup(supplier_id):
+            results[supplier_id] = self.client.lookup(supplier_id, timeout=5)
+
+        threads = [threading.Thread(target=lookup, args=(supplier_id,))
+                   for supplier_id in ['a', 'b', 'c', 'a', 'missing']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {'a': {'_id': 'a'}, 'b': {'_id': 'b'}, 'c': {'_id': 'c'},
+                                   'missing': None})
+        self.request.assert_called_once()
+        self.assertEqual(sorted(self.request.call_args[1]['json']['ids']),
+                         ['a', 'b', 'c', 'missing'])
+
+    def test_lookup_int_id(self):
+        """ Lookups by a number find the Supplier with that id as a string """
+        self.request.side_effect = mget
+        self.assertEqual(self.client.lookup(7, timeout=5), {'_id': '7'})
+        self.assertEqual(self.request.call_args[1]['json']['ids'], ['7'])
+
+    def test_changes_resume_from_start(self):
+        """ A stream without changes is resumed from the sequence it started at """
+        self.request.side_effect = [
+            response(lines=['id: 5-e', 'event: start', 'data: {"seq": "5-e"}', '']),
+            response(lines=['id: 6-f', 'event: change', 'data: {"id": "f"}', ''])]
+        changes = self.client.changes()
+        self.assertEqual(next(changes), ('6-f', {'id': 'f'}))
+        params = [call[1]['params'] for call in self.request.call_args_list]
+        self.assertEqual(params, [None, {'since': '5-e'}])
+
+    def test_changes(self):
+        """ Changes are read from the event stream """
+        lines = [': keep-alive', '', 'id: 1-a', 'event: change',
+                 'data: ' + json.dumps({'id': 'a', 'deleted': False}), '',
+                 'id: 2-b', 'event: change', 'data: {"id": "b"}', '']
+        self.request.return_value = response(lines=lines)
+        changes = list(self.client.changes(since='0', reconnect=False))
+        self.assertEqual(changes, [('1-a', {'id': 'a', 'deleted': False}), ('2-b', {'id': 'b'})])
+        self.assertEqual(self.request.call_args[1]['params'], {'since': '0'})
+        self.assertTrue(self.request.call_args[1]['stream'])
+        self.assertEqual(list(parse_events(['data: a', 'data: b', ''])),
+                         [(None, 'message', 'a\nb')])
+
+    def test_async_lookup(self):
+        """ Lookups of many coroutines within the window are one multi-get """
+        client = AsyncSupplierClient(BASE_URL, window=0.05)
+        with patch.object(client.client.session, 'request', side_effect=mget) as request:
+            async def lookups():
+                return await asyncio.gather(*(client.lookup(supplier_id)
+                                              for supplier_id in ['a', 'b', 'a', 'missing', 3]))
+            loop = asyncio.new_event_loop()
+            try:
+                results = loop.run_until_complete(lookups())
+                supplier = loop.run_until_complete(client.get('a'))
+            finally:
+                loop.close()
+                client.close()
+        self.assertEqual(results, [{'_id': 'a'}, {'_id': 'b'}, {'_id': 'a'}, None, {'_id': '3'}])
+        self.assertEqual(supplier, {'_id': 'a'})
+        self.assertEqual(request.call_count, 2)
@@ -0,0 +1,63 @@
+"""
+JSON Codec Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_codec.py:TestCodec
+"""
+
+from unittest import TestCase
+from service import codec
+from service.codec import StdlibCodec, OrjsonCodec, get_codec
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestCodec(TestCase):
+    """ Test Cases for the JSON codecs """
+
+    def setUp(self):
+        self.codecs = [StdlibCodec] + ([OrjsonCodec] if codec.orjson else [])
+        self.supplier = {"_id": "abc", "name": "supplier1", "like_count": 2, "is_active": True,
+                         "products": [1, 2, 3], "rating": 8.5}
+
+
+    def test_round_trip(self):
+        """ Every codec encodes to bytes and decodes back """
+        for json_codec in self.codecs:
+            data = json_codec.dumps([self.supplier])
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(json_codec.loads(data), [self.supplier])
+            self.assertEqual(json_codec.loads(data.decode('utf8')), [self.supplier])
+
+
+    def test_codecs_agree(self):
+        """ The codecs can read each other's output """
+        for writer in self.codecs:
+            for reader in self.codecs:
+                self.assertEqual(reader.loads(writer.dumps(self.supplier)), self.supplier)
+
+
+    def test_bad_json(self):
+        """ Bad JSON raises a ValueError with every codec """
+        for json_codec in self.codecs:
+            self.assertRaises(ValueError, json_codec.loads, b'{"name": ')
+            self.assertRaises(ValueError, json_codec.loads, b'')
+
+
+    def test_big_integers(self):
+        """ Values the fast codec refuses still encode """
+        for json_codec in self.codecs:
+            self.assertEqual(json_codec.loads(json_codec.dumps({'like_count': 2 ** 70})),
+                             {'like_count': 2 ** 70})
+
+
+    def test_get_codec(self):
+        """ The codec can be chosen by name """
+        self.assertIs(get_codec('json'), StdlibCodec)
+        if codec.orjson:
+            self.assertIs(get_codec(), OrjsonCodec)
+            self.assertIs(get_codec('orjson'), OrjsonCodec)
+        else:
+            self.assertIs(get_codec(), StdlibCodec)
+            self.assertRaises(ImportError, get_codec, 'orjson')
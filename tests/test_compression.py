@@ -0,0 +1,97 @@
+"""
+HTTP Compression Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_compression.py:TestCompression
+"""
+
+import io
+import gzip
+import zlib
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from service import compression
+from service.compression import Compressor, DecompressionMiddleware, compress_stream
+
+
+def echo(environ, start_response):
+    """ A WSGI app that answers with the body it was sent """
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    start_response('200 OK', [('Content-Length', str(len(body)))])
+    return [body]
+
+
+def call(app, body, **environ):
+    """ Sends a gzip body to a WSGI app and returns the status and the body it answered """
+    environ = dict({'REQUEST_METHOD': 'POST', 'HTTP_CONTENT_ENCODING': 'gzip',
+                    'wsgi.input': io.BytesIO(body)}, **environ)
+    status = []
+    answer = b''.join(app(environ, lambda code, headers: status.append(code)))
+    return status[0], answer
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestCompression(TestCase):
+    """ Test Cases for response compression and request decompression """
+
+    def test_closing_stream_closes_body(self):
+        """ Closing a compressed stream early closes the body it compresses """
+        closed = []
+
+        def body():
+            try:
+                for number in range(10):
+                    yield str(number).encode('utf8')
+            finally:
+                closed.append(True)
+
+        stream = compress_stream(body(), Compressor('deflate'), 'utf8')
+        next(stream)
+        stream.close()
+        self.assertEqual(closed, [True])
+        stream = compress_stream(iter([b'a', 'b']), Compressor('deflate'), 'utf8')
+        self.assertEqual(zlib.decompress(b''.join(stream)), b'ab')
+
+
+    def test_stream_flushed_every_flush_size(self):
+        """ A streamed body is flushed every FLUSH_SIZE bytes, not every chunk """
+        chunks = [b'{"name": "supplier"},'] * 2000
+        stream = list(compress_stream(iter(chunks), Compressor('gzip'), 'utf8'))
+        self.assertEqual(gzip.decompress(b''.join(stream)), b''.join(chunks))
+        self.assertLessEqual(len(stream), len(b''.join(chunks)) // compression.FLUSH_SIZE + 2)
+        flushed = Compressor('gzip')
+        every_chunk = b''.join([flushed.compress(chunk) + flushed.flush() for chunk in chunks])
+        self.assertLess(len(b''.join(stream)), len(every_chunk))
+
+
+    def test_br_body_inflated_in_chunks(self):
+        """ A br body is refused as soon as it inflates past the limit """
+        fake_brotli = MagicMock(error=ValueError)
+        decompressor = fake_brotli.Decompressor.return_value
+        decompressor.process.side_effect = lambda chunk: b'x' * (len(chunk) * 1000)
+        decompressor.is_finished.return_value = True
+        with patch('service.compression.brotli', fake_brotli):
+            body = b'b' * (compression.BR_CHUNK_SIZE * 100)
+            self.assertRaises(RequestEntityTooLarge, compression.decompress,
+                              body, 'br', compression.BR_CHUNK_SIZE * 1500)
+            self.assertEqual(decompressor.process.call_count, 2)
+            self.assertEqual(compression.decompress(b'b' * 10, 'br', 100000), b'x' * 10000)
+            decompressor.is_finished.return_value = False
+            self.assertRaises(BadRequest, compression.decompress, b'b' * 10, 'br', 100000)
+
+
+    def test_chunked_body(self):
+        """ A compressed body without a Content-Length is read to the end of the input """
+        app = DecompressionMiddleware(echo, max_size=1024)
+        body = gzip.compress(b'{"name": "supplier"}')
+        self.assertEqual(call(app, body, CONTENT_LENGTH=str(len(body))),
+                         ('200 OK', b'{"name": "supplier"}'))
+        self.assertEqual(call(app, body, **{'wsgi.input_terminated': True}),
+                         ('200 OK', b'{"name": "supplier"}'))
+        self.assertTrue(call(app, body)[0].startswith('411'))
+        self.assertTrue(call(app, b'x' * 2048, **{'wsgi.input_terminated': True})[0]
+                        .startswith('413'))
+        self.assertTrue(call(app, body, CONTENT_LENGTH='many')[0].startswith('400'))
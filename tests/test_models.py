@@ -7,10 +7,14 @@ nosetests --stop tests/test_models.py:TestModels
 
 import os
 import json
+import tracemalloc
+import threading
+import subprocess
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from requests import HTTPError
-from service.models import Supplier, DataValidationError, DatabaseConnectionError
+from service.models import Supplier, DataValidationError, DatabaseConnectionError, \
+    DatabaseConflictError, check_partition, partition_of
 from .suppliers_factory import SupplierFactory
 
 
@@ -101,6 +105,21 @@ class TestModels(TestCase):
         self.assertEqual(suppliers[0].name, supplier.name)
 
 
+    def test_update_a_supplier_with_stale_revision(self):
+        """ Update a Supplier that was changed since it was read """
+        supplier = SupplierFactory()
+        supplier.save()
+        self.assertIsNotNone(supplier.rev)
+        first = Supplier.find(supplier.id)
+        second = Supplier.find(supplier.id)
+        first.rating = 9.0
+        first.save()
+        self.assertNotEqual(first.rev, second.rev)
+        second.rating = 1.0
+        self.assertRaises(DatabaseConflictError, second.save)
+        self.assertEqual(Supplier.find(supplier.id).rating, 9.0)
+
+
     def test_update_a_supplier_with_wrong_id(self):
         """ Update a Supplier with wrong Id"""
         supplier = SupplierFactory()
@@ -113,6 +132,66 @@ class TestModels(TestCase):
         self.assertEqual(len(suppliers), 0)
 
 
+    def test_patch_a_supplier(self):
+        """ Change some fields of a Supplier through the update handler """
+        supplier = Supplier("supplier1", 2, True, [1, 2, 3], 8.5)
+        supplier.save()
+        with patch.object(Supplier, '_send_once', side_effect=Supplier._send_once) as send_mock:
+            patched = Supplier.patch(supplier.id, {'rating': 9.5})
+        # only the changed field is sent, in one request
+        send_mock.assert_called_once()
+        self.assertEqual(send_mock.call_args[0][3], {'rating': 9.5})
+        self.assertEqual(patched.serialize(), dict(supplier.serialize(), rating=9.5,
+                                                   _rev=patched.rev))
+        self.assertNotEqual(patched.rev, supplier.rev)
+        self.assertEqual(Supplier.find(supplier.id).serialize(), patched.serialize())
+        self.assertEqual(Supplier.last_write(), (supplier.id, patched.rev))
+        # fields of the document itself are left alone
+        self.assertEqual(Supplier.patch(supplier.id, {'_id': 'x', 'like_count': 3}).id,
+                         supplier.id)
+
+
+    def test_patch_a_supplier_with_stale_revision(self):
+        """ Change some fields of a Supplier that was changed since it was read """
+        supplier = Supplier("supplier1", 2, True, [1, 2, 3], 8.5)
+        supplier.save()
+        patched = Supplier.patch(supplier.id, {'rating': 9.0}, supplier.rev)
+        self.assertRaises(DatabaseConflictError, Supplier.patch, supplier.id,
+                          {'rating': 1.0}, supplier.rev)
+        self.assertEqual(Supplier.find(supplier.id).rating, 9.0)
+        self.assertIsNone(Supplier.patch('0', {'rating': 1.0}))
+        self.assertEqual(Supplier.patch(supplier.id, {'name': 'x'}, patched.rev).name, 'x')
+
+
+    def test_install_design(self):
+        """ The update handler is only written when it is missing or differs """
+        Supplier.remove_all()
+        with patch.object(Supplier, '_request', side_effect=Supplier._request) as request_mock:
+            Supplier.install_design()
+        self.assertNotIn('PUT', [call[0][0] for call in request_mock.call_args_list])
+
+
+    def test_create_with_write_behind(self):
+        """ Create Suppliers concurrently through the group commit queue """
+        Supplier.enable_write_behind(window=0.05, max_docs=10)
+        try:
+            suppliers = [SupplierFactory() for _ in range(20)]
+            threads = [threading.Thread(target=supplier.create) for supplier in suppliers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # update one of them through the queue as well
+            suppliers[0].rating = 9.9
+            suppliers[0].save()
+        finally:
+            Supplier.disable_write_behind()
+        self.assertTrue(all(supplier.id for supplier in suppliers))
+        self.assertEqual(len(set(supplier.id for supplier in suppliers)), 20)
+        self.assertEqual(len(Supplier.all()), 20)
+        self.assertEqual(Supplier.find(suppliers[0].id).rating, 9.9)
+
+
     def test_delete_a_supplier(self):
         """ Delete a Supplier """
         supplier = SupplierFactory()
@@ -224,6 +303,25 @@ class TestModels(TestCase):
         self.assertIs(supplier, None)
 
 
+    def test_find_many(self):
+        """ Find many Suppliers by id in one call """
+        supplier1 = Supplier("supplier1", 2, True, [1, 2, 3], 8.5)
+        supplier1.save()
+        supplier2 = Supplier("supplier2", 4, False, [1, 3, 5, 7], 6.5)
+        supplier2.save()
+        suppliers, missing = Supplier.find_many([supplier2.id, "0", supplier1.id, supplier2.id])
+        self.assertEqual([supplier.id for supplier in suppliers], [supplier2.id, supplier1.id])
+        self.assertEqual(suppliers[1].name, "supplier1")
+        self.assertEqual(missing, ["0"])
+
+
+    def test_find_many_with_no_ids(self):
+        """ Find many Suppliers with an empty list of ids """
+        suppliers, missing = Supplier.find_many([])
+        self.assertEqual(suppliers, [])
+        self.assertEqual(missing, [])
+
+
     def test_find_by_name(self):
         """ Find a Supplier by Name """
         Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
@@ -271,7 +369,112 @@ class TestModels(TestCase):
         self.assertEqual(suppliers[0].rating, 8.5)
 
 
-    @patch('cloudant.database.CloudantDatabase.create_document')
+    def test_find_by_range(self):
+        """ Find Suppliers with a rating or like count in a range """
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        Supplier("supplier2", 4, False, [1, 3, 5, 7], 6.5).save()
+        Supplier("supplier3", 6, False, [1, 3, 5], 7.2).save()
+        Supplier("supplier4", 8, True, [1, 2, 5], "").save()
+        suppliers = Supplier.find_by_range("rating", 6.5, 8)
+        self.assertEqual(sorted(s.name for s in suppliers), ["supplier2", "supplier3"])
+        suppliers = Supplier.find_by_range("rating", minimum=7)
+        self.assertEqual(sorted(s.name for s in suppliers), ["supplier1", "supplier3"])
+        suppliers = Supplier.find_by_range("like_count", maximum=4)
+        self.assertEqual(sorted(s.name for s in suppliers), ["supplier1", "supplier2"])
+        self.assertEqual(Supplier.find_by_range("like_count", 5, 5), [])
+        self.assertRaises(DataValidationError, Supplier.find_by_range, "rating")
+
+
+    @patch('time.sleep')
+    def test_reads_retried_on_transient_errors(self, sleep_mock):
+        """ Reads that fail with a 503 are retried, writes are not """
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        send = Supplier._send
+        failures = []
+
+        def fail_once(*args):
+            if not failures:
+                failures.append(args)
+                raise HTTPError(response=MagicMock(status_code=503))
+            return send(*args)
+
+        with patch.object(Supplier, '_send', side_effect=fail_once):
+            self.assertEqual([s.name for s in Supplier.all()], ["supplier1"])
+        self.assertEqual(sleep_mock.call_count, 1)
+        del failures[:]
+        with patch.object(Supplier, '_send', side_effect=fail_once):
+            self.assertRaises(HTTPError, Supplier.create_many, [Supplier("supplier2", 1, True, [], 1.0)])
+
+
+    def test_find_by_name_prefix(self):
+        """ Find Suppliers whose name starts with a prefix """
+        Supplier("acme foods", 2, True, [1, 2, 3], 8.5).save()
+        Supplier("acme", 4, False, [1, 3, 5, 7], 6.5).save()
+        Supplier("global acme", 6, False, [1, 3, 5], 7.2).save()
+        Supplier("acme supply", 8, True, [1, 2, 5], 4.5).save()
+        suppliers = Supplier.find_by_name_prefix("acme")
+        self.assertEqual([s.name for s in suppliers], ["acme", "acme foods", "acme supply"])
+        suppliers = Supplier.find_by_name_prefix("acme ", limit=1)
+        self.assertEqual([s.name for s in suppliers], ["acme foods"])
+        self.assertEqual(Supplier.find_by_name_prefix("zeta"), [])
+
+
+    def test_partitioned_database(self):
+        """ Create and query Suppliers in the partitions of a partitioned database """
+        Supplier.init_db("test-partitioned", partitioned=True)
+        try:
+            Supplier.remove_all()
+            self.assertTrue(Supplier.partitioned)
+            Supplier("supplier1", 2, True, [1, 2, 3], 8.5, partition="east").save()
+            Supplier("supplier2", 4, True, [1, 3, 5, 7], 6.5, partition="west").save()
+            supplier = Supplier("supplier3", 6, False, [1, 3, 5], 7.2)
+            supplier.save()
+            self.assertTrue(supplier.id.startswith("default:"))
+            self.assertEqual(Supplier.find(supplier.id).partition, "default")
+            suppliers = Supplier.find_by_greater("rating", 6, partition="east")
+            self.assertEqual([s.name for s in suppliers], ["supplier1"])
+            self.assertEqual([s.name for s in Supplier.all("west")], ["supplier2"])
+            self.assertEqual(len(Supplier.find_by_greater("rating", 6)), 3)
+            self.assertEqual([s.name for s in Supplier.recommend([1], 1, "west")[1]],
+                             ["supplier2"])
+            self.assertRaises(DataValidationError, Supplier.all, "_east")
+        finally:
+            Supplier.init_db("test")
+
+
+    def test_partition_on_global_database(self):
+        """ Partition queries need a partitioned database """
+        self.assertFalse(Supplier.partitioned)
+        self.assertRaises(DataValidationError, Supplier.find_by_name, "supplier1", "east")
+        supplier = Supplier("supplier1", 2, True, [1, 2, 3], 8.5, partition="east")
+        supplier.save()
+        self.assertIsNone(partition_of(supplier.id))
+
+
+    def test_check_partition(self):
+        """ Check partition keys """
+        self.assertEqual(check_partition("east"), "east")
+        for partition in ["", None, "a:b", "_design", 5]:
+            self.assertRaises(DataValidationError, check_partition, partition)
+        self.assertEqual(partition_of("east:123"), "east")
+        self.assertIsNone(partition_of("123"))
+
+
+    def test_recommend(self):
+        """ Recommend the top k active Suppliers for many products """
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        Supplier("supplier2", 4, False, [1, 3, 5, 7], 9.5).save()
+        Supplier("supplier3", 6, True, [1, 3, 5], 7.2).save()
+        Supplier("supplier4", 8, True, [1, 2, 5], 4.5).save()
+        recommendations = Supplier.recommend([1, 5, 7, 9], 2)
+        self.assertEqual([s.name for s in recommendations[1]], ["supplier1", "supplier3"])
+        self.assertEqual([s.name for s in recommendations[5]], ["supplier3", "supplier4"])
+        self.assertEqual(recommendations[7], [])
+        self.assertEqual(recommendations[9], [])
+        self.assertEqual(Supplier.recommend([], 2), {})
+
+
+    @patch('service.models.Supplier._send')
     def test_http_error(self, bad_mock):
         """ Test a Bad Create with HTTP error """
         bad_mock.side_effect = HTTPError()
@@ -280,13 +483,111 @@ class TestModels(TestCase):
         self.assertIsNone(supplier.id)
 
 
-    @patch('cloudant.document.Document.exists')
-    def test_document_not_exist(self, bad_mock):
-        """ Test a Bad Document Exists """
-        bad_mock.return_value = False
+    def test_create_not_cached(self):
+        """ Created Suppliers are not kept in the client's document cache """
         supplier = Supplier("supplier1", 2, True, [1, 2, 3], 8.5)
         supplier.create()
-        self.assertIsNone(supplier.id)
+        self.assertIsNotNone(supplier.id)
+        self.assertIsNotNone(supplier.rev)
+        self.assertEqual(len(Supplier.database), 0)
+
+
+    def test_iterate_in_batches(self):
+        """ Iterate over every Supplier a batch at a time """
+        for i in range(5):
+            Supplier("supplier{}".format(i), i, True, [1, 2, 3], 8.5).save()
+        send = Supplier._send
+        with patch.object(Supplier, '_send', side_effect=send) as send_mock:
+            names = sorted(s.name for s in Supplier.iterate(batch_size=2))
+        self.assertEqual(names, ["supplier{}".format(i) for i in range(5)])
+        self.assertEqual(send_mock.call_count, 3)
+        self.assertEqual(len(Supplier.database), 0)
+        Supplier.remove_all()
+        self.assertEqual(Supplier.all(), [])
+
+
+    def test_iterate_memory_is_flat(self):
+        """ Iterating over many Suppliers only holds a batch of them at a time """
+        total = 200000
+
+        def all_docs(method, url, params=None, body=None):  # pylint: disable=unused-argument
+            start = int(json.loads(params['startkey'])) if 'startkey' in params else 0
+            return {'rows': [{'id': '{:07d}'.format(i), 'doc': {
+                '_id': '{:07d}'.format(i), '_rev': '1-a', 'name': 'supplier{}'.format(i),
+                'like_count': i, 'is_active': True, 'products': [1, 2, 3], 'rating': 4.5
+            }} for i in range(start, min(total, start + params['limit']))]}
+
+        count = 0
+        with patch.object(Supplier, '_send', side_effect=all_docs):
+            suppliers = Supplier.iterate(batch_size=1000)
+            next(suppliers)
+            tracemalloc.start()
+            try:
+                for _ in suppliers:
+                    count += 1
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        self.assertEqual(count, total - 1)
+        # a list of them all would take well over 100MB
+        self.assertLess(peak, 8 * 1024 * 1024)
+
+
+    def test_ephemeral_database(self):
+        """ Ephemeral databases are per process and dropped with their leftovers """
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        stale = 'test-ephemeral-{}-deadbeef'.format(finished.pid)
+        Supplier.client.create_database(stale)
+        Supplier.init_db("test-ephemeral", ephemeral=True)
+        dbname = Supplier.ephemeral_name("test-ephemeral")
+        self.assertEqual(Supplier.database.database_name, dbname)
+        self.assertIn(str(os.getpid()), dbname)
+        self.assertIn(dbname, Supplier.ephemeral_databases)
+        databases = Supplier.client.all_dbs()
+        self.assertIn(dbname, databases)
+        self.assertNotIn(stale, databases)
+        Supplier("supplier1", 2, True, [1, 2, 3], 8.5).save()
+        self.assertEqual(len(Supplier.all()), 1)
+        Supplier.drop_ephemeral_databases()
+        self.assertNotIn(dbname, Supplier.client.all_dbs())
+        self.assertEqual(Supplier.ephemeral_databases, set())
+
+
+    def test_read_replica(self):
+        """ Finders read the replica and writes go to the primary """
+        Supplier.init_db("test", read_url=Supplier.client.server_url)
+        self.assertIsNotNone(Supplier.read_database)
+        supplier = Supplier("supplier1", 2, True, [1, 2, 3], 8.5)
+        supplier.save()
+        self.assertEqual(Supplier.last_write(), (supplier.id, supplier.rev))
+        self.assertEqual(Supplier.find(supplier.id).name, "supplier1")
+        self.assertEqual([s.name for s in Supplier.find_by_name("supplier1")], ["supplier1"])
+        Supplier.init_db("test", read_url='')
+        self.assertIsNone(Supplier.read_database)
+
+
+    def test_read_your_writes(self):
+        """ A thread reads the primary until the replica has its last write """
+        replica = MagicMock(database_url='http://replica:5984/test', database_name='test')
+        replica.client.server_url = 'http://replica:5984'
+        with patch.object(Supplier, 'read_database', replica):
+            try:
+                self.assertTrue(Supplier._url('_find', replica=True).startswith(
+                    'http://replica:5984/test/'))
+                replica.r_session.head.return_value = MagicMock(status_code=404)
+                Supplier.read_after('abc', '2-def')
+                self.assertEqual(Supplier._url('_find', replica=True),
+                                 Supplier._url('_find'))
+                replica.r_session.head.return_value = MagicMock(status_code=200)
+                Supplier.read_after('abc', '2-def')
+                self.assertTrue(Supplier._url('_find', replica=True).startswith(
+                    'http://replica:5984/test/'))
+                replica.r_session.head.assert_called_with('http://replica:5984/test/abc',
+                                                          params={'rev': '2-def'})
+            finally:
+                Supplier.reset_routing()
+        self.assertIsNone(Supplier.last_write())
 
 
     def test_vcap_no_services(self):
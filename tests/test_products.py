@@ -0,0 +1,58 @@
+"""
+Product Set Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_products.py:TestProductSet
+"""
+
+from unittest import TestCase
+from service.models import Supplier
+from service.products import ProductSet
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestProductSet(TestCase):
+    """ Test Cases for the compact product membership """
+
+    def test_membership(self):
+        """ Look up products in a ProductSet """
+        products = ProductSet([7, 3, 3, 11, 1])
+        self.assertEqual(list(products), [1, 3, 7, 11])
+        self.assertEqual(len(products), 4)
+        for product_id in [1, 3, 7, 11]:
+            self.assertIn(product_id, products)
+        for product_id in [0, 2, 12, -1, "3", None]:
+            self.assertNotIn(product_id, products)
+
+
+    def test_skips_non_product_ids(self):
+        """ Values that are not product ids are left out """
+        products = ProductSet([1, "2", None, True, 2 ** 70, 3.0])
+        self.assertEqual(list(products), [1])
+
+
+    def test_intersection(self):
+        """ Intersect a ProductSet with other product ids """
+        products = ProductSet(range(0, 1000, 2))
+        self.assertEqual(products.intersection([5, 4, 998, 1000]), [4, 998])
+        self.assertEqual(products.intersection(ProductSet(range(0, 1000, 3))),
+                         list(range(0, 1000, 6)))
+        self.assertEqual(products.intersection([]), [])
+        self.assertTrue(products.isdisjoint([1, 3, 1001]))
+        self.assertFalse(products.isdisjoint([1, 2]))
+
+
+    def test_supplier_products(self):
+        """ A Supplier keeps its product list and answers membership from the set """
+        supplier = Supplier("supplier1", 2, True, [3, 1, 2], 8.5)
+        self.assertTrue(supplier.has_product(2))
+        self.assertFalse(supplier.has_product(4))
+        self.assertEqual(supplier.serialize()['products'], [3, 1, 2])
+        supplier.products = [4]
+        self.assertTrue(supplier.has_product(4))
+        self.assertFalse(supplier.has_product(2))
+        supplier.deserialize({"name": "supplier1", "like_count": 2, "is_active": True,
+                              "products": [9], "rating": 8.5})
+        self.assertTrue(supplier.has_product(9))
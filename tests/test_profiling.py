@@ -0,0 +1,61 @@
+"""
+Request Profiling Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_profiling.py:TestProfiling
+"""
+
+import os
+import pstats
+import shutil
+import tempfile
+from unittest import TestCase
+from flask import Flask, jsonify
+from service import profiling
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestProfiling(TestCase):
+    """ Test Cases for on-demand request profiling """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.config.update(API_KEY='test-key', PROFILE_DIR=self.directory, PROFILE_KEEP=3)
+
+        @app.route('/suppliers')
+        def suppliers():  # pylint: disable=unused-variable
+            return jsonify(sorted(range(1000), key=str))
+
+        profiling.init_app(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_not_profiled(self):
+        """ Requests without the header or the key are not profiled """
+        resp = self.client.get('/suppliers')
+        self.assertNotIn('X-Profile-File', resp.headers)
+        resp = self.client.get('/suppliers', headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile-File', resp.headers)
+        resp = self.client.get('/suppliers', headers={'X-Profile': '1', 'X-Api-Key': 'wrong'})
+        self.assertNotIn('X-Profile-File', resp.headers)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_profiled(self):
+        """ A request with the header and the key is profiled to a pstats file """
+        resp = self.client.get('/suppliers', headers={'X-Profile': '1', 'X-Api-Key': 'test-key'})
+        self.assertEqual(resp.status_code, 200)
+        name = resp.headers['X-Profile-File']
+        self.assertIn('GET-suppliers', name)
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        self.assertTrue(any(function[2] == 'suppliers' for function in stats.stats))
+
+    def test_ring_buffer(self):
+        """ Only the latest profiles are kept """
+        names = [self.client.get('/suppliers', headers={'X-Profile': '1', 'X-Api-Key': 'test-key'})
+                 .headers['X-Profile-File'] for _ in range(5)]
+        self.assertEqual(sorted(os.listdir(self.directory)), names[-3:])
@@ -0,0 +1,198 @@
+"""
+Database Guards Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_resilience.py:TestAdaptiveLimiter
+"""
+
+import time
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from requests import PreparedRequest, ConnectionError, ReadTimeout
+from service import deadline
+from service.resilience import AdaptiveLimiter, CircuitBreaker, GuardedAdapter, \
+    ConcurrencyLimitError, CircuitOpenError, ThrottledError, retry_after_seconds
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestAdaptiveLimiter(TestCase):
+    """ Test Cases for the AIMD concurrency limiter """
+
+    def test_additive_increase(self):
+        """ The limit grows by one after a limit's worth of good responses """
+        limiter = AdaptiveLimiter(initial=4, maximum=5)
+        for _ in range(4):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 4)
+        limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 5)
+        for _ in range(20):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 5)
+
+
+    def test_multiplicative_decrease(self):
+        """ The limit halves on an overload, once per round trip """
+        limiter = AdaptiveLimiter(initial=16, minimum=2)
+        limiter.release(limiter.acquire(), overloaded=True)
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(limiter.acquire(), overloaded=True)
+        limiter.release(limiter.acquire(), overloaded=True)
+        limiter.release(limiter.acquire(), overloaded=True)
+        self.assertEqual(limiter.limit, 2)
+
+
+    def test_refuses_when_full(self):
+        """ A request that finds no slot in time is refused """
+        limiter = AdaptiveLimiter(initial=1, timeout=0.05)
+        started = limiter.acquire()
+        self.assertRaises(ConcurrencyLimitError, limiter.acquire)
+        threading.Timer(0.01, limiter.release, (started,)).start()
+        limiter.acquire()
+        self.assertEqual(limiter.metrics()['db_limiter_rejected_total'], 1)
+        self.assertEqual(limiter.metrics()['db_in_flight'], 1)
+
+
+class TestCircuitBreaker(TestCase):
+    """ Test Cases for the circuit breaker """
+
+    def test_opens_and_recovers(self):
+        """ The circuit opens on errors, probes after the cool off and closes """
+        breaker = CircuitBreaker(error_rate=0.5, window=10, minimum_requests=4,
+                                 open_seconds=0.05)
+        for failed in [False, True, False]:
+            breaker.allow()
+            breaker.record(failed)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.allow()
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertRaises(CircuitOpenError, breaker.allow)
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.allow()
+        self.assertRaises(CircuitOpenError, breaker.allow)
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.metrics()['db_circuit_opened_total'], 1)
+        self.assertEqual(breaker.metrics()['db_circuit_rejected_total'], 2)
+
+
+    def test_failed_probe(self):
+        """ A failed probe opens the circuit again """
+        breaker = CircuitBreaker(minimum_requests=1, open_seconds=0.01)
+        breaker.record(True)
+        time.sleep(0.02)
+        breaker.allow()
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class TestGuardedAdapter(TestCase):
+    """ Test Cases for the guarded transport adapter """
+
+    def tearDown(self):
+        deadline.clear()
+
+
+    def setUp(self):
+        self.adapter = GuardedAdapter(AdaptiveLimiter(initial=10),
+                                      CircuitBreaker(minimum_requests=2, open_seconds=60))
+        self.request = PreparedRequest()
+        self.request.prepare(method='GET', url='http://localhost:5984/test')
+
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_throttled(self, send_mock):
+        """ A 429 is counted and raised with its Retry-After """
+        send_mock.return_value = MagicMock(status_code=429, headers={'Retry-After': '7'})
+        with self.assertRaises(ThrottledError) as context:
+            self.adapter.send(self.request)
+        self.assertEqual(context.exception.retry_after, 7)
+        self.assertEqual(self.adapter.limiter.limit, 5)
+        metrics = self.adapter.metrics()
+        self.assertEqual(metrics['db_throttled_total'], 1)
+        self.assertEqual(metrics['db_in_flight'], 0)
+
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_failures_open_the_circuit(self, send_mock):
+        """ Connection errors and 5xx open the circuit, which then fails fast """
+        send_mock.side_effect = ConnectionError()
+        self.assertRaises(ConnectionError, self.adapter.send, self.request)
+        send_mock.side_effect = None
+        send_mock.return_value = MagicMock(status_code=503, headers={})
+        self.assertEqual(self.adapter.send(self.request).status_code, 503)
+        self.assertRaises(CircuitOpenError, self.adapter.send, self.request)
+        self.assertEqual(send_mock.call_count, 2)
+        metrics = self.adapter.metrics()
+        self.assertEqual(metrics['db_failures_total'], 2)
+        self.assertEqual(metrics['db_circuit_state'], 2)
+
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_deadline_becomes_the_timeout(self, send_mock):
+        """ Calls get the time left before the deadline as their timeout """
+        send_mock.return_value = MagicMock(status_code=200)
+        self.adapter.send(self.request, timeout=None)
+        self.assertIsNone(send_mock.call_args[1]['timeout'])
+        deadline.start(2)
+        self.adapter.send(self.request, timeout=(5, 1))
+        connect, read = send_mock.call_args[1]['timeout']
+        self.assertTrue(1.9 < connect <= 2)
+        self.assertEqual(read, 1)
+
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_deadline_exceeded(self, send_mock):
+        """ Calls out of time raise DeadlineExceeded and do not count as failures """
+        deadline.start(-1)
+        self.assertRaises(deadline.DeadlineExceeded, self.adapter.send, self.request)
+        send_mock.assert_not_called()
+        deadline.start(0.01)
+
+        def time_out(*args, **kwargs):
+            time.sleep(0.02)
+            raise ReadTimeout()
+
+        send_mock.side_effect = time_out
+        self.assertRaises(deadline.DeadlineExceeded, self.adapter.send, self.request)
+        metrics = self.adapter.metrics()
+        self.assertEqual(metrics['db_failures_total'], 0)
+        self.assertEqual(metrics['db_in_flight'], 0)
+        self.assertEqual(metrics['db_circuit_error_rate'], 0.0)
+
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_long_polls_skip_the_limiter(self, send_mock):
+        """ Long polls of the changes feed neither take a slot nor a latency sample """
+        limiter = AdaptiveLimiter(initial=1, timeout=0.01)
+        adapter = GuardedAdapter(limiter, CircuitBreaker())
+        poll = PreparedRequest()
+        poll.prepare(method='GET', url='http://localhost:5984/test/_changes',
+                     params={'feed': 'longpoll', 'since': 'now', 'timeout': 30000})
+        started = limiter.acquire()
+
+        def wait_for_changes(*args, **kwargs):
+            time.sleep(0.05)
+            return MagicMock(status_code=200)
+
+        send_mock.side_effect = wait_for_changes
+        self.assertEqual(adapter.send(poll).status_code, 200)
+        self.assertRaises(ConcurrencyLimitError, adapter.send, self.request)
+        limiter.release(started)
+        metrics = adapter.metrics()
+        self.assertEqual(metrics['db_in_flight'], 0)
+        self.assertLess(metrics['db_latency_seconds'], 0.05)
+        self.assertEqual(metrics['db_requests_total'], 1)
+
+
+    def test_retry_after_seconds(self):
+        """ Parse Retry-After headers """
+        self.assertEqual(retry_after_seconds('3'), 3)
+        self.assertEqual(retry_after_seconds('0.2'), 1)
+        self.assertEqual(retry_after_seconds(None), 1)
+        self.assertEqual(retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT', 2), 2)
@@ -0,0 +1,86 @@
+"""
+Retry Policy Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_retry.py:TestRetryPolicy
+"""
+
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from service import deadline
+from service.retry import RetryPolicy
+
+
+def is_value_error(error):
+    """ Retries ValueErrors only """
+    return isinstance(error, ValueError)
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestRetryPolicy(TestCase):
+    """ Test Cases for retries with decorrelated jitter """
+
+    def tearDown(self):
+        deadline.clear()
+
+
+    def test_delays(self):
+        """ Waits stay between the delay and the cap and grow at most by the backoff """
+        policy = RetryPolicy(count=50, delay=0.1, backoff=3, max_delay=2)
+        delays = list(policy.delays())
+        self.assertEqual(len(delays), 50)
+        previous = 0.1
+        for delay in delays:
+            self.assertGreaterEqual(delay, 0.1)
+            self.assertLessEqual(delay, min(2, previous * 3))
+            previous = delay
+
+
+    @patch('time.sleep')
+    def test_retries_until_success(self, sleep_mock):
+        """ Transient errors are retried """
+        function = MagicMock(side_effect=[ValueError(), ValueError(), 'done'])
+        policy = RetryPolicy(count=3, delay=0.01)
+        self.assertEqual(policy.call(function, is_value_error, 1, key=2), 'done')
+        self.assertEqual(function.call_count, 3)
+        function.assert_called_with(1, key=2)
+        self.assertEqual(sleep_mock.call_count, 2)
+
+
+    @patch('time.sleep')
+    def test_gives_up(self, sleep_mock):
+        """ Other errors and errors after the last retry are raised """
+        policy = RetryPolicy(count=2, delay=0.01)
+        function = MagicMock(side_effect=KeyError())
+        self.assertRaises(KeyError, policy.call, function, is_value_error)
+        self.assertEqual(function.call_count, 1)
+        function = MagicMock(side_effect=ValueError())
+        self.assertRaises(ValueError, policy.call, function, is_value_error)
+        self.assertEqual(function.call_count, 3)
+        self.assertEqual(sleep_mock.call_count, 2)
+
+
+    @patch('time.sleep')
+    def test_stops_at_the_deadline(self, sleep_mock):
+        """ A retry that would wait past the deadline is not made """
+        deadline.start(0.5)
+        function = MagicMock(side_effect=ValueError())
+        policy = RetryPolicy(count=5, delay=1)
+        self.assertRaises(ValueError, policy.call, function, is_value_error)
+        self.assertEqual(function.call_count, 1)
+        sleep_mock.assert_not_called()
+
+
+    def test_deadline(self):
+        """ The deadline counts down and can be cleared """
+        self.assertIsNone(deadline.remaining())
+        deadline.start(10)
+        self.assertGreater(deadline.remaining(), 9)
+        self.assertFalse(deadline.expired())
+        deadline.start(-1)
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertTrue(deadline.expired())
+        deadline.clear()
+        self.assertFalse(deadline.expired())
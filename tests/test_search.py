@@ -0,0 +1,65 @@
+"""
+Name Search Index Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_search.py:TestNameIndex
+"""
+
+from unittest import TestCase
+from service.search import NameIndex
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestNameIndex(TestCase):
+    """ Test Cases for the in-process name search index """
+
+    def setUp(self):
+        """ Runs before each test """
+        self.index = NameIndex([(1, 'Acme Supply'), (2, 'Acme Foods'),
+                                (3, 'Global Parts'), (4, 'acme')])
+
+
+    def test_prefix(self):
+        """ Look up names by prefix in name order """
+        self.assertEqual(self.index.prefix('AC'), [4, 2, 1])
+        self.assertEqual(self.index.prefix('acme s'), [1])
+        self.assertEqual(self.index.prefix('ac', limit=2), [4, 2])
+        self.assertEqual(self.index.prefix('zeta'), [])
+
+
+    def test_contains(self):
+        """ Look up names containing a text """
+        self.assertEqual(self.index.contains('SUPP'), [1])
+        self.assertEqual(self.index.contains('me'), [4, 2, 1])
+        self.assertEqual(self.index.contains('parts'), [3])
+        self.assertEqual(self.index.contains('acme parts'), [])
+
+
+    def test_similar(self):
+        """ Look up names that look like a misspelled text """
+        self.assertEqual(self.index.similar('Acme Suply'), [1, 4])
+        self.assertEqual(self.index.similar('glbal parts'), [3])
+        self.assertEqual(self.index.similar('zzz'), [])
+        self.assertEqual(self.index.similar(''), [])
+
+
+    def test_add_and_remove(self):
+        """ Rename and remove names in the index """
+        self.index.add(2, 'Zeta')
+        self.index.remove(1)
+        self.index.remove(99)
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.prefix('a'), [4])
+        self.assertEqual(self.index.contains('zet'), [2])
+        self.assertEqual(self.index.contains('supp'), [])
+        self.assertEqual(self.index.similar('zeta'), [2])
+
+
+    def test_skips_missing_names(self):
+        """ Suppliers without a string name match nothing """
+        index = NameIndex([(1, None), (2, 'Acme')])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.prefix('a'), [2])
+        self.assertEqual(index.contains('cme'), [2])
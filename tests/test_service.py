@@ -5,12 +5,19 @@ nosetests -v --with-spec --spec-color
 nosetests --stop tests/test_service.py:TestSupplierServer
 """
 
+import json
+import gzip
+import zlib
 import unittest
 import logging
+from unittest.mock import patch, MagicMock
 from flask_api import status
 from werkzeug.datastructures import MultiDict, ImmutableMultiDict
-from service.service import initialize_logging, app
+from service.service import initialize_logging, data_reset, admission_control, app, \
+    stream_changes, QUERY_PAGE_SIZE
+from service.changes import ChangeFeed
 from service.models import Supplier
+from service.resilience import CircuitOpenError
 from .suppliers_factory import SupplierFactory
 
 # Status Codes
@@ -21,6 +28,7 @@ HTTP_400_BAD_REQUEST = 400
 HTTP_404_NOT_FOUND = 404
 HTTP_405_METHOD_NOT_ALLOWED = 405
 HTTP_409_CONFLICT = 409
+HTTP_412_PRECONDITION_FAILED = 412
 HTTP_415_UNSUPPORTED_MEDIA_TYPE = 415
 
 ######################################################################
@@ -34,7 +42,7 @@ class TestService(unittest.TestCase):
         self.app = app.test_client()
         initialize_logging(logging.INFO)
         Supplier.init_db("test")
-        Supplier.remove_all()
+        data_reset()
 
 
     def _create_suppliers(self, count):
@@ -66,6 +74,71 @@ class TestService(unittest.TestCase):
         self.assertEqual(resp.status_code, HTTP_200_OK)
 
 
+    def test_metrics(self):
+        """ Report the state of the database guards """
+        self.app.get('/suppliers')
+        resp = self.app.get('/metrics')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.mimetype, 'text/plain')
+        metrics = dict(line.split(' ') for line in resp.get_data(as_text=True).splitlines())
+        self.assertGreaterEqual(int(metrics['db_concurrency_limit']), 1)
+        self.assertGreater(int(metrics['db_requests_total']), 0)
+        self.assertEqual(metrics['db_circuit_state'], '0')
+
+
+    def test_request_timeout(self):
+        """ A request out of time is a 504 """
+        resp = self.app.get('/suppliers', headers={'X-Request-Timeout': '0.000000001'})
+        self.assertEqual(resp.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        resp = self.app.get('/suppliers', headers={'X-Request-Timeout': 'soon'})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+
+
+    @patch('service.models.Supplier.find_by_name')
+    def test_database_overloaded(self, find_mock):
+        """ Requests refused by the database guards are a 503 with Retry-After """
+        find_mock.side_effect = CircuitOpenError('Database circuit is open', 4)
+        resp = self.app.get('/suppliers', query_string='name=supplier1')
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.headers['Retry-After'], '4')
+
+
+    def test_admission_control(self):
+        """ Expensive routes are shed first while cheap ones and the healthcheck are served """
+        with patch.object(admission_control, 'capacity', 2):
+            self.assertTrue(admission_control.admit('normal'))
+            try:
+                resp = self.app.get('/suppliers')
+                self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+                self.assertEqual(resp.headers['Retry-After'], '1')
+                resp = self.app.get('/suppliers/foo')
+                self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+                resp = self.app.get('/healthcheck')
+                self.assertEqual(resp.status_code, HTTP_200_OK)
+            finally:
+                admission_control.release('normal')
+        resp = self.app.get('/suppliers')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        metrics = dict(line.split(' ') for line in
+                       self.app.get('/metrics').get_data(as_text=True).splitlines())
+        self.assertEqual(metrics['http_in_flight'], '0')
+        self.assertGreaterEqual(int(metrics['http_shed_expensive_total']), 1)
+
+
+    def test_last_write_header(self):
+        """ Writes name themselves in X-Last-Write for reads that must see them """
+        test_supplier = SupplierFactory()
+        resp = self.app.post('/suppliers', json=test_supplier.serialize(),
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(resp.headers['X-Last-Write'], '{}@{}'.format(data['_id'], data['_rev']))
+        resp = self.app.get('/suppliers/{}'.format(data['_id']),
+                            headers={'X-Last-Write': resp.headers['X-Last-Write']})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertNotIn('X-Last-Write', resp.headers)
+
+
     def test_list_suppliers(self):
         """ Get a list of Suppliers """
         self._create_suppliers(10)
@@ -75,6 +148,20 @@ class TestService(unittest.TestCase):
         self.assertEqual(len(data), 10)
 
 
+    def test_list_suppliers_streamed(self):
+        """ Without a cache the Suppliers are streamed from the database in batches """
+        suppliers = self._create_suppliers(5)
+        with patch('service.models.ALL_DOCS_BATCH_SIZE', 2):
+            resp = self.app.get('/suppliers')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(sorted(supplier['_id'] for supplier in resp.get_json()),
+                         sorted(supplier.id for supplier in suppliers))
+        Supplier.remove_all()
+        resp = self.app.get('/suppliers')
+        self.assertEqual(resp.get_json(), [])
+
+
     def test_query_by_name(self):
         """ Query Suppliers by name """
         suppliers = self._create_suppliers(5)
@@ -134,6 +221,111 @@ class TestService(unittest.TestCase):
             self.assertGreater(supplier['rating'], rating_limit)
 
 
+    def test_query_by_rating_range(self):
+        """ Query Suppliers with a rating range """
+        suppliers = self._create_suppliers(10)
+        in_range = [supplier for supplier in suppliers if 5.6 <= supplier.rating <= 7.5]
+        resp = self.app.get("/suppliers", query_string="rating_min=5.6&rating_max=7.5")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data), len(in_range))
+        for supplier in data:
+            self.assertTrue(5.6 <= supplier['rating'] <= 7.5)
+
+
+    def test_query_by_like_range(self):
+        """ Query Suppliers with a like count range """
+        suppliers = self._create_suppliers(5)
+        like_max = suppliers[2].like_count
+        in_range = [supplier for supplier in suppliers if supplier.like_count <= like_max]
+        resp = self.app.get("/suppliers", query_string="like_max={}".format(like_max))
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data), len(in_range))
+        for supplier in data:
+            self.assertLessEqual(supplier['like_count'], like_max)
+
+
+    def test_query_by_name_prefix(self):
+        """ Query Suppliers by the start of their name """
+        for name in ["Acme Supply", "Acme Foods", "Global Acme"]:
+            resp = self.app.post("/suppliers", json=dict(SupplierFactory().serialize(), name=name),
+                                 content_type="application/json")
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        resp = self.app.get("/suppliers", query_string="name_prefix=Acme")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual([s['name'] for s in resp.get_json()], ["Acme Foods", "Acme Supply"])
+        resp = self.app.get("/suppliers", query_string="name_prefix=Acme&limit=1")
+        self.assertEqual([s['name'] for s in resp.get_json()], ["Acme Foods"])
+
+
+    def test_query_by_name_contains_and_like(self):
+        """ Query Suppliers by part of their name or a misspelled name """
+        for name in ["Acme Supply", "Acme Foods", "Global Parts"]:
+            resp = self.app.post("/suppliers", json=dict(SupplierFactory().serialize(), name=name),
+                                 content_type="application/json")
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        resp = self.app.get("/suppliers", query_string="name_contains=supp")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual([s['name'] for s in resp.get_json()], ["Acme Supply"])
+        resp = self.app.get("/suppliers", query_string="name_like=glbal parts")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual([s['name'] for s in resp.get_json()], ["Global Parts"])
+        # suppliers created after the index was built are found too
+        resp = self.app.post("/suppliers", json=dict(SupplierFactory().serialize(), name="Supply Co"),
+                             content_type="application/json")
+        resp = self.app.get("/suppliers", query_string="name_contains=supp")
+        self.assertEqual([s['name'] for s in resp.get_json()], ["Acme Supply", "Supply Co"])
+        resp = self.app.get("/suppliers", query_string="name_contains=supp&limit=0")
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
+    def test_query_by_partition_on_global_database(self):
+        """ Query Suppliers by partition when the database is not partitioned """
+        resp = self.app.get("/suppliers", query_string="partition=east")
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        resp = self.app.get("/suppliers", query_string="partition=_east")
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
+    def test_stream_changes(self):
+        """ Stream the changes to Suppliers since the start """
+        supplier = self._create_suppliers(1)[0]
+        with patch.dict(app.config, {'CHANGES_HEARTBEAT': 0.1}):
+            resp = self.app.get("/suppliers/changes", query_string="since=0")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "text/event-stream")
+        events = []
+        for chunk in resp.response:
+            chunk = chunk.decode("utf8") if isinstance(chunk, bytes) else chunk
+            if chunk.startswith(":"):
+                break
+            events.append(json.loads(chunk.split("data: ", 1)[1]))
+        resp.close()
+        changes = [event for event in events if event['id'] == supplier.id]
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0]['supplier']['name'], supplier.name)
+        self.assertFalse(changes[0]['deleted'])
+
+
+    def test_stream_changes_after_catch_up(self):
+        """ The live changes follow on from where the catch up ended """
+        feed = ChangeFeed(None, buffer_size=10)
+        feed.publish([('1-a', {'id': 'a'}), ('2-b', {'id': 'b'})], '2-b')
+        caught_up = ([('1-a', {'id': 'a'})], '1-a', 0)
+        with patch.object(Supplier, 'changes', return_value=caught_up) as changes:
+            events = list(stream_changes(feed, '0-z', heartbeat=0.01, duration=0.05))
+        changes.assert_called_once_with('0-z', limit=QUERY_PAGE_SIZE)
+        ids = [event.split('\n', 1)[0] for event in events if not event.startswith(':')]
+        self.assertEqual(ids, ['id: 1-a', 'id: 2-b'])
+
+
+    def test_query_by_bad_range(self):
+        """ Query Suppliers with a range that is not a number """
+        resp = self.app.get("/suppliers", query_string="rating_min=high")
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
     def test_query_by_product_id(self):
         """ Query Suppliers by product id """
         suppliers = self._create_suppliers(5)
@@ -148,6 +340,94 @@ class TestService(unittest.TestCase):
             self.assertIn(test_product_id, supplier['products'])
 
 
+    def test_query_by_ids(self):
+        """ Query Suppliers by a list of ids """
+        suppliers = self._create_suppliers(3)
+        ids = [suppliers[2].id, "0", suppliers[0].id]
+        resp = self.app.get("/suppliers", query_string="ids={}".format(",".join(ids)))
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([supplier['_id'] for supplier in data['suppliers']],
+                         [suppliers[2].id, suppliers[0].id])
+        self.assertEqual(data['missing'], ["0"])
+        self.assertNotIn('X-Missing-Ids', resp.headers)
+
+
+    def test_mget_suppliers(self):
+        """ Retrieve many Suppliers by id in one call """
+        suppliers = self._create_suppliers(3)
+        resp = self.app.post('/suppliers/_mget', json={'ids': [suppliers[1].id, "0"]},
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data['suppliers']), 1)
+        self.assertEqual(data['suppliers'][0]['_id'], suppliers[1].id)
+        self.assertEqual(data['suppliers'][0]['name'], suppliers[1].name)
+        self.assertEqual(data['missing'], ["0"])
+
+
+    def test_mget_suppliers_bad_data(self):
+        """ Retrieve many Suppliers without a list of ids """
+        resp = self.app.post('/suppliers/_mget', json={'ids': "0"},
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
+    def test_list_suppliers_compressed(self):
+        """ Get a compressed list of Suppliers """
+        self._create_suppliers(20)
+        resp = self.app.get('/suppliers', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers.get('Vary'))
+        data = json.loads(gzip.decompress(resp.data).decode('utf8'))
+        self.assertEqual(len(data), 20)
+        resp = self.app.get('/suppliers', headers={'Accept-Encoding': 'deflate'})
+        self.assertEqual(resp.headers.get('Content-Encoding'), 'deflate')
+        data = json.loads(zlib.decompress(resp.data).decode('utf8'))
+        self.assertEqual(len(data), 20)
+        # without Accept-Encoding the body is sent as is
+        resp = self.app.get('/suppliers')
+        self.assertIsNone(resp.headers.get('Content-Encoding'))
+        self.assertEqual(len(resp.get_json()), 20)
+
+
+    def test_small_response_not_compressed(self):
+        """ Responses under the size threshold are not compressed """
+        resp = self.app.get('/healthcheck', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertIsNone(resp.headers.get('Content-Encoding'))
+
+
+    def test_create_supplier_compressed_body(self):
+        """ Create a Supplier from a gzip compressed body """
+        new_supplier = SupplierFactory()
+        body = gzip.compress(json.dumps(new_supplier.serialize()).encode('utf8'))
+        resp = self.app.post('/suppliers', data=body, content_type='application/json',
+                             headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertEqual(resp.get_json()['name'], new_supplier.name)
+        resp = self.app.post('/suppliers', data=b'not gzip', content_type='application/json',
+                             headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        resp = self.app.post('/suppliers', data=body, content_type='application/json',
+                             headers={'Content-Encoding': 'compress'})
+        self.assertEqual(resp.status_code, HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+    def test_get_supplier_not_from_shared_index(self):
+        """ A Supplier read by id comes from the database, not the lagging shared index """
+        test_supplier = self._create_suppliers(1)[0]
+        stale = MagicMock()
+        stale.find.return_value = test_supplier
+        with patch('service.service.shared_index', stale):
+            resp = self.app.delete('/suppliers/{}'.format(test_supplier.id))
+            self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+            resp = self.app.get('/suppliers/{}'.format(test_supplier.id))
+            self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+        stale.find.assert_not_called()
+
+
     def test_get_supplier(self):
         """ get a single Supplier """
         test_supplier = self._create_suppliers(1)[0]
@@ -266,6 +546,45 @@ class TestService(unittest.TestCase):
         self.assertEqual(data['name'], 'supplier1')
 
 
+    def test_create_supplier_with_malformed_fields(self):
+        """ Create a Supplier with fields that cannot be converted """
+        new_supplier = SupplierFactory()
+        new_supplier.like_count = "many"
+        new_supplier.rating = "high"
+        resp = self.app.post('/suppliers', json=new_supplier.serialize(),
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        data = resp.get_json()
+        self.assertEqual([error['field'] for error in data['errors']], ['like_count', 'rating'])
+
+
+    def test_bulk_create_suppliers(self):
+        """ Create many Suppliers in one call """
+        new_suppliers = [SupplierFactory().serialize() for _ in range(5)]
+        new_suppliers[0]['products'] = "7,8"
+        resp = self.app.post('/suppliers/_bulk', json=new_suppliers,
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(len(data), 5)
+        self.assertTrue(all(supplier['_id'] for supplier in data))
+        self.assertEqual(data[0]['products'], [7, 8])
+        self.assertEqual(self.get_supplier_count(), 5)
+
+
+    def test_bulk_create_suppliers_bad_data(self):
+        """ Create many Suppliers when one of them is invalid """
+        new_suppliers = [SupplierFactory().serialize() for _ in range(3)]
+        new_suppliers[1]['like_count'] = "many"
+        resp = self.app.post('/suppliers/_bulk', json=new_suppliers,
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        data = resp.get_json()
+        self.assertEqual(data['errors'][0]['index'], 1)
+        self.assertEqual(data['errors'][0]['field'], 'like_count')
+        self.assertEqual(self.get_supplier_count(), 0)
+
+
     def test_create_supplier_with_no_name(self):
         """ Create a Supplier without a name """
         new_supplier = SupplierFactory()
@@ -335,6 +654,97 @@ class TestService(unittest.TestCase):
         self.assertEqual(data['name'], 'test_update')
 
 
+    def test_update_supplier_with_revision(self):
+        """ Update a Supplier at a given revision """
+        test_supplier = self._create_suppliers(1)[0]
+        resp = self.app.get('/suppliers/{}'.format(test_supplier.id))
+        etag = resp.headers.get('ETag')
+        self.assertIsNotNone(etag)
+        data = resp.get_json()
+        data['name'] = 'first_update'
+        resp = self.app.put('/suppliers/{}'.format(test_supplier.id), json=data,
+                            headers={'If-Match': etag}, content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertNotEqual(resp.headers.get('ETag'), etag)
+        # a second writer still holding the old revision is refused
+        data['name'] = 'second_update'
+        resp = self.app.put('/suppliers/{}'.format(test_supplier.id), json=data,
+                            headers={'If-Match': etag}, content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_412_PRECONDITION_FAILED)
+        # the revision can also be sent in the body
+        del data['_rev']
+        resp = self.app.put('/suppliers/{}'.format(test_supplier.id), json=dict(data, _rev=etag.strip('"')),
+                            content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.get('/suppliers/{}'.format(test_supplier.id))
+        self.assertEqual(resp.get_json()['name'], 'first_update')
+
+
+    def test_update_supplier_with_revision_not_found(self):
+        """ Update a Supplier that does not exist at a given revision """
+        new_supplier = SupplierFactory()
+        resp = self.app.put('/suppliers/0', json=new_supplier.serialize(),
+                            headers={'If-Match': '"1-4e5a9c8b"'}, content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+
+
+    def test_patch_supplier(self):
+        """ Change some fields of a Supplier """
+        test_supplier = self._create_suppliers(1)[0]
+        resp = self.app.patch('/suppliers/{}'.format(test_supplier.id),
+                              json={'rating': '9.5'}, content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data['rating'], 9.5)
+        self.assertEqual(data['name'], test_supplier.name)
+        self.assertEqual(data['products'], test_supplier.products)
+        self.assertEqual(resp.headers['ETag'], '"{}"'.format(data['_rev']))
+        # a stale revision is refused
+        resp = self.app.patch('/suppliers/{}'.format(test_supplier.id), json={'rating': 1.0},
+                              headers={'If-Match': '"{}"'.format(test_supplier.rev)},
+                              content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_412_PRECONDITION_FAILED)
+        resp = self.app.patch('/suppliers/{}'.format(test_supplier.id),
+                              json={'rating': 1.0, '_rev': data['_rev']},
+                              content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        resp = self.app.get('/suppliers/{}'.format(test_supplier.id))
+        self.assertEqual(resp.get_json()['rating'], 1.0)
+
+
+    def test_patch_supplier_bad_request(self):
+        """ Change a Supplier that does not exist or with bad fields """
+        resp = self.app.patch('/suppliers/0', json={'rating': 1.0},
+                              content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_404_NOT_FOUND)
+        test_supplier = self._create_suppliers(1)[0]
+        for body in ({}, {'rating': 'x'}, {'is_active': 'maybe', 'products': 'a'}):
+            resp = self.app.patch('/suppliers/{}'.format(test_supplier.id), json=body,
+                                  content_type='application/json')
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
+    def test_mutators_read_the_primary(self):
+        """ Updates, likes and deletes work while the replica lags behind """
+        test_supplier = self._create_suppliers(1)[0]
+        lagging = MagicMock(database_url=Supplier.client.server_url + '/lagging-replica',
+                            database_name='lagging-replica')
+        lagging.client.server_url = Supplier.client.server_url
+        with patch.object(Supplier, 'read_database', lagging):
+            # the replica has not seen the supplier yet
+            self.assertIsNone(Supplier.find(test_supplier.id))
+            test_supplier.name = 'lagging_update'
+            resp = self.app.put('/suppliers/{}'.format(test_supplier.id),
+                                json=test_supplier.serialize(), content_type='application/json')
+            self.assertEqual(resp.status_code, HTTP_200_OK)
+            resp = self.app.put('/suppliers/{}/like'.format(test_supplier.id))
+            self.assertEqual(resp.status_code, HTTP_200_OK)
+            self.assertEqual(resp.get_json()['name'], 'lagging_update')
+            resp = self.app.delete('/suppliers/{}'.format(test_supplier.id))
+            self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(Supplier.find(test_supplier.id))
+
+
     def test_update_supplier_with_no_name(self):
         """ Update a Supplier without assigning a name """
         test_supplier = self._create_suppliers(1)[0]
@@ -474,6 +884,40 @@ class TestService(unittest.TestCase):
 
 
 
+    def test_recommend_suppliers_batch(self):
+        """ Recommend the top k suppliers for many products """
+        for name, products, rating, is_active in [("best", "1,2", "9.5", "true"),
+                                                  ("good", "1,3", "8.0", "true"),
+                                                  ("inactive", "1,2,3", "10.0", "false")]:
+            new_supplier = SupplierFactory()
+            new_supplier.name = name
+            new_supplier.products = products
+            new_supplier.rating = rating
+            new_supplier.is_active = is_active
+            resp = self.app.post('/suppliers', json=new_supplier.serialize(),
+                                 content_type='application/json')
+            self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        resp = self.app.post('/suppliers/recommend', json={'products': [1, 3, 9], 'k': 2},
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([item['product_id'] for item in data], [1, 3, 9])
+        self.assertEqual([s['name'] for s in data[0]['suppliers']], ['best', 'good'])
+        self.assertEqual([s['name'] for s in data[1]['suppliers']], ['good'])
+        self.assertEqual(data[2]['suppliers'], [])
+
+    def test_recommend_suppliers_batch_bad_data(self):
+        """ Recommend suppliers with bad products or k """
+        resp = self.app.post('/suppliers/recommend', json={'products': ['a']},
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        resp = self.app.post('/suppliers/recommend', json={'products': [1], 'k': 0},
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        resp = self.app.post('/suppliers/recommend', json=[1, 2],
+                             content_type='application/json')
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
 
 
 ######################################################################
@@ -0,0 +1,125 @@
+"""
+Shared Index Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_shared_index.py:TestSharedIndex
+"""
+
+import os
+import fcntl
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from service import shared_index
+from service.shared_index import SharedIndex, Segment, SegmentError
+from service.models import Supplier
+
+DATABASE = 'http://localhost:5984/test'
+
+
+def document(supplier_id, name, is_active, products, rating):
+    """ Returns a stored Supplier document """
+    return {'_id': supplier_id, '_rev': '1-a', 'name': name, 'like_count': 0,
+            'is_active': is_active, 'products': products, 'rating': rating}
+
+
+DOCUMENTS = [
+    document('a', 'supplier1', True, [1, 2, 3], 8.5),
+    document('b', 'supplier2', False, [1, 3, 5, 7], 9.5),
+    document('c', 'supplier3', True, [1, 3, 5], 8.5),
+    document('d', 'supplier4', True, [1, 2, 5], 4.5),
+    document('e', 'supplier5', True, [5], ''),
+]
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+@patch.object(Supplier, 'database', MagicMock(database_url=DATABASE))
+class TestSharedIndex(TestCase):
+    """ Test Cases for the index shared by the workers """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'suppliers.idx')
+        self.index = SharedIndex(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_no_segment(self):
+        """ Without a segment every lookup says so """
+        self.assertIsNone(self.index.segment())
+        self.assertIsNone(self.index.suppliers())
+        self.assertIsNone(self.index.with_product(1))
+        self.assertIsNone(self.index.recommend([1]))
+
+    def test_documents(self):
+        """ Read every Supplier in id order """
+        shared_index.write(self.path, '12-abc', DATABASE, DOCUMENTS)
+        segment = self.index.segment()
+        self.assertEqual(segment.seq, '12-abc')
+        self.assertEqual(segment.database, DATABASE)
+        self.assertEqual(list(segment.documents()), DOCUMENTS)
+        self.assertEqual([s.name for s in self.index.suppliers()],
+                         [d['name'] for d in DOCUMENTS])
+
+    def test_products(self):
+        """ Find the Suppliers of a product and recommend the best active ones """
+        shared_index.write(self.path, 1, DATABASE, DOCUMENTS)
+        self.assertEqual([s.id for s in self.index.with_product(5)], ['b', 'c', 'd', 'e'])
+        self.assertEqual(self.index.with_product(4), [])
+        recommendations = self.index.recommend([1, 5, 7, 9], 2)
+        self.assertEqual([s.name for s in recommendations[1]], ['supplier1', 'supplier3'])
+        self.assertEqual([s.name for s in recommendations[5]], ['supplier3', 'supplier4'])
+        self.assertEqual(recommendations[7], [])
+        self.assertEqual(recommendations[9], [])
+        self.assertEqual([s.id for s in self.index.recommend([5], 5)[5]], ['c', 'd', 'e'])
+
+    def test_new_segment(self):
+        """ Readers map a new segment once it replaces the old one """
+        shared_index.write(self.path, 1, DATABASE, DOCUMENTS[:1])
+        old = self.index.segment()
+        shared_index.write(self.path, 2, DATABASE, DOCUMENTS)
+        self.assertEqual(self.index.segment().seq, 2)
+        self.assertEqual(len(self.index.suppliers()), len(DOCUMENTS))
+        # a reader halfway through a lookup keeps the segment it started with
+        self.assertEqual(old.seq, 1)
+        self.assertEqual(list(old.documents()), DOCUMENTS[:1])
+
+    def test_other_database(self):
+        """ A segment of another database is not served """
+        shared_index.write(self.path, 1, 'http://localhost:5984/other', DOCUMENTS)
+        self.assertIsNone(self.index.segment())
+        self.assertIsNone(self.index.suppliers())
+        shared_index.write(self.path, 2, DATABASE, DOCUMENTS)
+        self.assertEqual(self.index.segment().seq, 2)
+
+    def test_bad_segment(self):
+        """ Truncated or foreign segments are refused """
+        data = shared_index.dumps(1, DATABASE, DOCUMENTS)
+        self.assertRaises(SegmentError, Segment, b'NOTINDEX' + data[8:])
+        self.assertRaises(SegmentError, Segment, data[:len(data) // 2])
+        with open(self.path, 'wb') as segment:
+            segment.write(data[:len(data) // 2])
+        self.assertIsNone(self.index.segment())
+
+    def test_update(self):
+        """ A segment is only written when the cache moved on """
+        cache = MagicMock()
+        cache.current.return_value = (3, [Supplier().deserialize(d) for d in DOCUMENTS])
+        self.assertEqual(self.index.update(cache), 3)
+        self.assertEqual(self.index.segment().seq, 3)
+        with patch('service.shared_index.write') as write_mock:
+            self.assertEqual(self.index.update(cache, 3), 3)
+            write_mock.assert_not_called()
+
+    def test_one_updater(self):
+        """ A worker does not update while another holds the lock """
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            with patch('time.sleep', side_effect=[None, StopIteration]), \
+                    patch('service.shared_index.SupplierCache') as cache_mock:
+                self.assertRaises(StopIteration, self.index._run, 1)
+                cache_mock.assert_not_called()
@@ -0,0 +1,64 @@
+"""
+Snapshot Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_snapshot.py:TestSnapshot
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from service import snapshot
+
+DOCUMENTS = [
+    {'_id': 'a1', '_rev': '1-x', 'name': 'Acme', 'like_count': 3, 'is_active': True,
+     'products': [5, 1, 2 ** 40], 'rating': 7.5},
+    {'_id': 'east:b2', '_rev': '2-y', 'name': 'Bolt é', 'like_count': '', 'is_active': None,
+     'products': [1, '2'], 'rating': ''},
+    {'_id': 'c3', '_rev': None, 'name': 'Core', 'like_count': None, 'is_active': False,
+     'products': [], 'rating': 2 ** 70},
+]
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestSnapshot(TestCase):
+    """ Test Cases for the binary snapshot format """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'suppliers.snapshot')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_round_trip(self):
+        """ Encode and decode every kind of value """
+        data = snapshot.dumps('12-abc', 'http://localhost:5984/test', DOCUMENTS)
+        seq, database, documents = snapshot.loads(data)
+        self.assertEqual(seq, '12-abc')
+        self.assertEqual(database, 'http://localhost:5984/test')
+        self.assertEqual(documents, DOCUMENTS)
+
+
+    def test_write_and_read(self):
+        """ Write a snapshot file and read it through a memory map """
+        snapshot.write(self.path, 7, 'db', DOCUMENTS)
+        self.assertEqual(snapshot.read(self.path), (7, 'db', DOCUMENTS))
+        snapshot.write(self.path, 8, 'db', DOCUMENTS[:1])
+        self.assertEqual(snapshot.read(self.path), (8, 'db', DOCUMENTS[:1]))
+        self.assertEqual(os.listdir(self.directory), ['suppliers.snapshot'])
+
+
+    def test_bad_snapshots(self):
+        """ Missing, empty, truncated and foreign files are rejected """
+        self.assertRaises(snapshot.SnapshotError, snapshot.read, self.path)
+        open(self.path, 'wb').close()
+        self.assertRaises(snapshot.SnapshotError, snapshot.read, self.path)
+        data = snapshot.dumps(1, 'db', DOCUMENTS)
+        self.assertRaises(snapshot.SnapshotError, snapshot.loads, data[:-3])
+        self.assertRaises(snapshot.SnapshotError, snapshot.loads, b'NOTASNAP' + data[8:])
@@ -0,0 +1,92 @@
+"""
+Supplier Validation Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_validation.py:TestValidation
+"""
+
+from unittest import TestCase
+from service.models import DataValidationError
+from service.validation import validate, validate_many, validate_partial
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestValidation(TestCase):
+    """ Test Cases for Supplier payload validation """
+
+    def setUp(self):
+        self.data = {"name": "supplier1", "like_count": 2, "is_active": True,
+                     "products": [1, 2, 3], "rating": 8.5}
+
+
+    def test_valid_supplier(self):
+        """ Validate a well formed Supplier """
+        self.assertEqual(validate(self.data), self.data)
+
+
+    def test_coerce_strings(self):
+        """ Validate a Supplier sent as strings """
+        data = {"name": "supplier1", "like_count": "15", "is_active": "true",
+                "products": "1,2,3,4", "rating": "6.6", "_rev": "1-abc"}
+        self.assertEqual(validate(data), {"name": "supplier1", "like_count": 15, "is_active": True,
+                                          "products": [1, 2, 3, 4], "rating": 6.6, "_rev": "1-abc"})
+
+
+    def test_blank_strings(self):
+        """ Blank optional values are kept and unknown booleans are false """
+        data = {"name": "supplier1", "like_count": "", "is_active": "james",
+                "products": "", "rating": ""}
+        self.assertEqual(validate(data), {"name": "supplier1", "like_count": "", "is_active": False,
+                                          "products": [], "rating": ""})
+
+
+    def test_all_errors_reported(self):
+        """ Every bad field is reported at once """
+        data = {"name": None, "like_count": "many", "is_active": True,
+                "products": "1,x", "rating": "high"}
+        with self.assertRaises(DataValidationError) as context:
+            validate(data)
+        fields = [error['field'] for error in context.exception.errors]
+        self.assertEqual(fields, ['name', 'like_count', 'products', 'rating'])
+
+
+    def test_missing_fields(self):
+        """ Missing fields are reported """
+        with self.assertRaises(DataValidationError) as context:
+            validate({"name": "supplier1"})
+        fields = [error['field'] for error in context.exception.errors]
+        self.assertEqual(fields, ['like_count', 'is_active', 'products', 'rating'])
+        self.assertIn('missing like_count', str(context.exception))
+
+
+    def test_not_a_dictionary(self):
+        """ A payload that is not an object is rejected """
+        self.assertRaises(DataValidationError, validate, None)
+        self.assertRaises(DataValidationError, validate, "string data")
+        self.assertRaises(DataValidationError, validate, [self.data])
+
+
+    def test_validate_many(self):
+        """ Validate a batch of Suppliers, reporting errors by index """
+        results = validate_many([self.data, dict(self.data, like_count="7")])
+        self.assertEqual(results[1]['like_count'], 7)
+        with self.assertRaises(DataValidationError) as context:
+            validate_many([self.data, dict(self.data, like_count="x"), "bad"])
+        self.assertEqual([(e['index'], e['field']) for e in context.exception.errors],
+                         [(1, 'like_count'), (2, None)])
+        self.assertRaises(DataValidationError, validate_many, self.data)
+
+
+    def test_validate_partial(self):
+        """ Validate the fields of a partial update, none of them required """
+        self.assertEqual(validate_partial({"rating": "9.5"}), {"rating": 9.5})
+        self.assertEqual(validate_partial({"products": "1,2", "_rev": "1-a", "extra": 1}),
+                         {"products": [1, 2], "_rev": "1-a"})
+        with self.assertRaises(DataValidationError) as context:
+            validate_partial({"like_count": "x", "name": 5})
+        self.assertEqual([e['field'] for e in context.exception.errors], ['name', 'like_count'])
+        self.assertRaises(DataValidationError, validate_partial, {})
+        self.assertRaises(DataValidationError, validate_partial, {"_rev": "1-a"})
+        self.assertRaises(DataValidationError, validate_partial, None)
@@ -0,0 +1,65 @@
+"""
+Write-Behind Queue Test Suite
+Test cases can be run with the following:
+nosetests -v --with-spec --spec-color
+nosetests --stop tests/test_write_behind.py:TestWriteBehindQueue
+"""
+
+import threading
+from unittest import TestCase
+from service.write_behind import WriteBehindQueue
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestWriteBehindQueue(TestCase):
+    """ Test Cases for the group commit queue """
+
+    def setUp(self):
+        self.batches = []
+
+    def flush(self, documents):
+        """ Pretends to be _bulk_docs """
+        self.batches.append(len(documents))
+        return [{'ok': True, 'id': doc['name'], 'rev': '1-a'} for doc in documents]
+
+
+    def test_concurrent_writes_are_grouped(self):
+        """ Concurrent writes share bulk requests but get their own results """
+        queue = WriteBehindQueue(self.flush, window=0.05, max_docs=10)
+        results = {}
+
+        def writer(number):
+            results[number] = queue.write({'name': str(number)})
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue.close()
+        self.assertEqual(sum(self.batches), 30)
+        self.assertLess(len(self.batches), 30)
+        self.assertTrue(all(size <= 10 for size in self.batches))
+        for number in range(30):
+            self.assertEqual(results[number]['id'], str(number))
+
+
+    def test_flush_error_reaches_every_writer(self):
+        """ A failed bulk request is raised to each writer in the batch """
+        def broken_flush(documents):
+            raise IOError('database went away')
+        queue = WriteBehindQueue(broken_flush, window=0.01)
+        future = queue.submit({'name': 'supplier1'})
+        self.assertRaises(IOError, future.result, 5)
+        queue.close()
+
+
+    def test_close_flushes_pending_writes(self):
+        """ Closing the queue stores what is still queued """
+        queue = WriteBehindQueue(self.flush, window=10)
+        future = queue.submit({'name': 'supplier1'})
+        queue.close()
+        self.assertEqual(future.result(0)['id'], 'supplier1')
+        self.assertRaises(RuntimeError, queue.submit, {'name': 'supplier2'})